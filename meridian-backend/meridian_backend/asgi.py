@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meridian_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from restaurant.consumers import order_events  # noqa: E402
+
+WEBSOCKET_ROUTES = {
+    '/ws/orders/': order_events,
+}
+
+
+async def application(scope, receive, send):
+    """Serve WebSocket streams ourselves and hand everything else to Django"""
+    if scope['type'] == 'websocket':
+        handler = WEBSOCKET_ROUTES.get(scope['path'])
+        if handler is None:
+            await receive()
+            await send({'type': 'websocket.close'})
+            return
+        return await handler(scope, receive, send)
+
+    return await django_application(scope, receive, send)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 import os
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'restaurant.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +76,9 @@ CSRF_TRUSTED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Checkout requests carry a client key so retries cannot charge twice
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -106,15 +112,88 @@ WSGI_APPLICATION = 'meridian_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Applied to every new SQLite connection; see `manage.py bench_write_contention`
+SQLITE_PRAGMAS = {
+    # Readers no longer block the writer, nor the writer the readers
+    'journal_mode': 'WAL',
+    # Wait up to 5 s for the write lock instead of raising "database is locked"
+    'busy_timeout': 5000,
+    # Under WAL, NORMAL syncs at checkpoints only; still safe against corruption
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB: a 64 MiB page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'meridian_db.sqlite3',
+        # Reuse connections, and their pragmas, across requests
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Transactions take the write lock when they begin, so one that
+            # reads before writing waits its turn instead of failing
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(
+                f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    }
+}
+
+# A second alias for the same file, so replica routing can be tried locally
+# by listing it in DATABASE_REPLICAS. In production point it at a real
+# replica of the primary. Tests run it as a mirror of the test database.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    # Only read from, so its transactions need not take the write lock
+    'OPTIONS': {'init_command': DATABASES['default']['OPTIONS']['init_command']},
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['restaurant.routers.ReplicaRouter']
+
+# Aliases that serve safe reads from the API views; empty reads from default
+DATABASE_REPLICAS = []
+
+# Seconds a client reads from the primary after writing: the replica lag tolerated
+REPLICA_STALENESS = 5
+
+# Finished orders older than this many days move to the archive tables
+# when `manage.py archive_orders` runs
+ARCHIVE_AFTER_DAYS = 90
+
+# Seconds between reconciles of the in-memory kitchen board with the
+# database; the staleness of a board when several workers write orders
+KITCHEN_BOARD_RECONCILE_SECONDS = 30
+
+# Cache
+# Menu snapshots are invalidated through a version key in this cache, and
+# signed-in users are read from it. Use a shared backend (Redis or
+# Memcached) when running more than one worker process, so every worker
+# sees the same version and the same revocations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
 AUTH_USER_MODEL = 'restaurant.User'
 
+# Sessions are read from the database, so a logout ends them in every
+# worker. With a shared cache above, switch to the cached_db engine to read
+# them from the cache instead; a check rejects it on a per-process cache.
+# Signed-in users are cached either way; see restaurant.auth
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+AUTHENTICATION_BACKENDS = ['restaurant.auth.CachedModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 300
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -150,6 +229,35 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# How /media/ and /static/ files reach clients when DEBUG is off: None streams
+# them from Django; 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache,
+# lighttpd) lets the front proxy send them after Django set the headers
+FILE_OFFLOAD = None
+
+# nginx `internal` locations aliasing MEDIA_ROOT and STATIC_ROOT, for
+# X-Accel-Redirect; enable gzip_static there to keep precompressed files
+FILE_OFFLOAD_LOCATIONS = {'media': '/internal/media/', 'static': '/internal/static/'}
+
+# Widths of the resized menu images
+MENU_IMAGE_WIDTHS = (160, 320, 640, 1280)
+
+# Columns of the thermal printer receipts; 42 fits 80 mm paper, 32 fits 58 mm
+RECEIPT_WIDTH = 42
+
+# Background tasks, run by `manage.py run_tasks`; see restaurant.tasks.
+# Failed tasks retry after TASK_RETRY_DELAY seconds, doubling per attempt up
+# to TASK_RETRY_MAX_DELAY, and tasks running longer than TASK_TIMEOUT are
+# assumed lost with their worker and queued again. TASK_CONCURRENCY caps the
+# tasks of one name that a worker runs at once, over the task's own default.
+TASKS_SYNC = False
+TASK_RETRY_DELAY = 5
+TASK_RETRY_MAX_DELAY = 600
+TASK_TIMEOUT = 300
+TASK_CONCURRENCY = {
+    'restaurant.images.build_variants': 2,
+}
@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
+from restaurant.files import serve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,9 +29,16 @@ if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# FORCE logic for DEBUG=False (For local testing only!)
+# Production: cache headers, ranges and precompressed files, optionally
+# handing the transfer to the front proxy (see restaurant.files)
 else:
     urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-        re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT}),
+        re_path(r'^media/(?P<path>.*)$', serve, {
+            'document_root': settings.MEDIA_ROOT,
+            'accel_location': settings.FILE_OFFLOAD_LOCATIONS.get('media'),
+        }),
+        re_path(r'^static/(?P<path>.*)$', serve, {
+            'document_root': settings.STATIC_ROOT,
+            'accel_location': settings.FILE_OFFLOAD_LOCATIONS.get('static'),
+        }),
     ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, MenuItem, Order, OrderItem, Transaction
+from .models import User, MenuItem, Order, OrderItem, Transaction, Task
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -26,4 +26,9 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['id', 'order', 'payment_method', 'amount', 'cashier', 'created_at']
-    list_filter = ['payment_method', 'created_at']
\ No newline at end of file
+    list_filter = ['payment_method', 'created_at']
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['status', 'name']
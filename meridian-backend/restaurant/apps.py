@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RestaurantConfig(AppConfig):
     name = 'restaurant'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,117 @@
+"""
+Hot/cold archival of finished orders.
+
+Completed and cancelled orders older than the ARCHIVE_AFTER_DAYS setting
+move, with their items and transaction, into the Archived* tables. The hot
+tables behind the dashboards and checkout then only hold recent and open
+orders. Reporting rebuilds and transaction history read both tiers.
+
+Every batch copies its rows and deletes the originals in one transaction,
+and batches are picked by status and age alone, so an interrupted run
+loses nothing and the next one carries on where it stopped. The deletes
+run with the order signal receivers muted (see `archiving`): archiving is
+not a refund, so the sales rollups and live order events are left alone.
+Delta sync clients get tombstones, as for deleted orders.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sync
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedTransaction, Order, OrderItem,
+    OrderTombstone, Transaction,
+)
+
+FINISHED = ('completed', 'cancelled')
+
+
+def cutoff(days=None):
+    """Orders created before this moment are old enough to archive"""
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def eligible(before):
+    return Order.objects.filter(status__in=FINISHED, created_at__lt=before)
+
+
+def _copies(rows, model, archive_model):
+    names = (
+        {field.attname for field in model._meta.concrete_fields}
+        & {field.attname for field in archive_model._meta.concrete_fields}
+    )
+    return [archive_model(**{name: getattr(row, name) for name in names}) for row in rows]
+
+
+_archiving = ContextVar('archiving', default=False)
+
+
+def archiving():
+    """True while this thread deletes archived rows; delete receivers do nothing"""
+    return _archiving.get()
+
+
+@contextmanager
+def _muted_signals():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def archive_batch(before, batch_size=500):
+    """Move up to `batch_size` of the oldest eligible orders. Returns how many moved."""
+    with transaction.atomic():
+        orders = list(
+            eligible(before).order_by('created_at', 'id').select_for_update()[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order.pk for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids)
+        payments = Transaction.objects.filter(order_id__in=order_ids)
+
+        ArchivedOrder.objects.bulk_create(_copies(orders, Order, ArchivedOrder))
+        ArchivedOrderItem.objects.bulk_create(_copies(items, OrderItem, ArchivedOrderItem))
+        ArchivedTransaction.objects.bulk_create(_copies(payments, Transaction, ArchivedTransaction))
+
+        # The cascade removes the items and the payment of each order
+        with _muted_signals():
+            Order.objects.filter(pk__in=order_ids).delete()
+        OrderTombstone.objects.bulk_create([
+            OrderTombstone(order_id=order.pk, waiter_id=order.waiter_id) for order in orders
+        ])
+
+    return len(orders)
+
+
+def archive(before, batch_size=500, pause=0, max_batches=None, progress=None):
+    """
+    Archive eligible orders created before `before`, batch by batch.
+
+    Sleeps `pause` seconds between batches so other writers get the
+    database, and stops after `max_batches` when given. `progress` is called
+    with the running total after each batch. Returns the number moved.
+    """
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(before, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+        if progress:
+            progress(moved)
+        if pause:
+            time.sleep(pause)
+
+    sync.prune_tombstones()
+    return moved
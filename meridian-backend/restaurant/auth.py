@@ -0,0 +1,58 @@
+"""
+Session authentication without database reads on the hot path.
+
+CachedModelBackend keeps the users behind sessions in the cache, role
+included, so a dashboard poll is identified, and its role checked, without
+reading the user. With a shared cache, the cached_db session engine saves
+the session read as well; sessions only fall back to the database on a
+miss. The default per-process cache keeps the db engine instead, since a
+logout could only clear the cached session in the worker that served it
+(see restaurant.checks).
+
+Revocation:
+
+- Logging out deletes the session from the database, and from the cache
+  when sessions are cached, so no worker accepts it afterwards.
+- Saving a user drops their cached copy once the transaction commits, so a
+  deactivation or a new password takes effect on the next request in that
+  worker.
+- The session hash signs the role along with the password (see
+  User.get_session_auth_hash), so a role change in UserViewSet or the
+  admin signs the user out of every session.
+
+With a per-process cache, other workers keep a saved user's old copy for up
+to AUTH_USER_CACHE_TIMEOUT seconds. Use a shared cache in production.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_CACHE_ALIAS', 'default')]
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop a cached user once the current transaction commits"""
+    transaction.on_commit(lambda: _cache().delete(user_key(user_id)))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that loads session users from the cache"""
+
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        user = _cache().get(key)
+        if user is None:
+            try:
+                user = get_user_model()._default_manager.get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                return None
+            _cache().set(key, user, timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,237 @@
+"""
+Live board of the open orders, held in memory.
+
+Kitchen and floor screens read the pending orders and their items from an
+index kept in this process instead of querying Order with its items on
+every refresh. The index groups orders by table, waiter and menu category,
+so a filtered read only touches the orders it returns.
+
+The index is filled from the database on the first read and kept current
+by the order write paths: saving or deleting an order or an order item
+re-reads that one order once the transaction commits. Payments reach the
+board through the order status change made by checkout.
+
+Writes made by other processes, and bulk updates that bypass signals, are
+picked up by a reconcile against the database, which a read triggers once
+the last one is KITCHEN_BOARD_RECONCILE_SECONDS old. That interval bounds
+how stale a board served by several workers can be.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUS = 'pending'
+
+
+def load_entries(order_ids=None):
+    """Read open orders with their items as board entries, {order id: entry}"""
+    from .models import Order, OrderItem
+
+    items = OrderItem.objects.select_related('menu_item').only(
+        'order', 'menu_item', 'quantity', 'special_instructions',
+        'menu_item__name', 'menu_item__category',
+    ).order_by('pk')
+    orders = Order.objects.filter(status=OPEN_STATUS).only(
+        'table_number', 'waiter', 'status', 'notes', 'created_at',
+    ).order_by('created_at', 'pk').prefetch_related(Prefetch('items', queryset=items))
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+
+    return {
+        order.pk: {
+            'id': order.pk,
+            'table_number': order.table_number,
+            'waiter': order.waiter_id,
+            'status': order.status,
+            'notes': order.notes,
+            'created_at': order.created_at.isoformat(),
+            'items': [
+                {
+                    'id': item.pk,
+                    'menu_item': item.menu_item_id,
+                    'name': item.menu_item.name,
+                    'category': item.menu_item.category,
+                    'quantity': item.quantity,
+                    'special_instructions': item.special_instructions,
+                }
+                for item in order.items.all()
+            ],
+        }
+        for order in orders
+    }
+
+
+class BoardIndex:
+    """Board entries by id with their groupings; callers hold the board's lock"""
+
+    def __init__(self):
+        self.orders = {}
+        self.by_table = defaultdict(set)
+        self.by_waiter = defaultdict(set)
+        self.by_category = defaultdict(set)
+
+    def groups(self, entry):
+        yield self.by_table, entry['table_number']
+        yield self.by_waiter, entry['waiter']
+        for category in {item['category'] for item in entry['items']}:
+            yield self.by_category, category
+
+    def add(self, entry):
+        self.discard(entry['id'])
+        self.orders[entry['id']] = entry
+        for group, key in self.groups(entry):
+            group[key].add(entry['id'])
+
+    def discard(self, order_id):
+        entry = self.orders.pop(order_id, None)
+        if entry is None:
+            return
+        for group, key in self.groups(entry):
+            members = group[key]
+            members.discard(order_id)
+            if not members:
+                del group[key]
+
+    def select(self, table_number=None, waiter=None, category=None):
+        """Entries in every requested group, intersecting the smallest sets"""
+        wanted = [
+            group.get(key, set())
+            for group, key in (
+                (self.by_table, table_number), (self.by_waiter, waiter), (self.by_category, category),
+            )
+            if key is not None
+        ]
+        if not wanted:
+            return list(self.orders.values())
+        ids = set.intersection(*sorted(wanted, key=len))
+        return [self.orders[order_id] for order_id in ids]
+
+
+class KitchenBoard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+        self._index = None
+        # Monotonic time of each write-path update since the last reconcile
+        self._applied = {}
+        self._reconciled = None
+        self.reconciled_at = None
+
+    @property
+    def loaded(self):
+        return self._index is not None
+
+    def apply(self, order_id, entry):
+        """Put an order's entry on the board, or take it off when `entry` is None"""
+        with self._lock:
+            if self._index is None:
+                return
+            if entry is None:
+                self._index.discard(order_id)
+            else:
+                self._index.add(entry)
+            self._applied[order_id] = time.monotonic()
+
+    def refresh(self, order_id):
+        """Re-read one order from the database"""
+        if not self.loaded:
+            # The first read loads everything; there is nothing to keep current
+            return
+        self.apply(order_id, load_entries([order_id]).get(order_id))
+
+    def reconcile(self):
+        """
+        Rebuild the index from the database; returns how many orders differed.
+
+        Orders updated by a write path while the query ran keep their live
+        entry, since it is newer than what the query saw.
+        """
+        started = time.monotonic()
+        index = BoardIndex()
+        for entry in load_entries().values():
+            index.add(entry)
+
+        with self._lock:
+            current = self._index
+            for order_id, applied in self._applied.items():
+                if applied >= started:
+                    index.discard(order_id)
+                    if current is not None and order_id in current.orders:
+                        index.add(current.orders[order_id])
+            drift = 0
+            if current is not None:
+                drift = sum(
+                    1 for order_id in current.orders.keys() | index.orders.keys()
+                    if current.orders.get(order_id) != index.orders.get(order_id)
+                )
+            self._index = index
+            self._applied = {}
+            self._reconciled = time.monotonic()
+            self.reconciled_at = timezone.now()
+
+        if drift:
+            logger.info("Kitchen board reconciled %d order(s) with the database", drift)
+        return drift
+
+    def ensure_current(self):
+        interval = getattr(settings, 'KITCHEN_BOARD_RECONCILE_SECONDS', 30)
+        if self._reconciled is not None and time.monotonic() - self._reconciled < interval:
+            return
+        with self._reconcile_lock:
+            # Another thread may have reconciled while this one waited
+            if self._reconciled is None or time.monotonic() - self._reconciled >= interval:
+                self.reconcile()
+
+    def read(self, table_number=None, waiter=None, category=None):
+        """
+        Open orders in the requested groups, oldest first.
+
+        With a category only the items of that category are returned, which
+        is what a kitchen station works from.
+        """
+        self.ensure_current()
+        with self._lock:
+            entries = self._index.select(table_number, waiter, category)
+
+        entries.sort(key=lambda entry: (entry['created_at'], entry['id']))
+        if category is not None:
+            entries = [
+                {**entry, 'items': [item for item in entry['items'] if item['category'] == category]}
+                for entry in entries
+            ]
+        return entries
+
+    def reset(self):
+        """Forget everything; the next read loads the board again"""
+        with self._lock:
+            self._index = None
+            self._applied = {}
+            self._reconciled = None
+            self.reconciled_at = None
+
+
+_board = KitchenBoard()
+
+
+def get_board():
+    return _board
+
+
+def refresh_on_commit(order_id):
+    """Bring an order's entry up to date once the current transaction commits"""
+    def refresh():
+        try:
+            get_board().refresh(order_id)
+        except Exception:
+            # The next reconcile repairs the entry
+            logger.exception("Failed to refresh order %s on the kitchen board", order_id)
+
+    transaction.on_commit(refresh)
@@ -0,0 +1,287 @@
+"""
+Per-endpoint query and latency budgets.
+
+Every route in restaurant/urls.py has at least one scenario here. `run`
+calls each scenario against seeded data and records the query count, the
+time spent in SQL and the wall time. `check` compares the results with the
+checked-in baseline in perf_budgets.json. Regenerate the baseline with
+`manage.py bench_endpoints --write-baseline` when a change is intended.
+"""
+import json
+import math
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import board, sync
+from .models import Order
+from .seed import seed
+
+BASELINE_PATH = Path(__file__).with_name('perf_budgets.json')
+
+# Budgets hold for this data set only; some query counts depend on the data
+SEED = {'orders': 1000, 'menu_items': 120, 'prefix': 'budget', 'random_seed': 12}
+
+# Recorded timings are multiplied by this when a baseline is written, and
+# no time budget is set below the floor, so budgets absorb normal noise
+TIME_HEADROOM = 3.0
+TIME_FLOOR_MS = 25
+
+
+def _nothing(data, run):
+    return {}
+
+
+@dataclass
+class Endpoint:
+    """
+    One request to measure.
+
+    `route` is the URL name. `args`, `params` and `body` are callables taking
+    the seeded Dataset and the run number and returning the URL arguments,
+    query parameters and request body. `role` picks the logged-in user.
+    """
+    name: str
+    route: str
+    method: str = 'get'
+    role: str = None
+    args: Callable = lambda data, run: []
+    params: Callable = _nothing
+    body: Callable = _nothing
+
+    def user(self, data):
+        if self.role is None:
+            return None
+        return {
+            'waiter': data.waiters, 'cashier': data.cashiers, 'manager': data.managers,
+        }[self.role][0]
+
+
+def _order_lines(data, run):
+    return {
+        'table_number': 7,
+        'items': [
+            {'menu_item_id': item.pk, 'quantity': 2} for item in data.menu[run:run + 4]
+        ],
+    }
+
+
+def _payment(data, run):
+    order = data.pending_orders[run]
+    return {
+        'order_id': order.pk,
+        'payment_method': 'cash',
+        'amount': str(order.total),
+        'amount_received': str(order.total + 100),
+    }
+
+
+def _menu_import(data, run):
+    # Repricing part of the menu and adding a few dishes, as a menu change does
+    return {'items': [
+        {'id': item.pk, 'price': str(item.price + run + 1)} for item in data.menu[:40]
+    ] + [
+        {'name': f'Import {run}-{number}', 'price': '150.00', 'category': 'main-courses'}
+        for number in range(10)
+    ]}
+
+
+def _last_week(data, run):
+    today = timezone.localdate()
+    return {'from_date': (today - timedelta(days=7)).isoformat(), 'to_date': today.isoformat()}
+
+
+ENDPOINTS = [
+    Endpoint('api-root', 'api-root', role='cashier'),
+    Endpoint('menu-list', 'menu-list'),
+    Endpoint('menu-search', 'menu-list', params=lambda data, run: {'search': 'chick'}),
+    Endpoint('menu-retrieve', 'menu-detail', args=lambda data, run: [data.menu[0].pk]),
+    Endpoint(
+        'menu-toggle', 'menu-toggle-availability', method='patch', role='manager',
+        args=lambda data, run: [data.menu[1].pk],
+    ),
+    Endpoint('menu-import', 'menu-bulk-import', method='post', role='manager', body=_menu_import),
+    Endpoint('order-list', 'order-list', role='cashier'),
+    Endpoint('order-list-lean', 'order-list', role='cashier', params=lambda data, run: {'lean': 'true'}),
+    Endpoint(
+        'order-list-waiter', 'order-list', role='waiter',
+        params=lambda data, run: {'status': 'pending'},
+    ),
+    Endpoint(
+        'order-changes', 'order-list', role='cashier',
+        params=lambda data, run: {'since': sync.make_cursor(timezone.now() - timedelta(minutes=5))},
+    ),
+    Endpoint('order-retrieve', 'order-detail', role='cashier', args=lambda data, run: [data.orders[-1].pk]),
+    Endpoint('order-create', 'order-list', method='post', role='waiter', body=_order_lines),
+    Endpoint('transaction-list', 'transaction-list', role='cashier'),
+    Endpoint('transaction-list-range', 'transaction-list', role='cashier', params=_last_week),
+    Endpoint(
+        'transaction-retrieve', 'transaction-detail', role='cashier',
+        args=lambda data, run: [data.transactions[-1].pk],
+    ),
+    Endpoint(
+        'transaction-receipt', 'transaction-receipt', role='cashier',
+        args=lambda data, run: [data.transactions[-1].pk],
+    ),
+    Endpoint(
+        'transaction-receipt-html', 'transaction-receipt', role='cashier',
+        args=lambda data, run: [data.transactions[-2].pk], params=lambda data, run: {'kind': 'html'},
+    ),
+    Endpoint('transaction-receipts', 'transaction-receipts', role='manager', params=_last_week),
+    Endpoint('transaction-export', 'transaction-export', role='manager', params=_last_week),
+    Endpoint('transaction-create', 'transaction-list', method='post', role='cashier', body=_payment),
+    Endpoint('user-list', 'user-list', role='manager'),
+    Endpoint('user-retrieve', 'user-detail', role='manager', args=lambda data, run: [data.waiters[0].pk]),
+    Endpoint(
+        'sales-report', 'sales-report', role='manager',
+        params=lambda data, run: {**_last_week(data, run), 'dimension': 'category'},
+    ),
+    Endpoint('kitchen-board', 'kitchen-board', role='cashier'),
+    Endpoint(
+        'kitchen-board-station', 'kitchen-board', role='cashier',
+        params=lambda data, run: {'category': 'dessert'},
+    ),
+    Endpoint('kitchen-board-waiter', 'kitchen-board', role='waiter'),
+    Endpoint(
+        'auth-login', 'login', method='post',
+        body=lambda data, run: {'username': data.waiters[0].username, 'password': 'pass'},
+    ),
+    Endpoint('auth-me', 'current-user', role='waiter'),
+    Endpoint('auth-logout', 'logout', method='post', role='waiter'),
+]
+
+
+@dataclass
+class Measurement:
+    queries: int
+    sql_ms: float
+    wall_ms: float
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def measure(endpoint, data, repeat=3):
+    """
+    Call an endpoint `repeat` times with a fresh session each time.
+
+    Keeps the highest query count, so a cold cache on the first call counts,
+    and the lowest SQL and wall times.
+    """
+    results = []
+    for run in range(repeat):
+        client = APIClient()
+        user = endpoint.user(data)
+        if user is not None:
+            client.force_login(user)
+        url = reverse(endpoint.route, args=endpoint.args(data, run))
+        params = endpoint.params(data, run)
+        if params:
+            url = f'{url}?{urlencode(params)}'
+
+        body = endpoint.body(data, run)
+        send = getattr(client, endpoint.method)
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            start = time.perf_counter()
+            response = send(url, body, format='json') if body else send(url)
+            if response.streaming:
+                # Streamed bodies query the database as they are read
+                b''.join(response.streaming_content)
+            wall = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise AssertionError(
+                f'{endpoint.name}: {endpoint.method.upper()} {url} returned {response.status_code}'
+            )
+        results.append(Measurement(
+            queries=timer.queries,
+            sql_ms=timer.seconds * 1000,
+            wall_ms=wall * 1000,
+        ))
+
+    return Measurement(
+        queries=max(result.queries for result in results),
+        sql_ms=min(result.sql_ms for result in results),
+        wall_ms=min(result.wall_ms for result in results),
+    )
+
+
+def seed_data():
+    data = seed(**SEED)
+    # Orders being worked on right now, so delta syncs always have changes
+    Order.objects.filter(pk__in=[order.pk for order in data.pending_orders[-10:]]).update(
+        updated_at=timezone.now()
+    )
+    return data
+
+
+def run(data, repeat=3):
+    """Measure every endpoint, returning {name: Measurement}"""
+    cache.clear()
+    board.get_board().reset()
+    return {endpoint.name: measure(endpoint, data, repeat) for endpoint in ENDPOINTS}
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def write_baseline(results, path=BASELINE_PATH):
+    budgets = {
+        name: {
+            'queries': result.queries,
+            'sql_ms': max(TIME_FLOOR_MS, math.ceil(result.sql_ms * TIME_HEADROOM)),
+            'wall_ms': max(TIME_FLOOR_MS, math.ceil(result.wall_ms * TIME_HEADROOM)),
+        }
+        for name, result in results.items()
+    }
+    with open(path, 'w') as baseline:
+        json.dump(budgets, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def check(results, baseline):
+    """
+    Return one line per exceeded budget, empty when everything fits.
+
+    Query counts must not grow at all. Time budgets are scaled by the
+    PERF_BUDGET_TIME_FACTOR setting for slower machines.
+    """
+    factor = getattr(settings, 'PERF_BUDGET_TIME_FACTOR', 1.0)
+    failures = []
+    for name, result in results.items():
+        budget = baseline.get(name)
+        if budget is None:
+            failures.append(f'{name}: no budget recorded')
+            continue
+        if result.queries > budget['queries']:
+            failures.append(f"{name}: {result.queries} queries, budget {budget['queries']}")
+        for metric in ('sql_ms', 'wall_ms'):
+            actual, allowed = getattr(result, metric), budget[metric] * factor
+            if actual > allowed:
+                failures.append(f'{name}: {metric} {actual:.1f}, budget {allowed:.1f}')
+    return failures
@@ -0,0 +1,68 @@
+"""
+Versioned snapshots of the public menu list.
+
+Serialized menu responses are cached per query under the current catalogue
+version. Any menu change replaces the version once its transaction commits,
+which orphans every snapshot at once; nothing is deleted key by key.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.conf import settings
+from django.db import transaction
+
+VERSION_KEY = 'menu:version'
+
+# Snapshots outlive the version they belong to only until this expires
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def _cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def current_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        # A random version means an evicted key can never revive old snapshots
+        _cache().add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = _cache().get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Invalidate every cached snapshot once the current transaction commits"""
+    transaction.on_commit(
+        lambda: _cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    )
+
+
+def snapshot_key(version, request):
+    # Image URLs are absolute, so the host is part of the representation
+    params = request.query_params
+    parts = [
+        request.build_absolute_uri('/'),
+        params.get('category', ''),
+        params.get('available', ''),
+        params.get('search', ''),
+    ]
+    digest = hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+    return f'menu:{version}:{digest}'
+
+
+def get_snapshot(request, build):
+    """
+    Return (body, etag) for a menu list request.
+
+    `build` is called on a cache miss and must return the serialized body as
+    bytes. The ETag is a hash of the body, so it is strong and stable across
+    processes and cache rebuilds.
+    """
+    key = snapshot_key(current_version(), request)
+    snapshot = _cache().get(key)
+    if snapshot is None:
+        body = build()
+        snapshot = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+        _cache().set(key, snapshot, timeout=SNAPSHOT_TIMEOUT)
+    return snapshot
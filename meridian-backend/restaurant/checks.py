@@ -0,0 +1,31 @@
+"""
+System checks for settings that only work with a shared cache.
+"""
+from django.conf import settings
+from django.core import checks
+
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register(checks.Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    """Cached sessions need a cache every worker reads, or a logout misses the others"""
+    if settings.SESSION_ENGINE not in CACHED_SESSION_ENGINES:
+        return []
+    alias = getattr(settings, 'SESSION_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in PER_PROCESS_CACHES:
+        return []
+    return [checks.Error(
+        f"SESSION_ENGINE {settings.SESSION_ENGINE!r} is used with the per-process cache {alias!r}.",
+        hint=(
+            "Logging out would only clear the session in one worker process. Use "
+            "'django.contrib.sessions.backends.db', or a shared cache such as Redis."
+        ),
+        id='restaurant.E001',
+    )]
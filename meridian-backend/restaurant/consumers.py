@@ -0,0 +1,101 @@
+"""
+WebSocket stream of order events, served directly by the ASGI application.
+
+Clients connect to /ws/orders/ with their session cookie and may narrow the
+stream with `?status=pending,completed` and `?waiter=<id>`. Waiters only
+ever receive events for their own orders.
+"""
+import asyncio
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.cookie import parse_cookie
+
+from .events import get_broker
+from .permissions import STAFF_ROLES
+
+# Close codes sent before the handshake completes
+CLOSE_FORBIDDEN = 4403
+
+
+def _load_user(session_key):
+    engine = import_module(settings.SESSION_ENGINE)
+    return get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key.decode('latin1').lower() == name:
+            return value.decode('latin1')
+    return None
+
+
+async def authenticate(scope):
+    """Resolve the user of a WebSocket handshake from its session cookie"""
+    origin = _header(scope, 'origin')
+    if origin and origin not in settings.CSRF_TRUSTED_ORIGINS:
+        return None
+
+    cookies = parse_cookie(_header(scope, 'cookie') or '')
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+
+    user = await sync_to_async(_load_user)(session_key)
+    if not user.is_authenticated or getattr(user, 'role', None) not in STAFF_ROLES:
+        return None
+    return user
+
+
+def subscription_filters(scope, user):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    statuses = [
+        status for value in params.get('status', []) for status in value.split(',') if status
+    ]
+    waiter_id = None
+    if user.role == 'waiter':
+        waiter_id = user.pk
+    elif params.get('waiter', [''])[0].isdigit():
+        waiter_id = int(params['waiter'][0])
+    return statuses, waiter_id
+
+
+async def order_events(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    user = await authenticate(scope)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    statuses, waiter_id = subscription_filters(scope, user)
+    broker = get_broker()
+    subscription = broker.subscribe(statuses=statuses, waiter_id=waiter_id)
+    await send({'type': 'websocket.accept'})
+
+    receiving = asyncio.ensure_future(receive())
+    waiting = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {receiving, waiting}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if waiting in done:
+                await send({'type': 'websocket.send', 'text': json.dumps(waiting.result())})
+                waiting = asyncio.ensure_future(subscription.get())
+            if receiving in done:
+                # Client messages carry nothing; only a disconnect matters
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    break
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        receiving.cancel()
+        waiting.cancel()
+        broker.unsubscribe(subscription)
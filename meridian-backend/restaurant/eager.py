@@ -0,0 +1,99 @@
+"""
+Eager loading derived from serializers.
+
+`eager_paths` walks a serializer's fields, following dotted `source=` paths
+and nested serializers across model relations, and returns the
+select_related and prefetch_related lookups that serializing a queryset
+needs. Viewsets using `EagerLoadingMixin` apply them to every queryset they
+serialize, so adding a field that reads a relation cannot add a query per row.
+"""
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+
+def _relations(model):
+    """Map attribute name -> relation field for forward and reverse relations"""
+    relations = {
+        field.name: field for field in model._meta.get_fields()
+        if field.is_relation and not field.auto_created
+    }
+    for related in model._meta.related_objects:
+        relations[related.get_accessor_name()] = related
+    return relations
+
+
+def _walk(serializer, model, prefix, prefetching, select, prefetch):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+        else:
+            child = field
+        nested = isinstance(child, serializers.BaseSerializer)
+
+        if field.source == '*':
+            if nested:
+                _walk(child, model, prefix, prefetching, select, prefetch)
+            continue
+
+        path, current, many = list(prefix), model, prefetching
+        attrs = field.source_attrs
+        for index, attr in enumerate(attrs):
+            relation = _relations(current).get(attr)
+            if relation is None:
+                break
+            last = index == len(attrs) - 1
+            # A primary key field reads the `<name>_id` column, not the object
+            if last and isinstance(child, PrimaryKeyRelatedField) and relation.concrete:
+                break
+            path.append(attr)
+            many = many or relation.one_to_many or relation.many_to_many
+            current = relation.related_model
+            (prefetch if many else select).add('__'.join(path))
+
+        if nested and len(path) == len(prefix) + len(attrs):
+            _walk(child, current, path, many, select, prefetch)
+
+
+@lru_cache(maxsize=None)
+def eager_paths(serializer_class):
+    """
+    Return (select_related, prefetch_related) lookups for a model serializer.
+
+    Lookups implied by a longer one are left out, e.g. 'items' when
+    'items__menu_item' is prefetched.
+    """
+    serializer = serializer_class()
+    select, prefetch = set(), set()
+    _walk(serializer, serializer.Meta.model, [], False, select, prefetch)
+
+    def longest(paths):
+        return tuple(sorted(
+            path for path in paths
+            if not any(other.startswith(path + '__') for other in paths)
+        ))
+
+    return longest(select), longest(prefetch)
+
+
+def eager_load(queryset, serializer_class):
+    """Apply the lookups `serializer_class` needs to `queryset`"""
+    if not hasattr(getattr(serializer_class, 'Meta', None), 'model'):
+        return queryset
+    select, prefetch = eager_paths(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class EagerLoadingMixin:
+    """Eager-load every queryset the viewset serializes"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return eager_load(queryset, self.get_serializer_class())
@@ -0,0 +1,133 @@
+"""
+Order lifecycle events pushed to connected dashboards.
+
+Write paths publish events once their transaction commits. The broker fans
+them out to subscribers, each of which has its own queue and filters. The
+default broker lives in-process, which is enough for a single ASGI worker
+and for tests; other brokers can be plugged in with ORDER_EVENT_BROKER.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'order.created'
+ORDER_ITEMS_CHANGED = 'order.items_changed'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+ORDER_PAID = 'order.paid'
+
+# Sent to a subscriber that fell behind and lost events
+RESYNC = 'resync'
+
+
+class Subscription:
+    """A subscriber's queue plus the statuses and waiter it wants to hear about"""
+
+    def __init__(self, loop, statuses=None, waiter_id=None, max_pending=100):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.statuses = set(statuses) if statuses else None
+        self.waiter_id = waiter_id
+
+    def matches(self, event):
+        order = event['order']
+        if self.waiter_id is not None and order['waiter'] != self.waiter_id:
+            return False
+        if self.statuses is not None:
+            # Status changes reach both the old and the new status' listeners
+            statuses = {order['status'], event.get('previous_status')}
+            if not self.statuses & statuses:
+                return False
+        return True
+
+    def offer(self, event):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            # The client missed events; make it fall back to a delta sync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {'type': RESYNC}
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, statuses=None, waiter_id=None, loop=None):
+        """Register a subscriber whose events are delivered on `loop`"""
+        subscription = Subscription(loop or asyncio.get_running_loop(), statuses, waiter_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        """Deliver an event to every matching subscriber; safe from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'ORDER_EVENT_BROKER', 'restaurant.events.InProcessBroker')
+        _broker = import_string(path)()
+    return _broker
+
+
+def order_payload(order):
+    return {
+        'id': order.pk,
+        'table_number': order.table_number,
+        'waiter': order.waiter_id,
+        'status': order.status,
+        'total': str(order.total),
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+    }
+
+
+def publish_on_commit(event_type, order_id, **extra):
+    """
+    Publish an event about an order once the current transaction commits.
+
+    The order is read when the callback runs, so the payload reflects what
+    was committed. A failing broker is logged and never breaks the request.
+    """
+    def publish():
+        from .models import Order
+
+        order = Order.objects.filter(pk=order_id).first()
+        if order is None:
+            return
+        event = {'type': event_type, 'order': order_payload(order), **extra}
+        try:
+            get_broker().publish(event)
+        except Exception:
+            logger.exception("Failed to publish %s event", event_type)
+
+    transaction.on_commit(publish)
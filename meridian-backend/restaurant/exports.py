@@ -0,0 +1,157 @@
+"""
+Streaming exports of the transaction history for finance.
+
+One row per order line, joined with its payment and order, for payments
+made between two local dates. Hot and archived payments are each read in
+keyset chunks of (created_at, id), with their lines fetched per chunk, and
+the two streams are merged in time order, so memory stays flat however long
+the range is. Rows are plain tuples in COLUMNS order.
+
+CSV is written as a generator of encoded chunks for StreamingHttpResponse
+or a file. Parquet, for `manage.py export_transactions`, needs pyarrow and
+is written one row group per chunk.
+"""
+import csv
+import heapq
+from collections import defaultdict
+from operator import itemgetter
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedOrderItem, ArchivedTransaction, OrderItem, Transaction
+from .utils import local_day_bounds
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = [
+    'transaction_id', 'paid_at', 'payment_method', 'amount', 'cashier',
+    'order_id', 'table_number', 'waiter', 'order_status',
+    'order_subtotal', 'order_vat', 'order_service_fee', 'order_total',
+    'item_id', 'menu_item_id', 'menu_item', 'category', 'quantity', 'unit_price', 'line_subtotal',
+    'archived',
+]
+
+PAYMENT_FIELDS = [
+    'id', 'created_at', 'payment_method', 'amount', 'cashier__username',
+    'order_id', 'order__table_number', 'order__waiter__username', 'order__status',
+    'order__subtotal', 'order__vat', 'order__service_fee', 'order__total',
+]
+
+LINE_FIELDS = [
+    'order_id', 'id', 'menu_item_id', 'menu_item__name', 'menu_item__category',
+    'quantity', 'price_at_time', 'subtotal',
+]
+
+# Payments and the lines of their orders; the flag fills the `archived` column
+TIERS = ((Transaction, OrderItem, False), (ArchivedTransaction, ArchivedOrderItem, True))
+
+EMPTY_LINE = (None,) * (len(LINE_FIELDS) - 1)
+
+# Rows buffered into one CSV chunk
+CSV_CHUNK_ROWS = 500
+
+
+def chunks(payment_model, line_model, archived, start_at, end_at, batch_size):
+    """Yield lists of rows for up to `batch_size` payments at a time, in time order"""
+    payments = payment_model.objects.filter(
+        created_at__gte=start_at, created_at__lt=end_at
+    ).order_by('created_at', 'id').values_list(*PAYMENT_FIELDS)
+
+    position = None
+    while True:
+        page = payments
+        if position is not None:
+            created_at, pk = position
+            page = page.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        position = batch[-1][1], batch[-1][0]
+
+        lines = defaultdict(list)
+        order_ids = [payment[5] for payment in batch]
+        for line in line_model.objects.filter(order_id__in=order_ids).order_by('id').values_list(*LINE_FIELDS):
+            lines[line[0]].append(line[1:])
+
+        yield [
+            (*payment, *line, archived)
+            for payment in batch
+            for line in lines.get(payment[5]) or [EMPTY_LINE]
+        ]
+
+
+def rows(start, end, batch_size=1000):
+    """Every export row for payments between two local dates, oldest first"""
+    start_at, end_at = local_day_bounds(start, end)
+    streams = [
+        (row for chunk in chunks(*tier, start_at, end_at, batch_size) for row in chunk)
+        for tier in TIERS
+    ]
+    # (paid_at, transaction_id, item_id); the item id is None for an empty order
+    return heapq.merge(*streams, key=lambda row: (row[1], row[0], row[13] or 0))
+
+
+def row_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Echo:
+    """File-like object whose write returns what it was given"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'tzinfo'):
+        return timezone.localtime(value).isoformat()
+    return value
+
+
+def stream_csv(rows):
+    """Yield the header and rows as UTF-8 CSV, a few hundred rows per chunk"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS).encode()
+    for chunk in row_chunks(rows, CSV_CHUNK_ROWS):
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in chunk).encode()
+
+
+def parquet_schema():
+    money = pyarrow.decimal128(12, 2)
+    types = {
+        'transaction_id': pyarrow.int64(),
+        'paid_at': pyarrow.timestamp('us', tz='UTC'),
+        'amount': money, 'order_id': pyarrow.int64(), 'table_number': pyarrow.int32(),
+        'order_subtotal': money, 'order_vat': money, 'order_service_fee': money, 'order_total': money,
+        'item_id': pyarrow.int64(), 'menu_item_id': pyarrow.int64(), 'quantity': pyarrow.int32(),
+        'unit_price': money, 'line_subtotal': money, 'archived': pyarrow.bool_(),
+    }
+    return pyarrow.schema([(column, types.get(column, pyarrow.string())) for column in COLUMNS])
+
+
+def write_parquet(rows, path, chunk_rows=10000):
+    """Write rows to a Parquet file one row group at a time; returns the row count"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs the pyarrow package")
+    schema = parquet_schema()
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in row_chunks(rows, chunk_rows):
+            columns = [list(map(itemgetter(index), chunk)) for index in range(len(COLUMNS))]
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            count += len(chunk)
+    return count
@@ -0,0 +1,220 @@
+"""
+Static and media file serving for production.
+
+`serve` replaces django.views.static.serve behind the /static/ and /media/
+routes:
+
+- Strong ETags from the file's size and modification time, with 304
+  answers to If-None-Match and If-Modified-Since.
+- Files whose names carry a content hash (menu image variants, collected
+  static files) are cached for a year as immutable; everything else is
+  revalidated on every use.
+- A `.br` or `.gz` file next to the requested one is served instead when
+  the client accepts that encoding; see `manage.py compress_files`.
+- Single byte ranges, with If-Range, answered with 206 or 416.
+- With the FILE_OFFLOAD setting, the transfer is handed to the front proxy
+  through X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) once
+  the headers are decided. Otherwise the file is streamed from Django,
+  through the server's sendfile support where it has one.
+"""
+import mimetypes
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# name.<hex digest>.ext, as written by restaurant.images and ManifestStaticFilesStorage
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12,}\.\w+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+# Preferred first; (Content-Encoding, file suffix)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve(document_root, path):
+    """The regular file `path` names under `document_root`, or Http404"""
+    root = Path(document_root).resolve()
+    candidate = (root / path.lstrip('/')).resolve()
+    if root not in candidate.parents or not candidate.is_file():
+        raise Http404("File not found")
+    return candidate
+
+
+def make_etag(stat, encoding=None):
+    tag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def accepted_encodings(request):
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def precompressed(request, file_path, stat):
+    """
+    Return (encoding, path, stat) of the representation to send.
+
+    A variant is only used when it is at least as new as the original, so
+    a stale `.gz` left behind after an edit is ignored.
+    """
+    accepted = accepted_encodings(request)
+    for encoding, suffix in ENCODINGS:
+        if encoding not in accepted and '*' not in accepted:
+            continue
+        variant = file_path.with_name(file_path.name + suffix)
+        try:
+            variant_stat = variant.stat()
+        except OSError:
+            continue
+        if variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+            return encoding, variant, variant_stat
+    return None, file_path, stat
+
+
+def has_variants(file_path):
+    return any(file_path.with_name(file_path.name + suffix).exists() for _, suffix in ENCODINGS)
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    Parse a single-range Range header into (start, end) inclusive.
+
+    Returns None to send the whole file: no header, a stale If-Range, or
+    several ranges. Returns False when the range cannot be satisfied.
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range:
+        if if_range.startswith('"'):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            return False
+    elif last:
+        length = int(last)
+        if length == 0:
+            return False
+        start, end = max(0, size - length), size - 1
+    else:
+        return None
+    return start, end
+
+
+def read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload(response, method, file_path, document_root, accel_location):
+    """Hand the transfer of `file_path` to the front proxy"""
+    if method == 'x-accel-redirect':
+        if not accel_location:
+            raise ImproperlyConfigured("X-Accel-Redirect needs the route's accel_location")
+        relative = file_path.relative_to(Path(document_root).resolve()).as_posix()
+        response['X-Accel-Redirect'] = accel_location.rstrip('/') + '/' + quote(relative)
+    elif method == 'x-sendfile':
+        response['X-Sendfile'] = str(file_path)
+    else:
+        raise ImproperlyConfigured(f"Unknown FILE_OFFLOAD {method!r}")
+
+
+def serve(request, path, document_root=None, accel_location=None):
+    """
+    Serve `path` from `document_root`; a drop-in for django.views.static.serve.
+
+    `accel_location` is the nginx internal location aliasing the root, used
+    when FILE_OFFLOAD is 'x-accel-redirect'.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        response = HttpResponse(status=405)
+        response['Allow'] = 'GET, HEAD'
+        return response
+
+    file_path = resolve(document_root, path)
+    stat = file_path.stat()
+    method = getattr(settings, 'FILE_OFFLOAD', None)
+    if method or 'Range' in request.headers:
+        # A proxy picks precompressed files itself (gzip_static), and ranges
+        # address the bytes of the plain file
+        encoding, send_path, send_stat = None, file_path, stat
+    else:
+        encoding, send_path, send_stat = precompressed(request, file_path, stat)
+
+    etag = make_etag(send_stat, encoding)
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': IMMUTABLE if HASHED_NAME.search(file_path.name) else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if has_variants(file_path):
+        headers['Vary'] = 'Accept-Encoding'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and method:
+        response = HttpResponse(content_type=content_type)
+        offload(response, method, file_path, document_root, accel_location)
+    elif response is None:
+        span = byte_range(request, stat.st_size, etag, last_modified)
+        if span is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if span is None:
+            response = FileResponse(
+                open(send_path, 'rb'), content_type=content_type, filename=file_path.name
+            )
+        else:
+            start, end = span
+            response = StreamingHttpResponse(
+                read_range(open(send_path, 'rb'), start, end - start + 1),
+                status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+    elif response.status_code != 304:
+        # 412 Precondition Failed
+        return response
+
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -0,0 +1,157 @@
+"""
+Resized derivatives of menu item images.
+
+An uploaded photo is decoded once and written out at each width in
+MENU_IMAGE_WIDTHS, as WebP and as JPEG, never larger than the original.
+Each file is named after a hash of its own bytes, so a URL never changes
+meaning and can be cached forever. The storage names end up in
+`MenuItem.image_variants` as {format: {width: name}}.
+
+The work runs on the task queue (see restaurant.tasks) once the upload
+commits, so the request returns as soon as the original is stored. The
+variants a new set replaces are deleted once it is saved, unless another
+item still refers to the same files.
+"""
+import hashlib
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import catalogue, tasks
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+
+# Pillow format name, file extension and encoder options
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'menu_items/variants'
+
+
+def widths():
+    return tuple(sorted(getattr(settings, 'MENU_IMAGE_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def render(source):
+    """
+    Encode every derivative of an image file.
+
+    Returns {format: {width: bytes}}. Widths above the original's are left
+    out, except that an image narrower than every width still gets one
+    variant at its own size.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    opaque = image
+    if image.mode == 'RGBA':
+        # JPEG has no alpha channel
+        opaque = Image.new('RGB', image.size, (255, 255, 255))
+        opaque.paste(image, mask=image.getchannel('A'))
+
+    targets = [width for width in widths() if width <= image.width] or [image.width]
+    rendered = {name: {} for name in FORMATS}
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        for name, (pil_format, _, options) in FORMATS.items():
+            frame = image if name == 'webp' else opaque
+            if frame.width != width:
+                frame = frame.resize((width, height), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            frame.save(buffer, pil_format, **options)
+            rendered[name][width] = buffer.getvalue()
+    return rendered
+
+
+def store(rendered, stem):
+    """Save rendered derivatives under content-hashed names; returns the variants map"""
+    variants = {}
+    for name, by_width in rendered.items():
+        extension = FORMATS[name][1]
+        variants[name] = {}
+        for width, content in by_width.items():
+            digest = hashlib.sha256(content).hexdigest()[:16]
+            path = f'{VARIANT_DIR}/{stem}-{width}w.{digest}.{extension}'
+            # The same bytes always get the same name, so an existing file is reused
+            if not default_storage.exists(path):
+                path = default_storage.save(path, ContentFile(content))
+            variants[name][str(width)] = path
+    return variants
+
+
+def variant_paths(variants):
+    """Storage names in a variants map"""
+    return {path for by_width in variants.values() for path in by_width.values()}
+
+
+def discard(paths):
+    """Delete variant files no menu item refers to any more; returns how many"""
+    from .models import MenuItem
+
+    if not paths:
+        return 0
+    referenced = set()
+    for variants in MenuItem.objects.exclude(image_variants={}).values_list('image_variants', flat=True):
+        referenced |= variant_paths(variants)
+    unused = set(paths) - referenced
+    for path in unused:
+        default_storage.delete(path)
+    return len(unused)
+
+
+def discard_on_commit(paths):
+    if paths:
+        transaction.on_commit(lambda: discard(paths))
+
+
+@tasks.task(max_attempts=3, concurrency=2)
+def build_variants(menu_item_id, replaced=()):
+    """
+    Render and store the derivatives of one menu item's current image.
+
+    `replaced` names the variants of the image the upload replaced; they
+    are deleted with the item's previous set once the new one is saved.
+    """
+    from .models import MenuItem
+
+    item = MenuItem.objects.filter(pk=menu_item_id).only('image', 'image_variants').first()
+    if item is None or not item.image:
+        discard_on_commit(set(replaced))
+        return None
+
+    image_name = item.image.name
+    with item.image.open('rb') as source:
+        rendered = render(source)
+    variants = store(rendered, PurePosixPath(image_name).stem[:40])
+
+    # Skipped when the image was replaced meanwhile; its own job follows
+    updated = MenuItem.objects.filter(pk=menu_item_id, image=image_name).update(
+        image_variants=variants, updated_at=timezone.now(),
+    )
+    stale = variant_paths(item.image_variants) | set(replaced)
+    if updated:
+        catalogue.bump_version()
+    else:
+        stale |= variant_paths(variants)
+    # Files the saved set reuses are still referenced and stay
+    discard_on_commit(stale)
+    return variants
+
+
+def schedule(menu_item_id, replaced=()):
+    """
+    Build a menu item's variants in the background once the current
+    transaction commits, then delete the `replaced` ones
+    """
+    build_variants.enqueue(menu_item_id, sorted(replaced))
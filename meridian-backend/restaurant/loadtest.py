@@ -0,0 +1,271 @@
+"""
+Dinner-rush load harness for a running server.
+
+Virtual staff log in with seeded accounts (see the seed_data command) and
+loop over a weighted mix of requests until the run ends. Waiters read the
+menu, post orders and poll their pending orders. Cashiers delta-sync the
+pending orders the way the dashboard does, take payments and page through
+transactions. Managers read sales reports and the order and staff lists.
+
+Each virtual user draws from its own seeded random generator, so the same
+options replay the same sequence of actions.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+
+class Stats:
+    """Latencies and failures per endpoint, shared by every virtual user"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if status is None or status >= 400:
+                self.errors[name] += 1
+
+    def report(self, elapsed):
+        """Rows of (endpoint, requests, errors, requests/s, p50, p95, p99, max) in ms"""
+        rows = []
+        for name in sorted(self.latencies):
+            timings = sorted(self.latencies[name])
+            rows.append((
+                name, len(timings), self.errors[name], len(timings) / elapsed,
+                *(percentile(timings, q) * 1000 for q in (50, 95, 99)),
+                timings[-1] * 1000,
+            ))
+        return rows
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list"""
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Session:
+    """A logged-in browser: session and CSRF cookies plus ETags per URL"""
+
+    def __init__(self, base_url, stats):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.etags = {}
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, name, method, path, params=None, body=None, conditional=False):
+        """
+        Send one request and record it under `name`.
+
+        Returns the decoded JSON body of a successful response, or None for
+        failures, empty bodies and 304 Not Modified.
+        """
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if method != 'GET':
+            headers['X-CSRFToken'] = self.csrf_token()
+        if conditional and url in self.etags:
+            headers['If-None-Match'] = self.etags[url]
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, data, headers, method=method), timeout=30) as response:
+                status, payload = response.status, response.read()
+                etag = response.headers.get('ETag')
+        except HTTPError as error:
+            status, payload, etag = error.code, error.read(), None
+        except (URLError, OSError):
+            status, payload, etag = None, b'', None
+        self.stats.record(name, time.perf_counter() - start, None if status is None else (
+            200 if status == 304 else status
+        ))
+
+        if conditional and etag:
+            self.etags[url] = etag
+        if status is not None and 200 <= status < 300 and payload:
+            return json.loads(payload)
+        return None
+
+
+class VirtualUser:
+    """Logs in, then repeats weighted actions with a pause between them"""
+    role = None
+    actions = {}
+
+    def __init__(self, session, rng, username, password):
+        self.session = session
+        self.rng = rng
+        self.username = username
+        self.password = password
+
+    def log_in(self):
+        result = self.session.request(
+            'auth-login', 'POST', '/api/auth/login/',
+            body={'username': self.username, 'password': self.password},
+        )
+        return bool(result and result.get('success'))
+
+    def setup(self):
+        pass
+
+    def run(self, deadline, think_time):
+        if not self.log_in():
+            return
+        self.setup()
+        names, weights = list(self.actions), list(self.actions.values())
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+            time.sleep(think_time * self.rng.uniform(0.5, 1.5))
+
+
+class Waiter(VirtualUser):
+    role = 'waiter'
+    actions = {'post_order': 2, 'poll_orders': 6, 'read_menu': 1}
+
+    def setup(self):
+        menu = self.session.request('menu-list', 'GET', '/api/menu/', {'available': 'true'}) or []
+        self.menu_ids = [item['id'] for item in menu]
+
+    def post_order(self):
+        if not self.menu_ids:
+            return
+        lines = self.rng.sample(self.menu_ids, min(len(self.menu_ids), self.rng.randint(1, 5)))
+        self.session.request('order-create', 'POST', '/api/orders/', body={
+            'table_number': self.rng.randint(1, 40),
+            'items': [
+                {'menu_item_id': pk, 'quantity': self.rng.randint(1, 3)} for pk in lines
+            ],
+        })
+
+    def poll_orders(self):
+        self.session.request(
+            'order-list-waiter', 'GET', '/api/orders/',
+            {'status': 'pending', 'lean': 'true'}, conditional=True,
+        )
+
+    def read_menu(self):
+        self.session.request('menu-list', 'GET', '/api/menu/', conditional=True)
+
+
+class Cashier(VirtualUser):
+    role = 'cashier'
+    actions = {'poll_orders': 6, 'pay': 2, 'history': 1}
+
+    def setup(self):
+        self.cursor = ''
+        self.pending = {}
+
+    def poll_orders(self):
+        changes = self.session.request(
+            'order-changes', 'GET', '/api/orders/',
+            {'status': 'pending', 'lean': 'true', 'since': self.cursor},
+        )
+        if changes is None:
+            return
+        self.cursor = changes['cursor']
+        if changes['reset']:
+            self.pending = {}
+        for order in changes['orders']:
+            self.pending[order['id']] = order['total']
+        for order_id in changes['removed']:
+            self.pending.pop(order_id, None)
+
+    def pay(self):
+        if not self.pending:
+            return
+        order_id = self.rng.choice(sorted(self.pending))
+        total = self.pending.pop(order_id)
+        method = self.rng.choice(['cash', 'cash', 'card', 'gcash'])
+        body = {'order_id': order_id, 'payment_method': method, 'amount': total}
+        if method == 'cash':
+            body['amount_received'] = str(math.ceil(float(total) / 100) * 100)
+        elif method == 'card':
+            body.update(card_number='4111 1111 1111 1111', cardholder_name='Load Test')
+        else:
+            body.update(account_identifier='09171234567', account_name='Load Test')
+        self.session.request('transaction-create', 'POST', '/api/transactions/', body=body)
+
+    def history(self):
+        self.session.request('transaction-list', 'GET', '/api/transactions/')
+
+
+class Manager(VirtualUser):
+    role = 'manager'
+    actions = {'sales_report': 3, 'transactions': 1, 'orders': 1, 'staff': 1}
+
+    def week(self):
+        today = date.today()
+        return {'from_date': (today - timedelta(days=7)).isoformat(), 'to_date': today.isoformat()}
+
+    def sales_report(self):
+        self.session.request('sales-report', 'GET', '/api/reports/sales/', {
+            **self.week(),
+            'group_by': self.rng.choice(['day', 'hour']),
+            'dimension': self.rng.choice(['total', 'payment_method', 'cashier', 'category']),
+        })
+
+    def transactions(self):
+        self.session.request('transaction-list-range', 'GET', '/api/transactions/', self.week())
+
+    def orders(self):
+        self.session.request('order-list', 'GET', '/api/orders/', {'lean': 'true'}, conditional=True)
+
+    def staff(self):
+        self.session.request('user-list', 'GET', '/api/users/')
+
+
+def run_load(base_url, duration=60, waiters=8, cashiers=3, managers=1, think_time=1.0,
+             prefix='seed', password='pass', random_seed=0):
+    """
+    Replay the dinner-rush mix against `base_url` for `duration` seconds.
+
+    Virtual user n of a role logs in as <prefix>-<role>-<n>. Returns the
+    Stats and the elapsed seconds.
+    """
+    stats = Stats()
+    users = []
+    for user_class, count in [(Waiter, waiters), (Cashier, cashiers), (Manager, managers)]:
+        for number in range(count):
+            users.append(user_class(
+                Session(base_url, stats),
+                random.Random(f'{random_seed}-{user_class.role}-{number}'),
+                f'{prefix}-{user_class.role}-{number}',
+                password,
+            ))
+
+    start = time.monotonic()
+    deadline = start + duration
+    threads = [
+        threading.Thread(target=user.run, args=(deadline, think_time), daemon=True)
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.monotonic() - start
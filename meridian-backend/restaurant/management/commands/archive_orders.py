@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from restaurant import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and cancelled orders older than ARCHIVE_AFTER_DAYS, with "
+        "their items and payments, into the archive tables. Safe to interrupt "
+        "and run again; it carries on where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            help="Archive orders older than this (default: ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Orders moved per transaction (default: 500)")
+        parser.add_argument('--pause', type=float, default=0.5,
+                            help="Seconds to sleep between batches (default: 0.5)")
+        parser.add_argument('--max-batches', type=int,
+                            help="Stop after this many batches")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count the eligible orders without moving them")
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['older_than_days'])
+
+        if options['dry_run']:
+            count = archive.eligible(before).count()
+            self.stdout.write(f"{count} order(s) created before {before:%Y-%m-%d %H:%M} can be archived")
+            return
+
+        moved = archive.archive(
+            before,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            progress=lambda total: self.stdout.write(f"  {total} order(s) archived"),
+        )
+        remaining = archive.eligible(before).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} order(s) created before {before:%Y-%m-%d %H:%M}; {remaining} remaining"
+        ))
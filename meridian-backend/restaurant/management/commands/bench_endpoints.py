@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import setup_test_environment
+
+from restaurant import budgets
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure query count, SQL time and wall time for every API endpoint "
+        "and compare them with the checked-in budgets. Benchmark data is "
+        "created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--write-baseline', action='store_true',
+            help="Record the results as the new budgets in %s" % budgets.BASELINE_PATH.name,
+        )
+
+    def handle(self, *args, **options):
+        # Lets the test client talk to the app whatever ALLOWED_HOSTS says
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                data = budgets.seed_data()
+                results = budgets.run(data, repeat=options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        baseline = {} if options['write_baseline'] else budgets.load_baseline()
+        self.stdout.write(f"  {'endpoint':<24}{'queries':>14}{'sql ms':>18}{'wall ms':>18}")
+        for name, result in results.items():
+            budget = baseline.get(name, {})
+            self.stdout.write(
+                f"  {name:<24}"
+                f"{result.queries:>7} / {budget.get('queries', '-'):>4}"
+                f"{result.sql_ms:>10.1f} / {budget.get('sql_ms', '-'):>5}"
+                f"{result.wall_ms:>10.1f} / {budget.get('wall_ms', '-'):>5}"
+            )
+
+        if options['write_baseline']:
+            budgets.write_baseline(results)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {budgets.BASELINE_PATH}"))
+            return
+
+        failures = budgets.check(results, baseline)
+        if failures:
+            raise CommandError("Budgets exceeded:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All endpoints within budget"))
@@ -0,0 +1,79 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from restaurant.models import MenuItem
+from restaurant.search import get_backend
+
+WORDS = (
+    'chicken beef pork shrimp tofu garlic butter lemon pepper spicy grilled roasted '
+    'braised crispy sweet sour soup salad noodle rice adobo sinigang kare mango '
+    'coconut ube leche flan tea coffee juice ginger basil tomato cheese mushroom'
+).split()
+
+QUERIES = ['chicken', 'garl', 'spicy soup', 'coconut rice', 'ube leche flan', 'zzz']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare menu search through the search index with the old icontains "
+        "filter. Benchmark data is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        self.stdout.write(f"Search backend: {type(backend).__name__}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run(backend, size, options['repeat'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, backend, size, repeat):
+        rng = random.Random(size)
+        categories = [value for value, _ in MenuItem.CATEGORY_CHOICES]
+        MenuItem.objects.bulk_create(
+            (
+                MenuItem(
+                    name=' '.join(rng.sample(WORDS, 3)).title(),
+                    description=' '.join(rng.sample(WORDS, 8)),
+                    price=rng.randint(50, 900),
+                    category=rng.choice(categories),
+                )
+                for _ in range(size)
+            ),
+            batch_size=5000,
+        )
+
+        self.stdout.write(f"\n{size} menu items, best of {repeat} runs (ms)")
+        self.stdout.write(f"  {'query':<16}{'matches':>8}{'icontains':>12}{'index':>10}")
+        for text in QUERIES:
+            contains = MenuItem.objects.filter(
+                Q(name__icontains=text) | Q(description__icontains=text)
+            )
+            indexed = backend.search(MenuItem.objects.all(), text)
+            self.stdout.write(
+                f"  {text:<16}{indexed.count():>8}"
+                f"{self.best(contains, repeat):>12.2f}{self.best(indexed, repeat):>10.2f}"
+            )
+
+    def best(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset[:50])
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
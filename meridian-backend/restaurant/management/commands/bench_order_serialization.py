@@ -0,0 +1,88 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from restaurant.models import User, MenuItem, Order
+from restaurant.serializers import OrderSerializer, OrderLeanSerializer
+
+
+class LegacyOrderSerializer(OrderSerializer):
+    """The previous pricing: every calculated_* field re-sums the items"""
+
+    def get_calculated_subtotal(self, obj):
+        total = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
+        return float(total)
+
+    def get_calculated_vat(self, obj):
+        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
+        return float(subtotal * Decimal('0.12'))
+
+    def get_calculated_service_fee(self, obj):
+        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
+        return float(subtotal * Decimal('0.10'))
+
+    def get_calculated_total(self, obj):
+        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
+        vat = subtotal * Decimal('0.12')
+        service_fee = subtotal * Decimal('0.10')
+        return float(subtotal + vat + service_fee)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the CPU cost of serializing an /api/orders/ list response. "
+        "Benchmark data is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--items', type=int, default=6, help="Lines per order")
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['orders'], options['items'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, order_count, items_per_order, repeat):
+        waiter = User.objects.create_user('bench-waiter', role='waiter')
+        menu = [
+            MenuItem.objects.create(name=f'Bench dish {i}', price=Decimal('7.25') + i, category='soup')
+            for i in range(items_per_order)
+        ]
+        for table in range(order_count):
+            Order.objects.create_with_items(
+                waiter=waiter, table_number=table,
+                lines=[(menu_item, 2, '') for menu_item in menu],
+            )
+
+        orders = list(
+            Order.objects.select_related('waiter').prefetch_related('items__menu_item')
+        )
+
+        self.stdout.write(f"{order_count} orders x {items_per_order} items, best of {repeat} runs")
+        baseline = None
+        for label, serializer_class in [
+            ('legacy (4 passes per order)', LegacyOrderSerializer),
+            ('single-pass pricing', OrderSerializer),
+            ('lean list (?lean=true)', OrderLeanSerializer),
+        ]:
+            best = min(self.time_serialization(serializer_class, orders) for _ in range(repeat))
+            baseline = baseline or best
+            self.stdout.write(
+                f"  {label:<30} {best * 1000:8.2f} ms  ({baseline / best:.2f}x)"
+            )
+
+    def time_serialization(self, serializer_class, orders):
+        start = time.perf_counter()
+        serializer_class(orders, many=True).data
+        return time.perf_counter() - start
@@ -0,0 +1,111 @@
+import copy
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from restaurant.loadtest import percentile
+from restaurant.models import Transaction
+from restaurant.seed import seed
+from restaurant.serializers import CreateOrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure write throughput of N concurrent workers, each creating and "
+        "paying orders, on a scratch SQLite database with Django's stock "
+        "connection options and with the options in settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The default database is not SQLite")
+
+        settings_dict = connections.settings['default']
+        original = copy.deepcopy(settings_dict)
+        modes = [('stock', {}), ('settings', original['OPTIONS'])]
+
+        self.stdout.write(
+            f"  {'mode':<10}{'workers':>8}{'orders/s':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        )
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for mode, mode_options in modes:
+                    self.use_database(settings_dict, Path(directory) / f'{mode}.sqlite3', mode_options)
+                    call_command('migrate', verbosity=0)
+                    data = seed(orders=0, menu_items=40, waiters=2, cashiers=2, prefix='contention')
+                    for workers in options['workers']:
+                        self.report(mode, workers, *self.run(data, workers, options['seconds']))
+        finally:
+            connections['default'].close()
+            settings_dict.clear()
+            settings_dict.update(original)
+            del connections['default']
+
+    def use_database(self, settings_dict, path, mode_options):
+        connections['default'].close()
+        settings_dict['NAME'] = str(path)
+        settings_dict['OPTIONS'] = copy.deepcopy(mode_options)
+        # Worker threads open their own connections from the updated settings
+        del connections['default']
+
+    def run(self, data, workers, seconds):
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+        menu_ids = [item.pk for item in data.menu]
+        deadline = time.monotonic() + seconds
+
+        def worker(number):
+            waiter = data.waiters[number % len(data.waiters)]
+            cashier = data.cashiers[number % len(data.cashiers)]
+            step = 0
+            while time.monotonic() < deadline:
+                step += 1
+                lines = [menu_ids[(number + step + offset) % len(menu_ids)] for offset in range(3)]
+                start = time.perf_counter()
+                try:
+                    # The same transactions as POST /api/orders/ and POST /api/transactions/
+                    with transaction.atomic():
+                        serializer = CreateOrderSerializer(data={
+                            'table_number': number,
+                            'items': [{'menu_item_id': pk, 'quantity': 2} for pk in lines],
+                        })
+                        serializer.is_valid(raise_exception=True)
+                        order = serializer.save(waiter=waiter)
+                    Transaction.objects.checkout(
+                        order.pk, cashier, 'card', {'card_number': '4111', 'cardholder_name': 'Bench'}
+                    )
+                except Exception as error:
+                    with lock:
+                        errors[type(error).__name__] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, time.monotonic() - started
+
+    def report(self, mode, workers, latencies, errors, elapsed):
+        latencies.sort()
+        p50, p95 = (percentile(latencies, q) * 1000 for q in (50, 95)) if latencies else (0, 0)
+        self.stdout.write(
+            f"  {mode:<10}{workers:>8}{len(latencies) / elapsed:>10.1f}"
+            f"{sum(errors.values()):>8}{p50:>9.1f}{p95:>9.1f}"
+            + (f"  {dict(errors)}" if errors else "")
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.images import build_variants
+from restaurant.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the resized WebP and JPEG variants of menu item images. By default "
+        "only items with an image but no variants yet are processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Rebuild every item with an image, e.g. after changing MENU_IMAGE_WIDTHS")
+
+    def handle(self, *args, **options):
+        items = MenuItem.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            items = items.filter(image_variants={})
+
+        built = failed = 0
+        for pk in items.values_list('pk', flat=True).order_by('pk'):
+            try:
+                build_variants(pk)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"Menu item {pk}: {error}")
+            else:
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} menu item(s)"))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} menu item(s) failed"))
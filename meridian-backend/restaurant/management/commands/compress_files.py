@@ -0,0 +1,65 @@
+import gzip
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Images, fonts and video are compressed already
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico'}
+
+# Variants that save less than this are not worth a second file
+MIN_SAVING = 0.05
+
+
+class Command(BaseCommand):
+    help = (
+        "Write .gz (and .br when the brotli package is installed) copies of "
+        "text files under STATIC_ROOT and MEDIA_ROOT, for restaurant.files to "
+        "serve to clients that accept them. Run it after collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('roots', nargs='*', help="Directories to compress (default: STATIC_ROOT and MEDIA_ROOT)")
+
+    def handle(self, *args, **options):
+        roots = options['roots'] or [settings.STATIC_ROOT, settings.MEDIA_ROOT]
+        encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        else:
+            self.stdout.write("brotli is not installed; writing gzip files only")
+
+        written = 0
+        for root in roots:
+            if not root or not Path(root).is_dir():
+                continue
+            for path in sorted(Path(root).rglob('*')):
+                if path.suffix.lower() in COMPRESSIBLE and path.is_file():
+                    written += self.compress(path, encoders)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} compressed file(s)"))
+
+    def compress(self, path, encoders):
+        stat = path.stat()
+        data = None
+        written = 0
+        for suffix, encode in encoders:
+            target = path.with_name(path.name + suffix)
+            if target.exists() and target.stat().st_mtime_ns >= stat.st_mtime_ns:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            compressed = encode(data)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                continue
+            target.write_bytes(compressed)
+            # Same timestamp as the original, so the variant counts as current
+            os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            written += 1
+        return written
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import menu_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Create and update menu items from a CSV or JSON file in one transaction. "
+        "Rows match existing items by id, or else by exact name. Nothing is "
+        "written when any row is invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON file of menu items")
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help="File format (default: from the file extension)")
+        parser.add_argument('--replace', action='store_true',
+                            help="Mark available items missing from the file unavailable")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate and count without writing")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"No such file: {path}")
+
+        try:
+            rows = menu_import.parse(path.read_bytes(), options['format'] or menu_import.detect_format(path.name))
+            result = menu_import.import_rows(rows, replace=options['replace'], dry_run=options['dry_run'])
+        except menu_import.ImportRejected as error:
+            for problem in error.errors:
+                where = f"Row {problem['row']}" if problem['row'] else "File"
+                self.stderr.write(f"{where}: {json.dumps(problem['errors'])}")
+            raise CommandError(f"Import rejected: {error}")
+
+        prefix = "Would have " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}created {result['created']}, updated {result['updated']}, "
+            f"deactivated {result['deactivated']}; {result['unchanged']} unchanged"
+        ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.loadtest import run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a dinner-rush traffic mix against a running server and report "
+        "latency percentiles and throughput per endpoint. Seed the accounts "
+        "first with seed_data, using the same --prefix and --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=60, help="Seconds")
+        parser.add_argument('--waiters', type=int, default=8)
+        parser.add_argument('--cashiers', type=int, default=3)
+        parser.add_argument('--managers', type=int, default=1)
+        parser.add_argument(
+            '--think-time', type=float, default=1.0,
+            help="Average seconds each virtual user waits between requests",
+        )
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--password', default='pass')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['waiters']} waiters, {options['cashiers']} cashiers and "
+            f"{options['managers']} managers against {options['base_url']} "
+            f"for {options['duration']:g}s"
+        )
+        stats, elapsed = run_load(
+            options['base_url'],
+            duration=options['duration'],
+            waiters=options['waiters'],
+            cashiers=options['cashiers'],
+            managers=options['managers'],
+            think_time=options['think_time'],
+            prefix=options['prefix'],
+            password=options['password'],
+            random_seed=options['random_seed'],
+        )
+        rows = stats.report(elapsed)
+        if not rows:
+            raise CommandError(f"No requests completed; is the server running at {options['base_url']}?")
+
+        self.stdout.write(
+            f"\n  {'endpoint':<24}{'requests':>9}{'errors':>8}{'req/s':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        )
+        for name, count, errors, rate, p50, p95, p99, slowest in rows:
+            self.stdout.write(
+                f"  {name:<24}{count:>9}{errors:>8}{rate:>8.1f}"
+                f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{slowest:>9.1f}"
+            )
+        total = sum(row[1] for row in rows)
+        self.stdout.write(f"\n  {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
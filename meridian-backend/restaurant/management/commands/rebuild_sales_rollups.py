@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from restaurant.reporting import SOURCES, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill or rebuild the sales rollups from recorded transactions. "
+        "Defaults to every day from the first transaction until today."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat,
+                            help="First local date to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat,
+                            help="Last local date to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = options['from_date']
+        end = options['to_date'] or timezone.localdate()
+        if start is None:
+            firsts = [
+                payment_model.objects.aggregate(first=Min('created_at'))['first']
+                for payment_model, _ in SOURCES
+            ]
+            firsts = [first for first in firsts if first]
+            start = timezone.localtime(min(firsts)).date() if firsts else end
+
+        count = rebuild(start, end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt sales rollups for {start} to {end} from {count} transaction(s)"
+        ))
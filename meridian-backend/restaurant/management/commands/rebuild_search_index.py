@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the menu search index from the menu table"
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt menu search index ({type(backend).__name__})"))
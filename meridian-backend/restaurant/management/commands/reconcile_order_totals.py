@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.models import Order
+
+
+class Command(BaseCommand):
+    help = "Check stored order totals against their items and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report drifted orders without repairing them",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of orders checked per query (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        fix = not options['dry_run']
+        drifted = Order.objects.reconcile_totals(fix=fix, batch_size=options['batch_size'])
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All order totals are consistent"))
+            return
+
+        action = "Repaired" if fix else "Found"
+        self.stdout.write(f"{action} {len(drifted)} order(s) with drifted totals:")
+        self.stdout.write(", ".join(f"#{pk}" for pk in drifted))
@@ -0,0 +1,34 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from restaurant.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks on a local thread pool until interrupted. "
+        "Start one per machine; several workers share the queue safely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Tasks run at once, before per-task limits (default: 4)")
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help="Seconds to wait when nothing is due (default: 1)")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once nothing is due, e.g. from cron")
+
+    def handle(self, *args, **options):
+        worker = Worker(threads=options['threads'], poll_interval=options['poll'])
+        # Finish the tasks in flight before exiting
+        previous = {
+            signum: signal.signal(signum, lambda *_: worker.stop())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            processed = worker.run(once=options['once'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {processed} task(s)"))
@@ -0,0 +1,54 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from restaurant.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic staff, menu items, orders and payments with lunch and "
+        "dinner peaks. Accounts are named <prefix>-<role>-<n>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--waiters', type=int, default=8)
+        parser.add_argument('--cashiers', type=int, default=3)
+        parser.add_argument('--managers', type=int, default=1)
+        parser.add_argument('--menu-items', type=int, default=120)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--max-lines', type=int, default=6, help="Most lines on one order")
+        parser.add_argument('--days', type=int, default=30, help="Spread orders over this many days")
+        parser.add_argument('--pending', type=int, default=40, help="Newest orders left unpaid")
+        parser.add_argument('--password', default='pass')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        data = seed(
+            waiters=options['waiters'],
+            cashiers=options['cashiers'],
+            managers=options['managers'],
+            menu_items=options['menu_items'],
+            orders=options['orders'],
+            max_lines=options['max_lines'],
+            days=options['days'],
+            pending=options['pending'],
+            password=options['password'],
+            prefix=options['prefix'],
+            random_seed=options['random_seed'],
+        )
+
+        statuses = Counter(order.status for order in data.orders)
+        self.stdout.write(
+            f"Created {len(data.waiters)} waiters, {len(data.cashiers)} cashiers, "
+            f"{len(data.managers)} managers and {len(data.menu)} menu items"
+        )
+        self.stdout.write(
+            f"Created {len(data.orders)} orders ({statuses['pending']} pending, "
+            f"{statuses['completed']} completed, {statuses['cancelled']} cancelled) "
+            f"and {len(data.transactions)} payments"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Log in as {options['prefix']}-waiter-0 / {options['password']} and so on"
+        ))
@@ -0,0 +1,209 @@
+"""
+Bulk import of menu items from CSV or JSON.
+
+Each row names an item by `id`, or else by its exact `name`, and carries
+any of name, description, price, category and available. Matched items
+are updated with the fields given; other rows create items and need a
+name, price and category. With `replace`, available items missing from
+the import are marked unavailable, which is how a seasonal menu swap is
+done in one upload.
+
+All rows are validated in one pass before anything is written, and a
+single error rejects the whole import. The writes are bulk inserts and
+updates in one transaction, and the menu snapshots are invalidated once
+for the batch instead of once per item. The SQLite search index follows
+through its triggers within the same statements.
+"""
+import csv
+import io
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import catalogue
+from .models import MenuItem
+from .serializers import MenuImportRowSerializer
+
+FIELDS = ['name', 'description', 'price', 'category', 'available']
+
+# Needed to create an item; updates may give any subset of FIELDS
+REQUIRED_FOR_NEW = ['name', 'price', 'category']
+
+BATCH_SIZE = 500
+
+
+class ImportRejected(Exception):
+    """The import has invalid rows; `errors` lists them by 1-based row number"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid row(s)")
+        self.errors = errors
+
+
+def detect_format(filename='', content_type=''):
+    if filename.lower().endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return 'json'
+
+
+def parse(content, file_format):
+    """Rows of a CSV or JSON document as a list of dicts"""
+    try:
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        if file_format == 'csv':
+            rows = []
+            for row in csv.DictReader(io.StringIO(content)):
+                cells = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+                # A blank cell leaves the field as it is, except for descriptions
+                rows.append({
+                    key: value for key, value in cells.items()
+                    if value or key == 'description'
+                })
+            return rows
+        data = json.loads(content)
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as error:
+        raise ImportRejected([{'row': None, 'errors': {'file': [str(error)]}}])
+    return from_data(data)
+
+
+def from_data(data):
+    """Rows of decoded JSON: a list of items, or an object with an `items` list"""
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ImportRejected([{'row': None, 'errors': {
+            'file': ["Expected a list of items, or an object with an `items` list."]
+        }}])
+    return data
+
+
+def validate(rows):
+    """
+    Check every row and match it to an existing item.
+
+    Returns [(item or None, fields)] in row order, or raises ImportRejected
+    with the problems of every row at once. Existing items are read with
+    at most two queries.
+    """
+    child = MenuImportRowSerializer()
+    errors = {}
+    validated = []
+    for number, row in enumerate(rows, 1):
+        try:
+            validated.append((number, child.run_validation(row)))
+        except ValidationError as error:
+            errors[number] = error.detail
+
+    ids = [data['id'] for _, data in validated if 'id' in data]
+    names = [data['name'] for _, data in validated if 'id' not in data and 'name' in data]
+    by_id = MenuItem.objects.in_bulk(ids)
+    by_name = {}
+    name_counts = Counter()
+    for item in MenuItem.objects.filter(name__in=names):
+        by_name[item.name] = item
+        name_counts[item.name] += 1
+
+    checked = []
+    for number, data in validated:
+        problems = {}
+        if 'id' in data:
+            item = by_id.get(data['id'])
+            if item is None:
+                problems['id'] = [f"No menu item has id {data['id']}."]
+        else:
+            item = by_name.get(data.get('name'))
+            if name_counts[data.get('name')] > 1:
+                problems['name'] = ["Several menu items have this name; give the id instead."]
+            elif item is None:
+                for field in REQUIRED_FOR_NEW:
+                    if field not in data:
+                        problems[field] = ["This field is required for new items."]
+        checked.append((number, data, item, problems))
+
+    # Rows are duplicates when they reach the same item, whether by id or by
+    # name, or would create items with the same name
+    def target(data, item):
+        if item is not None:
+            return ('item', item.pk)
+        if 'id' not in data and data.get('name'):
+            return ('name', data['name'])
+        return None
+
+    targets = Counter(target(data, item) for _, data, item, _ in checked)
+    matched = []
+    for number, data, item, problems in checked:
+        key = target(data, item)
+        if key is not None and targets[key] > 1:
+            problems['non_field_errors'] = [
+                f"Another row also updates menu item {key[1]}." if key[0] == 'item'
+                else f"Another row also creates {key[1]!r}."
+            ]
+        if problems:
+            errors[number] = problems
+        else:
+            matched.append((item, {field: data[field] for field in FIELDS if field in data}))
+
+    if errors:
+        raise ImportRejected([
+            {'row': number, 'errors': problems} for number, problems in sorted(errors.items())
+        ])
+    return matched
+
+
+def import_rows(rows, replace=False, dry_run=False):
+    """
+    Validate and apply an import; returns how many items were created,
+    updated, left unchanged and, with `replace`, made unavailable.
+    """
+    matched = validate(rows)
+    now = timezone.now()
+
+    created, updated, changed_fields = [], [], set()
+    unchanged = 0
+    for item, fields in matched:
+        if item is None:
+            created.append(MenuItem(**fields))
+            continue
+        changes = {field: value for field, value in fields.items() if getattr(item, field) != value}
+        if not changes:
+            unchanged += 1
+            continue
+        for field, value in changes.items():
+            setattr(item, field, value)
+        item.updated_at = now
+        changed_fields.update(changes)
+        updated.append(item)
+
+    kept = [item.pk for item, _ in matched if item is not None]
+    stale = MenuItem.objects.filter(available=True).exclude(pk__in=kept)
+    result = {
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': unchanged,
+        'deactivated': 0,
+        'dry_run': dry_run,
+    }
+    if dry_run:
+        if replace:
+            result['deactivated'] = stale.count()
+        return result
+
+    with transaction.atomic():
+        MenuItem.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        if updated:
+            MenuItem.objects.bulk_update(
+                updated, sorted(changed_fields) + ['updated_at'], batch_size=BATCH_SIZE
+            )
+        if replace:
+            # Created items are new and never stale
+            result['deactivated'] = stale.exclude(
+                pk__in=[item.pk for item in created]
+            ).update(available=False, updated_at=now)
+        if created or updated or result['deactivated']:
+            # Bulk writes send no signals; one new version for the whole batch
+            catalogue.bump_version()
+    return result
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 12:15
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('restaurant.migrations.0003_menu_search_index')
+
+# SQLite adds this column by rebuilding restaurant_menuitem, which drops the
+# triggers that keep the search index in sync; both directions restore them
+RESTORE_TRIGGERS = [
+    statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS')
+    for statement in search_index.CREATE_INDEX
+    if 'CREATE TRIGGER' in statement
+] + [f"INSERT INTO {search_index.FTS_TABLE}({search_index.FTS_TABLE}) VALUES ('rebuild')"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, search_index.run_on_sqlite(RESTORE_TRIGGERS)),
+        migrations.AddField(
+            model_name='menuitem',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(search_index.run_on_sqlite(RESTORE_TRIGGERS), migrations.RunPython.noop),
+    ]
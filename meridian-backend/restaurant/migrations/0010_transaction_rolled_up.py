@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+def mark_recorded_payments(apps, schema_editor):
+    # Existing payments are in the rollups, unless their task is still queued
+    Task = apps.get_model('restaurant', 'Task')
+    Transaction = apps.get_model('restaurant', 'Transaction')
+    pending = {
+        args[0] for args in Task.objects.filter(
+            name='restaurant.reporting.record_payment', status__in=['queued', 'running']
+        ).values_list('args', flat=True)
+    }
+    Transaction.objects.exclude(pk__in=pending).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0009_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='rolled_up',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_recorded_payments, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
+from decimal import Decimal
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from .pricing import line_subtotal, price_breakdown
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -13,6 +19,16 @@ class User(AbstractUser):
     
     def __str__(self):
         return f"{self.username} ({self.role})"
+    
+    def get_session_auth_hash(self):
+        # Sessions sign the role too, so changing it signs the user out
+        # everywhere. Sessions checked against SECRET_KEY_FALLBACKS use
+        # Django's password-only hash and end once, after a key rotation.
+        return salted_hmac(
+            'restaurant.User.get_session_auth_hash',
+            f'{self.password}:{self.role}',
+            algorithm='sha256',
+        ).hexdigest()
 
 
 class MenuItem(models.Model):
@@ -32,6 +48,8 @@ class MenuItem(models.Model):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     available = models.BooleanField(default=True)
     image = models.ImageField(upload_to='menu_items/', blank=True, null=True)
+    # Resized copies of `image` by format and width; see restaurant.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -42,6 +60,114 @@ class MenuItem(models.Model):
         return self.name
 
 
+# Order fields derived from the order items
+TOTAL_FIELDS = ['subtotal', 'vat', 'service_fee', 'total']
+
+
+class OrderManager(models.Manager):
+    def create_with_items(self, waiter, table_number, lines, notes=''):
+        """
+        Create an order together with all of its lines.
+
+        `lines` is a list of (menu_item, quantity, special_instructions)
+        tuples with the menu items already resolved. Totals are computed once
+        up front and the lines are inserted with a single bulk write, so the
+        number of queries does not depend on the size of the order.
+        """
+        items = [
+            OrderItem(
+                menu_item=menu_item,
+                quantity=quantity,
+                price_at_time=menu_item.price,
+                subtotal=line_subtotal(menu_item.price, quantity),
+                special_instructions=special_instructions,
+            )
+            for menu_item, quantity, special_instructions in lines
+        ]
+        totals = price_breakdown(sum((item.subtotal for item in items), 0))
+
+        with transaction.atomic():
+            order = self.create(
+                table_number=table_number,
+                waiter=waiter,
+                notes=notes,
+                **totals
+            )
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+
+        return order
+
+    def apply_subtotal_delta(self, order_id, delta):
+        """
+        Shift the stored totals of an order by a change in its subtotal.
+
+        The subtotal is moved with a database-side update, so concurrent line
+        edits cannot overwrite each other, and VAT, service fee and total are
+        then derived from the new subtotal while the row is still locked by
+        the same transaction. The order items are never read. The order's
+        `updated_at` moves even when the subtotal does not, since the line
+        itself changed and delta sync clients must see it.
+        """
+        if not delta:
+            self.filter(pk=order_id).update(updated_at=timezone.now())
+            return
+
+        with transaction.atomic():
+            updated = self.filter(pk=order_id).update(
+                subtotal=F('subtotal') + delta,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                return
+            subtotal = self.filter(pk=order_id).values_list('subtotal', flat=True).get()
+            totals = price_breakdown(subtotal)
+            del totals['subtotal']
+            self.filter(pk=order_id).update(**totals)
+
+    def reconcile_totals(self, order_ids=None, fix=True, batch_size=500):
+        """
+        Compare stored totals with the sum of the order items and repair drift.
+
+        Orders are scanned in primary key batches with the item subtotals
+        summed by the database. Returns the ids of the orders whose totals did
+        not match; they are rewritten with bulk updates unless `fix` is False.
+        """
+        queryset = self.annotate(
+            items_subtotal=Coalesce(
+                Sum('items__subtotal'), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        ).order_by('pk')
+        if order_ids is not None:
+            queryset = queryset.filter(pk__in=order_ids)
+
+        drifted = []
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            repaired = []
+            for order in batch:
+                totals = price_breakdown(order.items_subtotal)
+                if all(getattr(order, field) == value for field, value in totals.items()):
+                    continue
+                for field, value in totals.items():
+                    setattr(order, field, value)
+                order.updated_at = timezone.now()
+                repaired.append(order)
+
+            drifted.extend(order.pk for order in repaired)
+            if fix and repaired:
+                self.bulk_update(repaired, TOTAL_FIELDS + ['updated_at'])
+
+        return drifted
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -59,39 +185,85 @@ class Order(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderManager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pages, optionally filtered by status or by waiter and status
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            models.Index(fields=['waiter', 'status', 'created_at'], name='order_waiter_status_idx'),
+            # List versions and delta sync, for everyone and per waiter
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+            models.Index(fields=['waiter', 'updated_at'], name='order_waiter_updated_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - Table {self.table_number}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets a later save tell whether the status changed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
     def calculate_totals(self):
-        """Calculate order totals based on items"""
-        from decimal import Decimal
-        
-        # Calculate subtotal from all order items
-        self.subtotal = sum(
-            Decimal(str(item.subtotal)) for item in self.items.all()
-        )
-        
-        # Calculate VAT (12%)
-        self.vat = self.subtotal * Decimal('0.12')
-        
-        # Calculate service fee (10%)
-        self.service_fee = self.subtotal * Decimal('0.10')
-        
-        # Calculate total
-        self.total = self.subtotal + self.vat + self.service_fee
-        
-        self.save()
+        """
+        Recompute the stored totals from the order items.
+
+        Totals are normally kept up to date incrementally by OrderItem, so this
+        is only needed to repair an order whose totals have drifted.
+        """
+        Order.objects.reconcile_totals(order_ids=[self.pk])
+        self.refresh_from_db(fields=TOTAL_FIELDS + ['updated_at'])
         
-        return {
-            'subtotal': float(self.subtotal),
-            'vat': float(self.vat),
-            'service_fee': float(self.service_fee),
-            'total': float(self.total)
-        }
+        return {field: float(getattr(self, field)) for field in TOTAL_FIELDS}
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden column of an SQLite FTS table, queried with `__match`"""
+
+
+@SearchDocumentField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+    
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class MenuItemSearchIndex(models.Model):
+    """
+    SQLite FTS5 index over menu item name, description and category.
+    
+    The table is created and kept in sync by triggers installed in the
+    migrations, so it only exists on SQLite; see restaurant.search.
+    """
+    menu_item = models.OneToOneField(
+        MenuItem, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_index'
+    )
+    document = SearchDocumentField(db_column='restaurant_menuitem_fts')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'restaurant_menuitem_fts'
+
+
+class OrderTombstone(models.Model):
+    """Record of a deleted order, kept so delta sync clients can drop it"""
+    order_id = models.BigIntegerField()
+    waiter_id = models.BigIntegerField(null=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"Order #{self.order_id} deleted"
 
 
 class OrderItem(models.Model):
@@ -102,23 +274,131 @@ class OrderItem(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     special_instructions = models.TextField(blank=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_committed_subtotal()
+        return instance
+    
+    def _remember_committed_subtotal(self):
+        # What this line currently contributes to its order's stored totals;
+        # None for a field that was deferred when the line was loaded
+        self._committed = (self.__dict__.get('order_id'), self.__dict__.get('subtotal'))
+    
+    def _committed_line(self):
+        """(order id, subtotal) of this line as stored, or (None, None) when unsaved"""
+        committed = getattr(self, '_committed', (None, None))
+        if self.pk is not None and None in committed:
+            # Loaded with deferred fields, or bulk created: ask the database
+            committed = OrderItem.objects.filter(pk=self.pk).values_list(
+                'order_id', 'subtotal'
+            ).first() or (None, None)
+        return committed
+    
     def save(self, *args, **kwargs):
-        from decimal import Decimal
         # Auto-calculate subtotal
-        self.subtotal = Decimal(str(self.price_at_time)) * self.quantity
-        super().save(*args, **kwargs)
-        # Update order totals after saving item
-        self.order.calculate_totals()
+        self.subtotal = line_subtotal(self.price_at_time, self.quantity)
+        
+        with transaction.atomic():
+            previous_order_id, previous_subtotal = self._committed_line()
+            super().save(*args, **kwargs)
+            # Apply only the change in this line to the order totals
+            if previous_order_id is not None and previous_order_id != self.order_id:
+                Order.objects.apply_subtotal_delta(previous_order_id, -previous_subtotal)
+                previous_subtotal = None
+            Order.objects.apply_subtotal_delta(
+                self.order_id, self.subtotal - (previous_subtotal or 0)
+            )
+        
+        self._remember_committed_subtotal()
     
     def delete(self, *args, **kwargs):
-        order = self.order
-        super().delete(*args, **kwargs)
-        # Recalculate order totals after deleting item
-        order.calculate_totals()
+        with transaction.atomic():
+            order_id, subtotal = self._committed_line()
+            if 'order_id' not in self.__dict__:
+                # Delete receivers read it after the row is gone
+                self.order_id = order_id
+            result = super().delete(*args, **kwargs)
+            # Take the removed line out of the order totals
+            Order.objects.apply_subtotal_delta(order_id, -(subtotal or 0))
+        
+        return result
     
     def __str__(self):
         return f"{self.quantity}x {self.menu_item.name}"
 
+class PaymentRejected(Exception):
+    """The payment details cannot settle the order"""
+
+
+class OrderNotPayable(Exception):
+    """The order is not waiting for payment, or the key belongs to another order"""
+
+
+class TransactionManager(models.Manager):
+    def checkout(self, order_id, cashier, payment_method, details=None, idempotency_key=None):
+        """
+        Pay a pending order and mark it completed, all in one transaction.
+
+        The order row is locked while its status is checked, so two cashiers
+        cannot both charge it. With an `idempotency_key`, a retried request
+        returns the payment the first attempt recorded, and leaves the
+        order alone. Returns (transaction, created). Raises
+        Order.DoesNotExist, PaymentRejected or OrderNotPayable.
+        """
+        replayed = idempotency_key and self._replay(order_id, idempotency_key)
+        if replayed:
+            return replayed, False
+
+        try:
+            with transaction.atomic():
+                order = self._lock_order(order_id)
+                # Checked again under the lock, for a retry that waited on the first attempt
+                replayed = idempotency_key and self._replay(order_id, idempotency_key)
+                if replayed:
+                    return replayed, False
+                if order.status != 'pending':
+                    raise OrderNotPayable(f"Order #{order.pk} is {order.status}")
+
+                payment = self.model(
+                    order=order,
+                    cashier=cashier,
+                    payment_method=payment_method,
+                    amount=order.total,
+                    idempotency_key=idempotency_key or None,
+                )
+                payment.apply_details(details or {})
+                payment.save(force_insert=True)
+
+                order.status = 'completed'
+                order.save(update_fields=['status', 'updated_at'])
+        except IntegrityError:
+            # A concurrent checkout of this order or with this key won the race
+            replayed = idempotency_key and self._replay(order_id, idempotency_key)
+            if replayed:
+                return replayed, False
+            raise OrderNotPayable(f"Order #{order_id} is already paid")
+
+        return payment, True
+
+    def _lock_order(self, order_id):
+        rows = Order.objects.filter(pk=order_id)
+        immediate = connection.settings_dict['OPTIONS'].get('transaction_mode') == 'IMMEDIATE'
+        if not connection.features.has_select_for_update and not immediate:
+            # No row locks on SQLite: take the database write lock before
+            # reading, since a read transaction cannot safely upgrade later
+            rows.update(status=F('status'))
+        return rows.select_for_update().get()
+
+    def _replay(self, order_id, idempotency_key):
+        payment = self.select_related('order', 'cashier').filter(
+            idempotency_key=idempotency_key
+        ).first()
+        if payment is not None and payment.order_id != order_id:
+            raise OrderNotPayable("Idempotency key was already used for another order")
+        return payment
+
+
 class Transaction(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Cash'),
@@ -144,10 +424,183 @@ class Transaction(models.Model):
     account_identifier = models.CharField(max_length=200, blank=True)  # Phone/Email
     account_name = models.CharField(max_length=200, blank=True)
     
+    # Client supplied key that makes retried checkouts safe
+    idempotency_key = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+    
+    # Set with the rollup increments; only a rolled up payment is taken out again
+    rolled_up = models.BooleanField(default=False, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = TransactionManager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Date range filters and keyset pages
+            models.Index(fields=['created_at', 'id'], name='transaction_created_idx'),
+        ]
     
     def __str__(self):
         return f"Transaction #{self.id} - Order #{self.order.id}"
+    
+    def apply_details(self, details):
+        """Fill in the method-specific fields from the checkout request"""
+        if self.payment_method == 'cash':
+            amount_received = details.get('amount_received')
+            if amount_received is None or amount_received < self.amount:
+                raise PaymentRejected(f"Cash received must cover the total of {self.amount}")
+            self.amount_received = amount_received
+            self.change_given = amount_received - self.amount
+        
+        elif self.payment_method == 'card':
+            card_number = details.get('card_number', '')
+            self.card_last_four = card_number.replace(' ', '')[-4:]
+            self.cardholder_name = details.get('cardholder_name', '')
+        
+        elif self.payment_method in ['gcash', 'paypal']:
+            self.account_identifier = details.get('account_identifier', '')
+            self.account_name = details.get('account_name', '')
+
+
+class SalesRollup(models.Model):
+    """
+    Pre-aggregated sales for one time bucket and one slice of a dimension.
+    
+    Rows are maintained incrementally as payments are recorded and can be
+    rebuilt from transactions; see restaurant.reporting.
+    """
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('hour', 'Hour'),
+    ]
+    
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('payment_method', 'Payment Method'),
+        ('cashier', 'Cashier'),
+        ('category', 'Menu Category'),
+    ]
+    
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=50, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vat = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    service_fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['bucket', 'key']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'dimension', 'bucket', 'key'], name='unique_sales_rollup'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.dimension}={self.key}"
+
+
+# Cold storage for finished orders, filled by restaurant.archive. Rows keep
+# their ids, and relations keep their names, so the order and transaction
+# serializers read them the same way as the hot rows.
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    table_number = models.IntegerField()
+    waiter = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    vat = models.DecimalField(max_digits=10, decimal_places=2)
+    service_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_order_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived order #{self.id} - Table {self.table_number}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.PROTECT, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price_at_time = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    special_instructions = models.TextField(blank=True)
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.menu_item.name}"
+
+
+class ArchivedTransaction(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.OneToOneField(ArchivedOrder, on_delete=models.CASCADE, related_name='transaction')
+    cashier = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    payment_method = models.CharField(max_length=20, choices=Transaction.PAYMENT_METHOD_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount_received = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    change_given = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    card_last_four = models.CharField(max_length=4, blank=True)
+    cardholder_name = models.CharField(max_length=200, blank=True)
+    account_identifier = models.CharField(max_length=200, blank=True)
+    account_name = models.CharField(max_length=200, blank=True)
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, editable=False)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_txn_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived transaction #{self.id} - Order #{self.order_id}"
+
+
+class Task(models.Model):
+    """
+    A unit of background work, recorded in the transaction that asked for it.
+    
+    `name` is the dotted path of a function registered with
+    restaurant.tasks.task; the worker started by `manage.py run_tasks`
+    claims due rows and calls it with `args`.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Due tasks in order, and stale running ones
+            models.Index(fields=['status', 'run_after', 'id'], name='task_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Task #{self.id} {self.name} ({self.status})"
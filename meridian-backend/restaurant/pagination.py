@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+from operator import attrgetter
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the last row of the previous page.
+
+    The ordering must be unique, e.g. (-created_at, -id), so every row has a
+    stable position even when timestamps tie. Each page is one indexed range
+    query for `page_size + 1` rows: no OFFSET and no COUNT(*), so the cost of
+    a page does not grow with the table. Views may set `keyset_ordering`.
+
+    A list of querysets with the same ordering fields, such as hot and
+    archived rows, is paged as one: each is read with the same seek and
+    the rows are merged.
+    """
+    ordering = ('-created_at', '-id')
+    # Views may ask for up to max_page_size rows with ?page_size=
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = getattr(view, 'keyset_ordering', self.ordering)
+        page_size = self.get_page_size(request)
+
+        querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        position = self.decode_cursor(request, querysets[0].model)
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.fields)
+            if position is not None:
+                queryset = queryset.filter(self.after(position))
+            rows.extend(queryset[:page_size + 1])
+        if len(querysets) > 1:
+            # Stable sorts from the last field to the first
+            for field in reversed(self.fields):
+                rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = [
+                getattr(rows[-1], field.lstrip('-')) for field in self.fields
+            ]
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, position):
+        """Rows strictly after `position` in the ordering, as a lexicographic Q"""
+        condition = Q()
+        for index in reversed(range(len(self.fields))):
+            field = self.fields[index]
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            if condition:
+                step |= Q(**{name: position[index]}) & condition
+            condition = step
+        return condition
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,8 +1,23 @@
 from rest_framework import permissions
 
+# Roles that work with orders; customers are the remaining role
+STAFF_ROLES = {'waiter', 'cashier', 'manager'}
+
+
 class IsManager(permissions.BasePermission):
     """
     Allows access only to users with role='manager'.
     """
     def has_permission(self, request, view):
-        return bool(request.user and request.user.is_authenticated and request.user.role == 'manager')
\ No newline at end of file
+        return bool(request.user and request.user.is_authenticated and request.user.role == 'manager')
+
+
+class IsStaff(permissions.BasePermission):
+    """
+    Allows access only to waiters, cashiers and managers.
+    """
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and getattr(request.user, 'role', None) in STAFF_ROLES
+        )
@@ -0,0 +1,38 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Rates applied on top of the order subtotal
+VAT_RATE = Decimal('0.12')
+SERVICE_FEE_RATE = Decimal('0.10')
+
+CENT = Decimal('0.01')
+
+
+def to_money(value):
+    """Convert a number to a Decimal rounded to whole cents"""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_subtotal(price, quantity):
+    """Subtotal of a single order line"""
+    return to_money(to_money(price) * quantity)
+
+
+def price_breakdown(subtotal):
+    """
+    Return the subtotal, VAT, service fee and total for an order subtotal.
+
+    Every amount is rounded to cents and the total is the sum of the rounded
+    parts, so a receipt always adds up.
+    """
+    subtotal = to_money(subtotal)
+    vat = to_money(subtotal * VAT_RATE)
+    service_fee = to_money(subtotal * SERVICE_FEE_RATE)
+
+    return {
+        'subtotal': subtotal,
+        'vat': vat,
+        'service_fee': service_fee,
+        'total': subtotal + vat + service_fee,
+    }
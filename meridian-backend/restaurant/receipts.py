@@ -0,0 +1,182 @@
+"""
+Receipts rendered once per payment and served from the cache.
+
+A payment does not change after checkout, so each of its receipts is
+rendered on its first request and then kept in the cache: as plain text
+laid out for a thermal printer (RECEIPT_WIDTH columns), as HTML sized for
+80 mm paper, and as a PDF of that HTML when weasyprint is installed.
+Point RECEIPT_CACHE_ALIAS at a shared cache to render each receipt once
+across worker processes. Keys carry LAYOUT_VERSION; bump it when the
+layout changes.
+
+Archived payments (see restaurant.archive) render the same way.
+"""
+import hashlib
+import textwrap
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import ArchivedTransaction, Transaction
+
+try:
+    import weasyprint
+except ImportError:
+    weasyprint = None
+
+LAYOUT_VERSION = 1
+
+KINDS = ('text', 'html', 'pdf')
+
+CONTENT_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+HEADER = 'MERIDIAN'
+FOOTER = 'Thank you for dining with Meridian'
+
+
+def _cache():
+    return caches[getattr(settings, 'RECEIPT_CACHE_ALIAS', 'default')]
+
+
+def cache_key(transaction_id, kind):
+    return f'receipt:{LAYOUT_VERSION}:{transaction_id}:{kind}'
+
+
+def available(kind):
+    return kind != 'pdf' or weasyprint is not None
+
+
+def load(transaction_ids):
+    """Payments by id, hot or archived, with everything a receipt shows"""
+    found = {}
+    for model in (Transaction, ArchivedTransaction):
+        missing = [pk for pk in transaction_ids if pk not in found]
+        if not missing:
+            break
+        found.update(
+            model.objects.filter(pk__in=missing)
+            .select_related('order', 'cashier')
+            .prefetch_related('order__items__menu_item')
+            .in_bulk()
+        )
+    return found
+
+
+def receipt_context(payment):
+    order = payment.order
+    cashier = payment.cashier
+    return {
+        'header': HEADER,
+        'footer': FOOTER,
+        'payment': payment,
+        'order': order,
+        'items': [
+            {
+                'name': item.menu_item.name,
+                'quantity': item.quantity,
+                'subtotal': item.subtotal,
+                'special_instructions': item.special_instructions,
+            }
+            for item in sorted(order.items.all(), key=lambda item: item.pk)
+        ],
+        'cashier': (cashier.get_full_name() or cashier.username) if cashier else '',
+        'method': payment.get_payment_method_display(),
+        'paid_at': timezone.localtime(payment.created_at),
+    }
+
+
+def _line(left, right='', width=42):
+    room = width - len(right) - 1 if right else width
+    return f'{left[:room]:<{room}}' + (f' {right}' if right else '')
+
+
+def render_text(context, width=None):
+    """The receipt as monospaced lines for a thermal printer"""
+    width = width or getattr(settings, 'RECEIPT_WIDTH', 42)
+    payment, order = context['payment'], context['order']
+    rule = '-' * width
+    lines = [
+        context['header'].center(width).rstrip(),
+        _line(f"{context['paid_at']:%Y-%m-%d %H:%M}", f'Table {order.table_number}', width),
+        _line(f'Order #{order.pk}', f'Receipt #{payment.pk}', width),
+    ]
+    if context['cashier']:
+        lines.append(_line(f"Cashier: {context['cashier']}", width=width))
+    lines.append(rule)
+
+    for item in context['items']:
+        name = textwrap.wrap(f"{item['quantity']} x {item['name']}", width - 12) or ['']
+        lines.append(_line(name[0], f"{item['subtotal']:.2f}", width))
+        lines.extend(_line(f'    {part}', width=width) for part in name[1:])
+        for note in textwrap.wrap(item['special_instructions'], width - 4):
+            lines.append(_line(f'    {note}', width=width))
+
+    lines += [
+        rule,
+        _line('Subtotal', f'{order.subtotal:.2f}', width),
+        _line('VAT', f'{order.vat:.2f}', width),
+        _line('Service fee', f'{order.service_fee:.2f}', width),
+        _line('TOTAL', f'{payment.amount:.2f}', width),
+        rule,
+        _line(context['method'], f'{payment.amount:.2f}', width),
+    ]
+    if payment.payment_method == 'cash' and payment.amount_received is not None:
+        lines.append(_line('Cash received', f'{payment.amount_received:.2f}', width))
+        lines.append(_line('Change', f'{payment.change_given:.2f}', width))
+    elif payment.card_last_four:
+        lines.append(_line(f'Card **** {payment.card_last_four}', width=width))
+    elif payment.account_identifier:
+        lines.append(_line(f'Account {payment.account_identifier}', width=width))
+    lines += ['', context['footer'].center(width).rstrip(), '']
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def render(payment, kinds):
+    """Render a payment's receipts; returns {kind: (body, etag)}"""
+    context = receipt_context(payment)
+    bodies = {}
+    if 'text' in kinds:
+        bodies['text'] = render_text(context).encode()
+    if 'html' in kinds or 'pdf' in kinds:
+        html = render_to_string('restaurant/receipt.html', context)
+        if 'html' in kinds:
+            bodies['html'] = html.encode()
+        if 'pdf' in kinds:
+            bodies['pdf'] = weasyprint.HTML(string=html).write_pdf()
+    return {kind: (body, f'"{hashlib.sha1(body).hexdigest()}"') for kind, body in bodies.items()}
+
+
+def get_many(transaction_ids, kind):
+    """
+    Receipts of several payments, {transaction id: (body, etag)}.
+
+    Cached receipts are read with one cache call; the rest are loaded with a
+    few queries, rendered and stored. Unknown ids are left out.
+    """
+    keys = {cache_key(pk, kind): pk for pk in transaction_ids}
+    found = {keys[key]: value for key, value in _cache().get_many(keys).items()}
+
+    missing = [pk for pk in transaction_ids if pk not in found]
+    if missing:
+        rendered = {
+            pk: render(payment, [kind])[kind] for pk, payment in load(missing).items()
+        }
+        _cache().set_many(
+            {cache_key(pk, kind): value for pk, value in rendered.items()}, timeout=CACHE_TIMEOUT
+        )
+        found.update(rendered)
+    return found
+
+
+def get(transaction_id, kind):
+    """One payment's receipt as (body, etag), or None when there is no such payment"""
+    return get_many([transaction_id], kind).get(transaction_id)
+
@@ -0,0 +1,223 @@
+"""
+Sales reporting from incrementally maintained rollups.
+
+Every recorded payment adds its order to one SalesRollup row per period
+(day, hour) and per dimension slice: the overall total, its payment method,
+its cashier and each menu category on the order. Reports then read those
+rows instead of scanning transactions and order items.
+
+Category rows count item sales: `subtotal` is the category's share of the
+order subtotal and VAT, service fee and revenue are priced from it.
+
+Payments are added by a task (see restaurant.tasks), so checkout only
+queues the work; rollups trail the payments by the worker's delay. The
+task marks the payment `rolled_up`, and deleting a payment subtracts it
+only when it carries that mark.
+
+Rebuilds read archived payments too (see restaurant.archive), so rollups
+for old days can be recomputed after their orders left the hot tables.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrderItem, ArchivedTransaction, OrderItem, SalesRollup, Transaction,
+)
+from .pricing import price_breakdown
+from . import tasks
+from .utils import local_day_bounds
+
+PERIODS = ('day', 'hour')
+MEASURES = ('orders', 'items_sold', 'subtotal', 'vat', 'service_fee', 'revenue')
+
+# Payments and the lines of their orders, hot and archived
+SOURCES = ((Transaction, OrderItem), (ArchivedTransaction, ArchivedOrderItem))
+
+
+def bucket_start(moment, period):
+    """Start of the local day or hour that `moment` falls in"""
+    local = timezone.localtime(moment)
+    if period == 'day':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def category_lines(order_ids, item_model=OrderItem):
+    """Map order id -> {category: (items sold, subtotal)} with one query"""
+    lines = defaultdict(dict)
+    rows = item_model.objects.filter(order_id__in=order_ids).values(
+        'order_id', 'menu_item__category'
+    ).annotate(quantity=Sum('quantity'), amount=Sum('subtotal')).order_by()
+    for row in rows:
+        lines[row['order_id']][row['menu_item__category']] = (row['quantity'], row['amount'])
+    return lines
+
+
+def contributions(payment, categories):
+    """
+    Yield (dimension, key, measures) for everything one payment adds.
+
+    `categories` maps each menu category on the order to its
+    (items sold, subtotal), as returned by category_lines.
+    """
+    order = payment.order
+    items_sold = sum(quantity for quantity, _ in categories.values())
+    order_measures = {
+        'orders': 1,
+        'items_sold': items_sold,
+        'subtotal': order.subtotal,
+        'vat': order.vat,
+        'service_fee': order.service_fee,
+        'revenue': payment.amount,
+    }
+    yield 'total', '', order_measures
+    yield 'payment_method', payment.payment_method, order_measures
+    yield 'cashier', str(payment.cashier_id or ''), order_measures
+
+    for category, (quantity, amount) in categories.items():
+        totals = price_breakdown(amount)
+        yield 'category', category, {
+            'orders': 1,
+            'items_sold': quantity,
+            'subtotal': totals['subtotal'],
+            'vat': totals['vat'],
+            'service_fee': totals['service_fee'],
+            'revenue': totals['total'],
+        }
+
+
+def record_transaction(payment, sign=1):
+    """
+    Add a payment to the rollups, or take it out again with sign=-1.
+
+    Each row is bumped with a database-side increment, so concurrent
+    payments landing in the same bucket cannot lose updates.
+    """
+    categories = category_lines([payment.order_id])[payment.order_id]
+
+    with transaction.atomic():
+        for period in PERIODS:
+            bucket = bucket_start(payment.created_at, period)
+            for dimension, key, measures in contributions(payment, categories):
+                _increment(period, bucket, dimension, key, measures, sign)
+
+
+@tasks.task(atomic=True)
+def record_payment(transaction_id):
+    """Add a committed payment to the rollups, once"""
+    # Marked in the same transaction as the increments. No row: removed
+    # before the task ran, or archived; already set: a rebuild counted it
+    if Transaction.objects.filter(pk=transaction_id, rolled_up=False).update(rolled_up=True):
+        record_transaction(Transaction.objects.select_related('order').get(pk=transaction_id))
+
+
+def roll_back(payment):
+    """Take a payment that is being deleted out of the rollups, if it was added"""
+    rolled_up = Transaction.objects.select_for_update().filter(
+        pk=payment.pk
+    ).values_list('rolled_up', flat=True).first()
+    if rolled_up:
+        record_transaction(payment, sign=-1)
+
+
+def _increment(period, bucket, dimension, key, measures, sign):
+    lookup = {'period': period, 'bucket': bucket, 'dimension': dimension, 'key': key}
+    changes = {name: F(name) + sign * value for name, value in measures.items()}
+
+    if SalesRollup.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(
+                **lookup, **{name: sign * value for name, value in measures.items()}
+            )
+    except IntegrityError:
+        # Another payment created the row first
+        SalesRollup.objects.filter(**lookup).update(**changes)
+
+
+def rebuild(start, end, batch_size=1000):
+    """
+    Recompute the rollups for payments made between two local dates.
+
+    Everything happens in one transaction. It first marks every hot payment
+    in the range as rolled up, which locks those rows (and takes the write
+    lock on SQLite): a record_payment task already running commits first,
+    and queued ones then find nothing to add. Payments made while the
+    rebuild runs stay unmarked and are added by their own tasks afterwards.
+    Whole days from `start` up to and including `end` are then cleared and
+    rebuilt in memory from the marked and the archived payments, and
+    written in bulk. Returns the number of transactions read.
+    """
+    start_at, end_at = local_day_bounds(start, end)
+
+    rows = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    count = 0
+    with transaction.atomic():
+        Transaction.objects.filter(
+            created_at__gte=start_at, created_at__lt=end_at
+        ).update(rolled_up=True)
+        SalesRollup.objects.filter(bucket__gte=start_at, bucket__lt=end_at).delete()
+
+        for payment_model, item_model in SOURCES:
+            payments = payment_model.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+            if payment_model is Transaction:
+                payments = payments.filter(rolled_up=True)
+
+            batch = []
+            for payment in payments.select_related('order').order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(payment)
+                if len(batch) == batch_size:
+                    count += _accumulate(rows, batch, item_model)
+                    batch = []
+            count += _accumulate(rows, batch, item_model)
+
+        SalesRollup.objects.bulk_create(
+            [
+                SalesRollup(period=period, bucket=bucket, dimension=dimension, key=key, **measures)
+                for (period, bucket, dimension, key), measures in rows.items()
+            ],
+            batch_size=batch_size,
+        )
+
+    return count
+
+
+def _accumulate(rows, payments, item_model):
+    if not payments:
+        return 0
+    lines = category_lines([payment.order_id for payment in payments], item_model)
+    for payment in payments:
+        for period in PERIODS:
+            bucket = bucket_start(payment.created_at, period)
+            for dimension, key, measures in contributions(payment, lines[payment.order_id]):
+                row = rows[(period, bucket, dimension, key)]
+                for name, value in measures.items():
+                    row[name] += value
+    return len(payments)
+
+
+def sales_report(start, end, period='day', dimension='total'):
+    """
+    Rollup rows for local dates `start` to `end` inclusive, oldest first.
+
+    Each row carries the bucket, the dimension key, the summed measures and
+    the average ticket size.
+    """
+    start_at, end_at = local_day_bounds(start, end)
+
+    rows = SalesRollup.objects.filter(
+        period=period, dimension=dimension, bucket__gte=start_at, bucket__lt=end_at
+    ).values('bucket', 'key', *MEASURES).order_by('bucket', 'key')
+
+    report = []
+    for row in rows:
+        row['average_ticket'] = (
+            (row['revenue'] / row['orders']).quantize(Decimal('0.01')) if row['orders'] else Decimal('0')
+        )
+        report.append(row)
+    return report
@@ -0,0 +1,112 @@
+"""
+Read-replica routing.
+
+Safe requests (GET, HEAD, OPTIONS) to the views in restaurant/views.py read
+from one of the aliases in the DATABASE_REPLICAS setting. Everything else
+reads from and writes to the primary, 'default': unsafe requests, the admin,
+management commands and background work.
+
+Replicas lag the primary, so two rules keep read-your-writes:
+
+- Once a request writes, the rest of it reads from the primary.
+- The response to a request that wrote sets a short-lived cookie, and the
+  client's requests read from the primary while it lasts. Its lifetime is
+  the REPLICA_STALENESS setting, in seconds: the replication lag tolerated.
+  A waiter who just posted an order sees it in their next poll.
+
+With no replicas configured every query goes to 'default'.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary'
+
+# Views whose safe requests may read from a replica
+REPLICA_VIEW_MODULES = ('restaurant.views',)
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    """Where the current request may read from"""
+
+    def __init__(self):
+        self.replica_reads = False
+        self.wrote = False
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+class ReplicaRouter:
+    """Send reads allowed by ReplicaRoutingMiddleware to a replica"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        aliases = replicas()
+        if state is not None and state.replica_reads and aliases:
+            return random.choice(aliases)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.replica_reads = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Decide per request whether reads may go to a replica"""
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STALENESS', 5),
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if (
+            state is not None
+            and not state.wrote
+            and request.method in self.SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+            and view_func.__module__ in REPLICA_VIEW_MODULES
+        ):
+            state.replica_reads = True
+        return None
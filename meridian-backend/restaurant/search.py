@@ -0,0 +1,97 @@
+"""
+Ranked full-text search over the menu.
+
+`get_backend()` picks the implementation for the current database:
+SQLite uses an FTS5 index maintained by triggers, PostgreSQL uses its
+built-in text search, and anything else falls back to `icontains`. Set
+MENU_SEARCH_BACKEND to a dotted path to choose one explicitly.
+
+Every backend matches each search word as a prefix, so type-ahead input
+such as "chick sou" finds "Chicken Soup".
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+# Created, ranked and kept in sync by triggers in migration 0003
+FTS_TABLE = 'restaurant_menuitem_fts'
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text)
+
+
+class ContainsSearchBackend:
+    """Unranked substring search; works on every database but scans the table"""
+
+    def search(self, queryset, text):
+        for term in search_terms(text):
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term)
+                | Q(category__icontains=term)
+            )
+        return queryset
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 index joined to the menu table and ordered by bm25 rank.
+
+    The index is an external-content table kept in sync by triggers, so
+    saves, deletes and bulk writes all update it without application code.
+    """
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        # Quoted terms cannot inject FTS syntax; '*' makes each one a prefix
+        query = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(search_index__document__match=query).order_by(
+            'search_index__rank', 'name'
+        )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class PostgresSearchBackend:
+    """PostgreSQL text search with the same weighting and prefix matching"""
+
+    def search(self, queryset, text):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        vector = (
+            SearchVector('name', weight='A')
+            + SearchVector('description', weight='B')
+            + SearchVector('category', weight='C')
+        )
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw')
+        return queryset.annotate(
+            search_document=vector, search_rank=SearchRank(vector, query)
+        ).filter(search_document=query).order_by('-search_rank', 'name')
+
+    def rebuild(self):
+        pass
+
+
+def get_backend():
+    path = getattr(settings, 'MENU_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return ContainsSearchBackend()
+
@@ -0,0 +1,186 @@
+"""
+Realistic synthetic data for benchmarks, budgets and load tests.
+
+Everything is written with bulk inserts, so seeding thousands of orders
+takes seconds. Totals are priced the same way as `create_with_items`, and
+the sales rollups are rebuilt afterwards because bulk inserts do not send
+the signals that normally maintain them.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import reporting
+from .models import User, MenuItem, Order, OrderItem, Transaction
+from .pricing import line_subtotal, price_breakdown
+
+WORDS = (
+    'chicken beef pork shrimp tofu garlic butter lemon pepper spicy grilled roasted '
+    'braised crispy sweet sour soup salad noodle rice adobo sinigang kare mango '
+    'coconut ube leche flan tea coffee juice ginger basil tomato cheese mushroom'
+).split()
+
+# Relative order volume per opening hour: a lunch peak and a bigger dinner rush
+HOUR_WEIGHTS = {
+    10: 2, 11: 6, 12: 10, 13: 8, 14: 3, 15: 2, 16: 2,
+    17: 5, 18: 10, 19: 12, 20: 9, 21: 4,
+}
+
+# Fridays, Saturdays and Sundays are busier than weekdays
+WEEKDAY_WEIGHTS = [1.0, 0.9, 1.0, 1.1, 1.4, 1.6, 1.3]
+
+
+def order_times(rng, count, days, now):
+    """
+    `count` local opening-hours moments over the last `days` days, oldest first.
+
+    Days are weighted by weekday and hours by HOUR_WEIGHTS, so the data has
+    the lunch and dinner peaks of a real service. Moments later today that
+    have not happened yet are moved back a day.
+    """
+    today = timezone.localdate(now)
+    dates = [today - timedelta(days=offset) for offset in range(days)]
+    day_weights = [WEEKDAY_WEIGHTS[day.weekday()] for day in dates]
+    hours = list(HOUR_WEIGHTS)
+    hour_weights = list(HOUR_WEIGHTS.values())
+
+    moments = []
+    for _ in range(count):
+        day = rng.choices(dates, day_weights)[0]
+        hour = rng.choices(hours, hour_weights)[0]
+        moment = timezone.make_aware(
+            datetime.combine(day, time(hour)) + timedelta(seconds=rng.uniform(0, 3600))
+        )
+        if moment > now:
+            moment -= timedelta(days=1)
+        moments.append(moment)
+    return sorted(moments)
+
+
+@dataclass
+class Dataset:
+    """The rows created by one call to `seed`"""
+    waiters: list = field(default_factory=list)
+    cashiers: list = field(default_factory=list)
+    managers: list = field(default_factory=list)
+    menu: list = field(default_factory=list)
+    orders: list = field(default_factory=list)
+    transactions: list = field(default_factory=list)
+
+    @property
+    def pending_orders(self):
+        return [order for order in self.orders if order.status == 'pending']
+
+
+def seed(menu_items=120, waiters=8, cashiers=3, managers=1, orders=2000,
+         max_lines=6, days=30, pending=40, password='pass', prefix='seed',
+         random_seed=0, batch_size=1000):
+    """
+    Create staff, a menu and `orders` orders spread over the last `days` days.
+
+    The newest `pending` orders are left pending, every other order is
+    completed and paid, or occasionally cancelled. Returns a Dataset.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    data = Dataset()
+
+    with transaction.atomic():
+        hashed = make_password(password)
+        for role, count, bucket in [
+            ('waiter', waiters, data.waiters),
+            ('cashier', cashiers, data.cashiers),
+            ('manager', managers, data.managers),
+        ]:
+            bucket.extend(User.objects.bulk_create([
+                User(
+                    username=f'{prefix}-{role}-{number}', password=hashed, role=role,
+                    first_name=role.title(), last_name=str(number),
+                )
+                for number in range(count)
+            ]))
+
+        categories = [value for value, _ in MenuItem.CATEGORY_CHOICES]
+        data.menu = MenuItem.objects.bulk_create([
+            MenuItem(
+                name=' '.join(rng.sample(WORDS, 3)).title(),
+                description=' '.join(rng.sample(WORDS, 8)),
+                price=rng.randint(60, 600),
+                category=rng.choice(categories),
+                available=rng.random() > 0.05,
+            )
+            for _ in range(menu_items)
+        ], batch_size=batch_size)
+
+        # Oldest first, so the newest orders are the pending ones
+        moments = order_times(rng, orders, days, now)
+        lines = []
+        for number, moment in enumerate(moments):
+            picked = rng.sample(data.menu, rng.randint(1, max_lines))
+            items = [
+                OrderItem(
+                    menu_item=menu_item, quantity=rng.randint(1, 4), price_at_time=menu_item.price,
+                    special_instructions=rng.choice(['', '', '', 'No onions', 'Extra rice']),
+                )
+                for menu_item in picked
+            ]
+            for item in items:
+                item.subtotal = line_subtotal(item.price_at_time, item.quantity)
+            if number >= orders - pending:
+                status = 'pending'
+            else:
+                status = 'cancelled' if rng.random() < 0.03 else 'completed'
+            order = Order(
+                table_number=rng.randint(1, 40), waiter=rng.choice(data.waiters), status=status,
+                **price_breakdown(sum((item.subtotal for item in items), 0)),
+            )
+            data.orders.append(order)
+            lines.append(items)
+
+        # Inserts stamp the current time, so the timestamps are set afterwards
+        Order.objects.bulk_create(data.orders, batch_size=batch_size)
+        for order, moment in zip(data.orders, moments):
+            order.created_at = order.updated_at = moment
+        Order.objects.bulk_update(data.orders, ['created_at', 'updated_at'], batch_size=batch_size)
+
+        items = []
+        for order, order_items in zip(data.orders, lines):
+            for item in order_items:
+                item.order = order
+                items.append(item)
+        OrderItem.objects.bulk_create(items, batch_size=batch_size)
+
+        methods = [value for value, _ in Transaction.PAYMENT_METHOD_CHOICES]
+        paid_at = []
+        for order in data.orders:
+            if order.status != 'completed':
+                continue
+            method = rng.choice(methods)
+            payment = Transaction(
+                order=order, cashier=rng.choice(data.cashiers), payment_method=method,
+                amount=order.total,
+            )
+            paid_at.append(min(order.created_at + timedelta(minutes=rng.randint(10, 90)), now))
+            if method == 'cash':
+                payment.amount_received = order.total + rng.choice([0, 20, 50, 100])
+                payment.change_given = payment.amount_received - order.total
+            elif method == 'card':
+                payment.card_last_four = f'{rng.randint(0, 9999):04d}'
+                payment.cardholder_name = 'Seed Guest'
+            data.transactions.append(payment)
+        Transaction.objects.bulk_create(data.transactions, batch_size=batch_size)
+        for payment, moment in zip(data.transactions, paid_at):
+            payment.created_at = moment
+        Transaction.objects.bulk_update(data.transactions, ['created_at'], batch_size=batch_size)
+
+        if data.transactions:
+            reporting.rebuild(
+                timezone.localdate(min(p.created_at for p in data.transactions)),
+                timezone.localdate(max(p.created_at for p in data.transactions)),
+            )
+
+    return data
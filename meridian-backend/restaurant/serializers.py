@@ -1,5 +1,8 @@
+from decimal import Decimal
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import User, MenuItem, Order, OrderItem, Transaction
+from .models import User, MenuItem, Order, OrderItem, Transaction, SalesRollup
+from .pricing import price_breakdown
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,10 +12,34 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class MenuItemSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+    
     class Meta:
         model = MenuItem
-        fields = ['id', 'name', 'description', 'price', 'category', 'available', 'image', 'created_at']
+        fields = ['id', 'name', 'description', 'price', 'category', 'available', 'image',
+                  'image_variants', 'created_at']
         read_only_fields = ['id', 'created_at']
+    
+    def get_image_variants(self, obj):
+        # {format: {width: url}}, empty until the upload has been processed
+        request = self.context.get('request')
+        variants = {}
+        for image_format, by_width in obj.image_variants.items():
+            variants[image_format] = {}
+            for width, name in by_width.items():
+                url = default_storage.url(name)
+                variants[image_format][width] = request.build_absolute_uri(url) if request else url
+        return variants
+
+
+class MenuImportRowSerializer(serializers.Serializer):
+    """One row of a bulk menu import; see restaurant.menu_import"""
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=200, required=False)
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    category = serializers.ChoiceField(choices=MenuItem.CATEGORY_CHOICES, required=False)
+    available = serializers.BooleanField(required=False)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -45,27 +72,26 @@ class OrderSerializer(serializers.ModelSerializer):
                   'notes', 'items', 'created_at', 'time_ago']
         read_only_fields = ['id', 'created_at']
     
+    def get_pricing(self, obj):
+        # Price the items once per order and share the breakdown across the calculated_* fields
+        if getattr(self, '_priced_order', None) is not obj:
+            self._priced_order = obj
+            self._pricing = price_breakdown(
+                sum((item.subtotal for item in obj.items.all()), Decimal('0'))
+            )
+        return self._pricing
+    
     def get_calculated_subtotal(self, obj):
-        from decimal import Decimal
-        total = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
-        return float(total)
+        return float(self.get_pricing(obj)['subtotal'])
     
     def get_calculated_vat(self, obj):
-        from decimal import Decimal
-        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
-        return float(subtotal * Decimal('0.12'))
+        return float(self.get_pricing(obj)['vat'])
     
     def get_calculated_service_fee(self, obj):
-        from decimal import Decimal
-        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
-        return float(subtotal * Decimal('0.10'))
+        return float(self.get_pricing(obj)['service_fee'])
     
     def get_calculated_total(self, obj):
-        from decimal import Decimal
-        subtotal = sum(Decimal(str(item.subtotal)) for item in obj.items.all())
-        vat = subtotal * Decimal('0.12')
-        service_fee = subtotal * Decimal('0.10')
-        return float(subtotal + vat + service_fee)
+        return float(self.get_pricing(obj)['total'])
     
     def get_time_ago(self, obj):
         from django.utils import timezone
@@ -87,12 +113,51 @@ class OrderSerializer(serializers.ModelSerializer):
             return f"{days} day"
 
 
+class OrderLeanSerializer(OrderSerializer):
+    """
+    Order list representation for dashboards.
+
+    Leaves out the calculated_* fields, which repeat the stored totals, so
+    the items are not priced again for every order in the list.
+    """
+    class Meta(OrderSerializer.Meta):
+        fields = ['id', 'table_number', 'waiter', 'waiter_name', 'status', 
+                  'subtotal', 'vat', 'service_fee', 'total', 
+                  'notes', 'items', 'created_at', 'time_ago']
+
+
+class CreateOrderItemSerializer(serializers.Serializer):
+    menu_item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    special_instructions = serializers.CharField(required=False, allow_blank=True, default='')
+
+
 class CreateOrderSerializer(serializers.Serializer):
     table_number = serializers.IntegerField()
-    items = serializers.ListField(
-        child=serializers.DictField()
-    )
-    notes = serializers.CharField(required=False, allow_blank=True)
+    items = CreateOrderItemSerializer(many=True, allow_empty=False)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_items(self, items):
+        # Resolve every menu item of the order with a single query
+        menu_items = MenuItem.objects.in_bulk({item['menu_item_id'] for item in items})
+        missing = sorted({item['menu_item_id'] for item in items} - set(menu_items))
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown menu item id(s): {', '.join(str(pk) for pk in missing)}"
+            )
+
+        return [
+            (menu_items[item['menu_item_id']], item['quantity'], item['special_instructions'])
+            for item in items
+        ]
+
+    def create(self, validated_data):
+        return Order.objects.create_with_items(
+            waiter=validated_data['waiter'],
+            table_number=validated_data['table_number'],
+            lines=validated_data['items'],
+            notes=validated_data['notes'],
+        )
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -147,4 +212,48 @@ class CreateUserSerializer(serializers.ModelSerializer):
             role=validated_data.get('role', 'waiter'),
             phone_number=validated_data.get('phone_number', '')
         )
-        return user
\ No newline at end of file
+        return user
+
+
+class IdempotencyKeySerializer(serializers.Serializer):
+    # Stored in Transaction.idempotency_key
+    idempotency_key = serializers.CharField(max_length=100)
+    
+    def validate_idempotency_key(self, value):
+        if not (value.isascii() and value.isprintable()):
+            raise serializers.ValidationError("Use printable ASCII characters only.")
+        return value
+
+
+class DateRangeQuerySerializer(serializers.Serializer):
+    from_date = serializers.DateField()
+    to_date = serializers.DateField()
+    
+    def validate(self, attrs):
+        if attrs['from_date'] > attrs['to_date']:
+            raise serializers.ValidationError("from_date must not be after to_date")
+        return attrs
+
+
+class SalesReportQuerySerializer(DateRangeQuerySerializer):
+    group_by = serializers.ChoiceField(choices=SalesRollup.PERIOD_CHOICES, default='day')
+    dimension = serializers.ChoiceField(choices=SalesRollup.DIMENSION_CHOICES, default='total')
+
+
+class BoardQuerySerializer(serializers.Serializer):
+    table_number = serializers.IntegerField(required=False)
+    waiter = serializers.IntegerField(required=False)
+    category = serializers.ChoiceField(choices=MenuItem.CATEGORY_CHOICES, required=False)
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    bucket = serializers.DateTimeField()
+    key = serializers.CharField()
+    label = serializers.CharField()
+    orders = serializers.IntegerField()
+    items_sold = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    vat = serializers.DecimalField(max_digits=14, decimal_places=2)
+    service_fee = serializers.DecimalField(max_digits=14, decimal_places=2)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_ticket = serializers.DecimalField(max_digits=14, decimal_places=2)
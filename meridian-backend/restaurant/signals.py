@@ -0,0 +1,99 @@
+from functools import wraps
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import archive, auth, board, catalogue, events, images, reporting, tasks
+from .models import MenuItem, Order, OrderItem, OrderTombstone, Transaction, User
+
+
+def unless_archiving(receiver_func):
+    """Skip a receiver for the deletes that move rows to the archive"""
+    @wraps(receiver_func)
+    def wrapper(sender, instance, **kwargs):
+        if not archive.archiving():
+            receiver_func(sender, instance, **kwargs)
+    return wrapper
+
+
+@receiver(post_delete, sender=Order)
+@unless_archiving
+def record_order_tombstone(sender, instance, **kwargs):
+    """Remember deleted orders so delta sync clients can drop them"""
+    # Old ones are pruned periodically by sync.prune_tombstones
+    OrderTombstone.objects.create(order_id=instance.pk, waiter_id=instance.waiter_id)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_saved(sender, instance, created, **kwargs):
+    previous_status = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+
+    if created:
+        events.publish_on_commit(events.ORDER_CREATED, instance.pk)
+    elif previous_status is not None and previous_status != instance.status:
+        events.publish_on_commit(
+            events.ORDER_STATUS_CHANGED, instance.pk, previous_status=previous_status
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@unless_archiving
+def publish_order_items_changed(sender, instance, **kwargs):
+    events.publish_on_commit(events.ORDER_ITEMS_CHANGED, instance.order_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@unless_archiving
+def update_board_order(sender, instance, **kwargs):
+    board.refresh_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@unless_archiving
+def update_board_items(sender, instance, **kwargs):
+    board.refresh_on_commit(instance.order_id)
+
+
+@receiver(post_save, sender=Transaction)
+def roll_up_payment(sender, instance, created, **kwargs):
+    if created:
+        reporting.record_payment.enqueue(instance.pk)
+
+
+@receiver(pre_delete, sender=Transaction)
+@unless_archiving
+def roll_back_payment(sender, instance, **kwargs):
+    # Before the delete, so the order and its items can still be read
+    tasks.cancel(reporting.record_payment, instance.pk)
+    reporting.roll_back(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def publish_order_paid(sender, instance, created, **kwargs):
+    if created:
+        events.publish_on_commit(events.ORDER_PAID, instance.order_id, transaction={
+            'id': instance.pk,
+            'payment_method': instance.payment_method,
+            'amount': str(instance.amount),
+        })
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_menu_snapshots(sender, instance, **kwargs):
+    catalogue.bump_version()
+
+
+@receiver(post_delete, sender=MenuItem)
+def discard_image_variants(sender, instance, **kwargs):
+    images.discard_on_commit(images.variant_paths(instance.image_variants))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
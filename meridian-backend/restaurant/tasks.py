@@ -0,0 +1,296 @@
+"""
+Background tasks recorded in the database and run by a local worker.
+
+Request handlers enqueue work and return: `func.enqueue(*args)` inserts a
+Task row in the current transaction, so the task exists exactly when the
+write that asked for it committed, and the worker cannot see it earlier.
+`manage.py run_tasks` claims due rows with a conditional update, which is
+safe with several workers, and runs them on a thread pool.
+
+A registered function declares:
+
+- `max_attempts`: a failure is retried after an exponential backoff with
+  jitter (TASK_RETRY_DELAY doubling per attempt, up to
+  TASK_RETRY_MAX_DELAY) until the attempts are used up, then the row is
+  left as failed with its error for inspection.
+- `concurrency`: how many of its tasks one worker runs at a time;
+  TASK_CONCURRENCY overrides it per task name.
+- `atomic`: run the function and mark the row done in one transaction, so a
+  task that only writes to the database takes effect exactly once. Leave
+  it off for slow work, which would otherwise hold the write lock.
+
+Tasks whose worker died are queued again once they have been running for
+TASK_TIMEOUT seconds, or marked failed when that was their last attempt.
+Set TASKS_SYNC = True to run tasks inline when they are enqueued instead,
+as the tests do.
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import sync
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Finished rows are deleted after this long; failed ones are kept
+DONE_RETENTION = timedelta(days=1)
+
+
+@dataclass(frozen=True)
+class TaskOptions:
+    name: str
+    max_attempts: int = 5
+    concurrency: int = 1
+    atomic: bool = False
+
+
+def task(max_attempts=5, concurrency=1, atomic=False):
+    """Register a module-level function as a task, adding `func.enqueue`"""
+    def register(func):
+        func.task_options = TaskOptions(
+            f'{func.__module__}.{func.__qualname__}', max_attempts, concurrency, atomic
+        )
+        func.enqueue = partial(enqueue, func)
+        return func
+    return register
+
+
+def resolve(name):
+    """The registered function behind a task name"""
+    func = import_string(name)
+    if not isinstance(getattr(func, 'task_options', None), TaskOptions):
+        # Rows only ever name registered functions; never call anything else
+        raise LookupError(f"{name} is not a registered task")
+    return func
+
+
+def concurrency(name):
+    limits = getattr(settings, 'TASK_CONCURRENCY', {})
+    return limits.get(name, resolve(name).task_options.concurrency)
+
+
+def enqueue(func, *args):
+    """Record a call to `func` in the current transaction; returns the Task"""
+    if getattr(settings, 'TASKS_SYNC', False):
+        func(*args)
+        return None
+    return Task.objects.create(name=func.task_options.name, args=list(args))
+
+
+def cancel(func, *args):
+    """Drop queued calls to `func` with these arguments; returns how many"""
+    deleted, _ = Task.objects.filter(
+        name=func.task_options.name, args=list(args), status=QUEUED
+    ).delete()
+    return deleted
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a task that failed `attempts` times"""
+    base = getattr(settings, 'TASK_RETRY_DELAY', 5)
+    ceiling = getattr(settings, 'TASK_RETRY_MAX_DELAY', 600)
+    delay = min(ceiling, base * 2 ** (attempts - 1))
+    # Jitter, so tasks that failed together do not retry together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(slots, limit):
+    """
+    Mark up to `limit` due tasks as running and return them.
+
+    `slots` maps task names to how many more this worker may start; names
+    it does not list are resolved with `concurrency`. Rows another worker
+    claimed first are skipped.
+    """
+    now = timezone.now()
+    slots = dict(slots)
+    candidates = Task.objects.filter(status=QUEUED, run_after__lte=now).exclude(
+        name__in=[name for name, free in slots.items() if free <= 0]
+    ).order_by('run_after', 'pk').values_list('pk', 'name')[:limit * 4]
+
+    claimed = []
+    for pk, name in candidates:
+        if len(claimed) == limit:
+            break
+        if name not in slots:
+            try:
+                slots[name] = concurrency(name)
+            except (ImportError, LookupError) as error:
+                fail_unknown(pk, error)
+                continue
+        if slots[name] <= 0:
+            continue
+        updated = Task.objects.filter(pk=pk, status=QUEUED).update(
+            status=RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if updated:
+            slots[name] -= 1
+            claimed.append(Task.objects.get(pk=pk))
+    return claimed
+
+
+def fail_unknown(pk, error):
+    Task.objects.filter(pk=pk, status=QUEUED).update(
+        status=FAILED, finished_at=timezone.now(), last_error=str(error),
+    )
+
+
+def execute(task):
+    """Run a claimed task and record the outcome; returns True on success"""
+    func = resolve(task.name)
+    options = func.task_options
+    done = Task.objects.filter(pk=task.pk, status=RUNNING)
+    try:
+        if options.atomic:
+            with transaction.atomic():
+                func(*task.args)
+                done.update(status=DONE, finished_at=timezone.now(), last_error='')
+        else:
+            func(*task.args)
+            done.update(status=DONE, finished_at=timezone.now(), last_error='')
+        return True
+    except Exception:
+        logger.exception("Task %s #%s failed (attempt %s)", task.name, task.pk, task.attempts)
+        error = traceback.format_exc()[-4000:]
+        if task.attempts >= options.max_attempts:
+            done.update(status=FAILED, finished_at=timezone.now(), last_error=error)
+        else:
+            done.update(
+                status=QUEUED, last_error=error,
+                run_after=timezone.now() + timedelta(seconds=backoff(task.attempts)),
+            )
+        return False
+
+
+def run_pending(limit=None):
+    """Run due tasks one by one in this thread until none are left; returns the count"""
+    count = 0
+    while limit is None or count < limit:
+        claimed = claim({}, 1)
+        if not claimed:
+            break
+        execute(claimed[0])
+        count += 1
+    return count
+
+
+def requeue_stale():
+    """
+    Queue again the tasks left running by a worker that died; returns how
+    many. Those out of attempts are marked failed, so a task that kills its
+    worker is not retried forever.
+    """
+    timeout = getattr(settings, 'TASK_TIMEOUT', 300)
+    now = timezone.now()
+    stale = Task.objects.filter(status=RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+
+    requeued = 0
+    for name in stale.values_list('name', flat=True).distinct():
+        try:
+            max_attempts = resolve(name).task_options.max_attempts
+        except (ImportError, LookupError):
+            max_attempts = 0
+        rows = stale.filter(name=name)
+        rows.filter(attempts__gte=max_attempts).update(
+            status=FAILED, finished_at=now,
+            last_error=f"Still running after {timeout} seconds; its worker stopped",
+        )
+        requeued += rows.update(status=QUEUED, run_after=now)
+    return requeued
+
+
+def purge():
+    return Task.objects.filter(
+        status=DONE, finished_at__lt=timezone.now() - DONE_RETENTION
+    ).delete()[0]
+
+
+class Worker:
+    """Claims due tasks and runs them on a thread pool, within per-task limits"""
+
+    # Seconds between sweeps for stale and finished rows and old tombstones
+    MAINTENANCE_INTERVAL = 60
+
+    def __init__(self, threads=4, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tasks')
+        self.running = Counter()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def slots(self):
+        with self.lock:
+            return {name: concurrency(name) - count for name, count in self.running.items()}
+
+    def in_flight(self):
+        with self.lock:
+            return sum(self.running.values())
+
+    def _run(self, task):
+        try:
+            execute(task)
+        except Exception:
+            # Unregistered since it was claimed; the timeout requeues it
+            logger.exception("Task %s #%s could not run", task.name, task.pk)
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.running[task.name] -= 1
+                if not self.running[task.name]:
+                    del self.running[task.name]
+                self.processed += 1
+
+    def dispatch(self):
+        free = self.threads - self.in_flight()
+        if free <= 0:
+            return 0
+        claimed = claim(self.slots(), free)
+        for task in claimed:
+            with self.lock:
+                self.running[task.name] += 1
+            self.pool.submit(self._run, task)
+        return len(claimed)
+
+    def run(self, once=False):
+        """
+        Work until `stop` is called, or with `once` until nothing is due and
+        everything claimed has finished.
+        """
+        last_sweep = None
+        try:
+            while not self.stopping.is_set():
+                if last_sweep is None or time.monotonic() - last_sweep >= self.MAINTENANCE_INTERVAL:
+                    requeue_stale()
+                    purge()
+                    sync.prune_tombstones()
+                    last_sweep = time.monotonic()
+                claimed = self.dispatch()
+                close_old_connections()
+                if once and not claimed and not self.in_flight():
+                    break
+                if not claimed:
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            self.pool.shutdown(wait=True)
+        return self.processed
+
+    def stop(self):
+        self.stopping.set()
@@ -1,3 +1,1602 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+from io import BytesIO
+from io import StringIO
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings,
+)
+from django.urls import get_resolver, resolve
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import (
+    archive, board, budgets, catalogue, checks, consumers, events, exports, files, images, loadtest,
+    menu_import, receipts, reporting, routers, sync, tasks,
+)
+from .eager import eager_paths
+from .models import (
+    User, MenuItem, Order, OrderItem, OrderTombstone, SalesRollup, Transaction,
+    ArchivedOrder, ArchivedOrderItem, ArchivedTransaction, Task,
+)
+from .search import get_backend as search_backend
+from .serializers import OrderSerializer, TransactionSerializer
+
+
+@tasks.task(max_attempts=2, concurrency=1)
+def note_call(value):
+    """A task for the queue tests; fails for 'boom'"""
+    if value == 'boom':
+        raise ValueError(value)
+    TaskQueueTests.calls.append(value)
+
+
+@override_settings(TASKS_SYNC=True)
+class RestaurantTestCase(TestCase):
+    """Common fixtures: one user per staff role and a small menu. Tasks run inline."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.waiter = User.objects.create_user('waiter', password='pass', role='waiter')
+        cls.cashier = User.objects.create_user('cashier', password='pass', role='cashier')
+        cls.manager = User.objects.create_user('manager', password='pass', role='manager')
+        cls.menu = [
+            MenuItem.objects.create(
+                name=f'Dish {i}', price=Decimal('9.95') + i, category='main-courses'
+            )
+            for i in range(20)
+        ]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class CreateOrderTests(RestaurantTestCase):
+    def post_order(self, lines):
+        return self.client_for(self.waiter).post('/api/orders/', {
+            'table_number': 4,
+            'items': [
+                {'menu_item_id': item.id, 'quantity': 2} for item in lines
+            ],
+        }, format='json')
+
+    def test_create_computes_totals_once(self):
+        response = self.post_order(self.menu[:3])
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(order.subtotal, Decimal('65.70'))
+        self.assertEqual(order.vat, Decimal('7.88'))
+        self.assertEqual(order.service_fee, Decimal('6.57'))
+        self.assertEqual(order.total, Decimal('80.15'))
+
+    def test_query_count_does_not_grow_with_lines(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post_order(self.menu[:2])
+        with CaptureQueriesContext(connection) as large:
+            self.post_order(self.menu[:15])
+
+        self.assertEqual(len(small), len(large))
+
+    def test_unknown_menu_item_is_rejected(self):
+        response = self.client_for(self.waiter).post('/api/orders/', {
+            'table_number': 4,
+            'items': [{'menu_item_id': 9999, 'quantity': 1}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class OrderTotalsTests(RestaurantTestCase):
+    def setUp(self):
+        self.order = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=1,
+            lines=[(self.menu[0], 1, ''), (self.menu[1], 2, '')],
+        )
+
+    def assertTotals(self, subtotal, vat, service_fee, total):
+        self.order.refresh_from_db()
+        self.assertEqual(
+            [self.order.subtotal, self.order.vat, self.order.service_fee, self.order.total],
+            [Decimal(subtotal), Decimal(vat), Decimal(service_fee), Decimal(total)],
+        )
+
+    def test_adding_editing_and_deleting_lines_applies_deltas(self):
+        self.assertTotals('31.85', '3.82', '3.19', '38.86')
+
+        line = OrderItem.objects.create(
+            order=self.order, menu_item=self.menu[2], quantity=1, price_at_time=self.menu[2].price
+        )
+        self.assertTotals('43.80', '5.26', '4.38', '53.44')
+
+        line = OrderItem.objects.get(pk=line.pk)
+        line.quantity = 3
+        line.save()
+        self.assertTotals('67.70', '8.12', '6.77', '82.59')
+
+        line.delete()
+        self.assertTotals('31.85', '3.82', '3.19', '38.86')
+
+    def test_lines_loaded_with_deferred_subtotal(self):
+        first, second = self.order.items.order_by('pk').only('quantity')
+        first.quantity = 3
+        first.save()
+        self.assertTotals('51.75', '6.21', '5.18', '63.14')
+
+        other = Order.objects.create_with_items(waiter=self.waiter, table_number=2, lines=[])
+        second = OrderItem.objects.only('quantity').get(pk=second.pk)
+        second.order = other
+        second.save()
+        self.assertTotals('29.85', '3.58', '2.99', '36.42')
+        other.refresh_from_db()
+        self.assertEqual(other.subtotal, Decimal('21.90'))
+
+        OrderItem.objects.only('quantity').get(pk=first.pk).delete()
+        self.assertTotals('0', '0', '0', '0')
+
+    def test_line_edit_does_not_read_other_lines(self):
+        line = self.order.items.first()
+        line.quantity = 5
+        with CaptureQueriesContext(connection) as queries:
+            line.save()
+
+        self.assertFalse(any('restaurant_orderitem' in q['sql'] and q['sql'].startswith('SELECT')
+                             for q in queries))
+
+    def test_retrieve_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.cashier).get(f'/api/orders/{self.order.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries))
+
+    def test_reconcile_repairs_drifted_totals(self):
+        Order.objects.filter(pk=self.order.pk).update(subtotal=0, vat=0, service_fee=0, total=1)
+
+        self.assertEqual(Order.objects.reconcile_totals(fix=False), [self.order.pk])
+        self.assertEqual(Order.objects.reconcile_totals(), [self.order.pk])
+        self.assertTotals('31.85', '3.82', '3.19', '38.86')
+        self.assertEqual(Order.objects.reconcile_totals(), [])
+
+
+class OrderSerializationTests(RestaurantTestCase):
+    def setUp(self):
+        Order.objects.create_with_items(
+            waiter=self.waiter, table_number=1,
+            lines=[(self.menu[0], 1, ''), (self.menu[1], 2, '')],
+        )
+
+    def test_calculated_fields_share_one_breakdown(self):
+        order = self.client_for(self.cashier).get('/api/orders/').data['results'][0]
+
+        self.assertEqual(order['calculated_subtotal'], 31.85)
+        self.assertEqual(order['calculated_vat'], 3.82)
+        self.assertEqual(order['calculated_service_fee'], 3.19)
+        self.assertEqual(order['calculated_total'], 38.86)
+
+    def test_lean_list_skips_calculated_fields(self):
+        order = self.client_for(self.cashier).get('/api/orders/?lean=true').data['results'][0]
+
+        self.assertEqual(order['total'], '38.86')
+        self.assertNotIn('calculated_total', order)
+
+
+class OrderSyncTests(RestaurantTestCase):
+    def setUp(self):
+        self.client = self.client_for(self.cashier)
+        self.first = self.create_order(table_number=1)
+
+    def create_order(self, table_number):
+        return Order.objects.create_with_items(
+            waiter=self.waiter, table_number=table_number, lines=[(self.menu[0], 1, '')],
+        )
+
+    def sync(self, cursor=''):
+        response = self.client.get('/api/orders/', {'status': 'pending', 'since': cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_delta_returns_changes_and_tombstones(self):
+        initial = self.sync()
+        self.assertTrue(initial['reset'])
+        self.assertEqual([order['id'] for order in initial['orders']], [self.first.pk])
+
+        # Move the cursor past the overlap window
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        cursor = sync.make_cursor(timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.sync(cursor)['orders'], [])
+
+        second = self.create_order(table_number=2)
+        third = self.create_order(table_number=3)
+        self.first.status = 'completed'
+        self.first.save()
+        third_pk = third.pk
+        third.delete()
+
+        delta = self.sync(cursor)
+        self.assertFalse(delta['reset'])
+        self.assertEqual([order['id'] for order in delta['orders']], [second.pk])
+        self.assertEqual(delta['removed'], sorted([self.first.pk, third_pk]))
+
+    def test_reset_is_paged(self):
+        second = self.create_order(table_number=2)
+
+        response = self.client.get('/api/orders/', {'status': 'pending', 'since': '', 'page_size': 1})
+        first_page = response.data
+        self.assertTrue(first_page['reset'])
+        self.assertEqual([order['id'] for order in first_page['orders']], [second.pk])
+
+        response = self.client.get(first_page['next'])
+        last_page = response.data
+        self.assertTrue(last_page['reset'])
+        self.assertEqual([order['id'] for order in last_page['orders']], [self.first.pk])
+        self.assertEqual(last_page['cursor'], first_page['cursor'])
+        self.assertIsNone(last_page['next'])
+
+    def test_old_tombstones_are_pruned_apart_from_deletes(self):
+        OrderTombstone.objects.create(order_id=999999)
+        OrderTombstone.objects.update(deleted_at=timezone.now() - sync.TOMBSTONE_RETENTION * 2)
+        orders = [self.create_order(table_number=table) for table in (4, 5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            Order.objects.filter(pk__in=[order.pk for order in orders]).delete()
+        self.assertFalse(any('DELETE FROM "restaurant_ordertombstone"' in q['sql'] for q in queries))
+        self.assertEqual(OrderTombstone.objects.count(), 3)
+
+        self.assertEqual(sync.prune_tombstones(), 1)
+        self.assertEqual(
+            sorted(OrderTombstone.objects.values_list('order_id', flat=True)), [order.pk for order in orders]
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/orders/', {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_list_answers_304(self):
+        response = self.client.get('/api/orders/')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('restaurant_orderitem' in q['sql'] for q in queries))
+
+        self.create_order(table_number=2)
+        response = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+    def test_line_edit_without_price_change_reaches_clients(self):
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        cursor = sync.make_cursor(timezone.now() - timedelta(minutes=1))
+        etag = self.client.get('/api/orders/')['ETag']
+
+        item = self.first.items.get()
+        item.special_instructions = 'no peanuts'
+        item.save()
+
+        self.assertEqual(self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        delta = self.sync(cursor)
+        self.assertEqual([order['id'] for order in delta['orders']], [self.first.pk])
+        self.assertEqual(delta['orders'][0]['items'][0]['special_instructions'], 'no peanuts')
+
+
+class OrderEventTests(RestaurantTestCase):
+    def collect_events(self, action, **filters):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        broker = events.InProcessBroker()
+        subscription = broker.subscribe(loop=loop, **filters)
+
+        with patch.object(events, '_broker', broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+        # Let the loop run the deliveries scheduled by the broker
+        loop.run_until_complete(asyncio.sleep(0))
+
+        received = []
+        while not subscription.queue.empty():
+            received.append(subscription.queue.get_nowait())
+        return received
+
+    def test_lifecycle_events_are_published(self):
+        def checkout():
+            waiter = self.client_for(self.waiter)
+            order_id = waiter.post('/api/orders/', {
+                'table_number': 7, 'items': [{'menu_item_id': self.menu[0].id, 'quantity': 1}],
+            }, format='json').data['id']
+            self.client_for(self.cashier).post('/api/transactions/', {
+                'order_id': order_id, 'payment_method': 'cash',
+                'amount': '12.14', 'amount_received': '20.00',
+            }, format='json')
+
+        received = self.collect_events(checkout)
+
+        self.assertEqual(
+            [event['type'] for event in received],
+            [events.ORDER_CREATED, events.ORDER_PAID, events.ORDER_STATUS_CHANGED],
+        )
+        self.assertEqual(received[1]['transaction']['payment_method'], 'cash')
+        self.assertEqual(received[2]['previous_status'], 'pending')
+        self.assertEqual(received[2]['order']['status'], 'completed')
+
+    def test_subscriptions_are_filtered(self):
+        def create():
+            Order.objects.create_with_items(
+                waiter=self.waiter, table_number=1, lines=[(self.menu[0], 1, '')]
+            )
+
+        self.assertEqual(len(self.collect_events(create, statuses=['pending'])), 1)
+        self.assertEqual(self.collect_events(create, statuses=['completed']), [])
+        self.assertEqual(self.collect_events(create, waiter_id=self.cashier.pk), [])
+
+    def test_websocket_streams_events_to_staff(self):
+        client = self.client_for(self.cashier)
+        client.force_login(self.cashier)
+        cookie = f"sessionid={client.cookies['sessionid'].value}".encode()
+
+        async def run():
+            inbox = asyncio.Queue()
+            outbox = asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            scope = {
+                'type': 'websocket', 'path': '/ws/orders/',
+                'query_string': b'status=pending', 'headers': [(b'cookie', cookie)],
+            }
+            broker = events.InProcessBroker()
+            with patch.object(events, '_broker', broker):
+                stream = asyncio.ensure_future(consumers.order_events(scope, inbox.get, outbox.put))
+                self.assertEqual((await outbox.get())['type'], 'websocket.accept')
+
+                broker.publish({'type': events.ORDER_CREATED, 'order': {'status': 'pending', 'waiter': 1}})
+                broker.publish({'type': events.ORDER_CREATED, 'order': {'status': 'completed', 'waiter': 1}})
+                message = await asyncio.wait_for(outbox.get(), 1)
+
+                await inbox.put({'type': 'websocket.disconnect'})
+                await asyncio.wait_for(stream, 1)
+            return json.loads(message['text']), outbox.empty()
+
+        event, drained = async_to_sync(run)()
+        self.assertEqual(event['order']['status'], 'pending')
+        self.assertTrue(drained)
+
+    def test_websocket_rejects_anonymous(self):
+        async def run():
+            sent = []
+            inbox = asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            scope = {'type': 'websocket', 'path': '/ws/orders/', 'headers': []}
+            await consumers.order_events(scope, inbox.get, lambda m: asyncio.sleep(0, sent.append(m)))
+            return sent
+
+        self.assertEqual(async_to_sync(run)(), [{'type': 'websocket.close', 'code': 4403}])
+
+
+class MenuCatalogueTests(RestaurantTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_is_served_from_snapshot(self):
+        first = self.client.get('/api/menu/', {'category': 'main-courses'})
+        self.assertEqual(len(first.json()), 20)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/menu/', {'category': 'main-courses'})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(queries), 0)
+
+    def test_unchanged_menu_answers_304(self):
+        etag = self.client.get('/api/menu/')['ETag']
+
+        response = self.client.get('/api/menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_toggle_invalidates_snapshots(self):
+        etag = self.client.get('/api/menu/', {'available': 'true'})['ETag']
+
+        manager = self.client_for(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            manager.patch(f'/api/menu/{self.menu[0].pk}/toggle_availability/')
+
+        response = self.client.get('/api/menu/', {'available': 'true'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 19)
+
+
+class MenuImageTests(RestaurantTestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = self.settings(MEDIA_ROOT=media, MENU_IMAGE_WIDTHS=(160, 320, 640))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def photo(self, width, height, mode='RGB', name='dish.png'):
+        buffer = BytesIO()
+        Image.new(mode, (width, height), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def upload(self, width, height, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.manager).patch(
+                f'/api/menu/{self.menu[0].pk}/', {'image': self.photo(width, height, **kwargs)},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(f'/api/menu/{self.menu[0].pk}/').data['image_variants']
+
+    def test_upload_builds_hashed_variants(self):
+        variants = self.upload(1000, 500)
+
+        self.assertEqual(set(variants), {'webp', 'jpeg'})
+        self.assertEqual(set(variants['webp']), {'160', '320', '640'})
+        self.assertRegex(variants['jpeg']['320'], r'^http://testserver/media/menu_items/variants/dish-320w\.[0-9a-f]{16}\.jpg$')
+
+        stored = MenuItem.objects.get(pk=self.menu[0].pk).image_variants
+        with default_storage.open(stored['webp']['640']) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (640, 320)))
+
+    def test_small_and_transparent_images(self):
+        variants = self.upload(100, 80, mode='RGBA')
+        self.assertEqual(set(variants['jpeg']), {'100'})
+
+    def test_new_upload_replaces_variants_and_menu_snapshot(self):
+        first = self.upload(400, 400)
+        etag = self.client.get('/api/menu/')['ETag']
+
+        second = self.upload(400, 200)
+        self.assertNotEqual(second['jpeg']['320'], first['jpeg']['320'])
+        self.assertNotEqual(self.client.get('/api/menu/')['ETag'], etag)
+        menu = {item['id']: item for item in self.client.get('/api/menu/').json()}
+        self.assertEqual(menu[self.menu[0].pk]['image_variants'], second)
+
+    def test_replaced_variants_are_deleted_unless_shared(self):
+        self.upload(400, 400)
+        old = images.variant_paths(MenuItem.objects.get(pk=self.menu[0].pk).image_variants)
+        shared = sorted(old)[0]
+        MenuItem.objects.filter(pk=self.menu[1].pk).update(image_variants={'jpeg': {'160': shared}})
+
+        self.upload(400, 200)
+        current = images.variant_paths(MenuItem.objects.get(pk=self.menu[0].pk).image_variants)
+        self.assertTrue(current.isdisjoint(old))
+        self.assertTrue(all(default_storage.exists(path) for path in current))
+        self.assertEqual({path for path in old if default_storage.exists(path)}, {shared})
+
+    def test_backfill_command(self):
+        self.upload(400, 400)
+        MenuItem.objects.filter(pk=self.menu[0].pk).update(image_variants={})
+
+        call_command('build_menu_images', stdout=StringIO())
+        self.assertEqual(set(MenuItem.objects.get(pk=self.menu[0].pk).image_variants['webp']), {'160', '320'})
+
+
+class FileServingTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.write('app.js', b'const menu = [];\n' * 200)
+        self.write('menu_items/variants/dish-320w.0123456789abcdef.webp', b'RIFF0123456789')
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+
+    def get(self, path, **headers):
+        request = RequestFactory().get(f'/media/{path}', headers=headers)
+        return files.serve(request, path, document_root=self.root, accel_location='/internal/media/')
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_headers_and_revalidation(self):
+        response = self.get('app.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]+-[0-9a-f]+"$')
+        self.assertEqual(len(self.body(response)), 3400)
+
+        self.assertEqual(self.get('app.js', if_none_match=response['ETag']).status_code, 304)
+
+        hashed = self.get('menu_items/variants/dish-320w.0123456789abcdef.webp')
+        self.assertEqual(hashed['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_ranges(self):
+        response = self.get('app.js', range='bytes=6-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 6-9/3400')
+        self.assertEqual(self.body(response), b'menu')
+
+        self.assertEqual(self.body(self.get('app.js', range='bytes=-3')), b'];\n')
+        self.assertEqual(self.get('app.js', range='bytes=5000-').status_code, 416)
+        # A stale If-Range gets the whole, current file
+        self.assertEqual(self.get('app.js', range='bytes=0-1', if_range='"old"').status_code, 200)
+
+    def test_precompressed_variants(self):
+        call_command('compress_files', self.root, stdout=StringIO())
+
+        response = self.get('app.js', accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(self.body(response)), b'const menu = [];\n' * 200)
+
+        plain = self.get('app.js', accept_encoding='identity')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+        # Ranges address the plain file
+        self.assertNotIn('Content-Encoding', self.get('app.js', accept_encoding='gzip', range='bytes=0-4'))
+
+    def test_stays_inside_root(self):
+        with self.assertRaises(Http404):
+            self.get('../app.js')
+        with self.assertRaises(Http404):
+            self.get('menu_items')
+
+    def test_offload_to_proxy(self):
+        with self.settings(FILE_OFFLOAD='x-accel-redirect'):
+            response = self.get('menu_items/variants/dish-320w.0123456789abcdef.webp')
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/media/menu_items/variants/dish-320w.0123456789abcdef.webp')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response.content, b'')
+
+    def test_routes_use_it(self):
+        self.assertIs(resolve('/media/menu_items/dish.png').func, files.serve)
+
+
+class MenuSearchTests(RestaurantTestCase):
+    def setUp(self):
+        cache.clear()
+        self.soup = MenuItem.objects.create(
+            name='Chicken Soup', description='Slow simmered broth', price=5, category='soup'
+        )
+        self.salad = MenuItem.objects.create(
+            name='Caesar Salad', description='With grilled chicken', price=7, category='salad'
+        )
+
+    def search(self, text):
+        return [item['name'] for item in APIClient().get('/api/menu/', {'search': text}).json()]
+
+    def test_prefix_matches_are_ranked(self):
+        # A hit in the name ranks above a hit in the description
+        self.assertEqual(self.search('chick'), ['Chicken Soup', 'Caesar Salad'])
+        self.assertEqual(self.search('chick sou'), ['Chicken Soup'])
+        self.assertEqual(self.search('salad'), ['Caesar Salad'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.soup.name = 'Pumpkin Soup'
+        self.soup.save()
+        self.assertEqual(search_backend().search(MenuItem.objects.all(), 'pump').get(), self.soup)
+
+        self.salad.delete()
+        self.assertFalse(search_backend().search(MenuItem.objects.all(), 'caesar').exists())
+
+    def test_search_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"chicken" OR NEAR('), [])
+
+
+class KeysetPaginationTests(RestaurantTestCase):
+    def setUp(self):
+        # Several orders share a timestamp, so ties must be broken by id
+        moments = [timezone.now() - timedelta(minutes=minutes) for minutes in (1, 1, 1, 2, 3)]
+        self.orders = []
+        for table, moment in enumerate(moments):
+            order = Order.objects.create(table_number=table, waiter=self.waiter)
+            Order.objects.filter(pk=order.pk).update(created_at=moment)
+            self.orders.append(order)
+
+    def test_pages_walk_every_row_once_without_count(self):
+        client = self.client_for(self.cashier)
+        seen = []
+        url = '/api/orders/?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = client.get(url).data
+            self.assertFalse(any('COUNT(' in q['sql'].upper() for q in queries))
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [order['id'] for order in page['results']]
+            url = page['next']
+
+        expected = sorted(self.orders, key=lambda order: (
+            Order.objects.get(pk=order.pk).created_at, order.pk), reverse=True)
+        self.assertEqual(seen, [order.pk for order in expected])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client_for(self.cashier).get('/api/orders/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+
+class SalesReportTests(RestaurantTestCase):
+    def setUp(self):
+        self.soup = MenuItem.objects.create(name='Soup', price=5, category='soup')
+        for method, lines in [
+            ('cash', [(self.menu[0], 1, ''), (self.soup, 2, '')]),
+            ('card', [(self.menu[1], 1, '')]),
+        ]:
+            order = Order.objects.create_with_items(waiter=self.waiter, table_number=1, lines=lines)
+            Transaction.objects.create(
+                order=order, cashier=self.cashier, payment_method=method, amount=order.total
+            )
+
+    def report(self, **params):
+        today = timezone.localdate().isoformat()
+        response = self.client_for(self.manager).get(
+            '/api/reports/sales/', {'from_date': today, 'to_date': today, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rollups_follow_payments(self):
+        report = self.report()
+        self.assertEqual(report['totals']['orders'], 2)
+        self.assertEqual(report['totals']['revenue'], Decimal('37.70'))
+        self.assertEqual(report['rows'][0]['average_ticket'], '18.85')
+
+        by_method = {row['key']: row['revenue'] for row in self.report(dimension='payment_method')['rows']}
+        self.assertEqual(by_method, {'card': '13.36', 'cash': '24.34'})
+
+        by_category = {row['key']: row['items_sold'] for row in self.report(dimension='category')['rows']}
+        self.assertEqual(by_category, {'main-courses': 2, 'soup': 2})
+
+    def test_split_report_counts_each_order_once(self):
+        report = self.report(dimension='category')
+        # The cash order is in both the main course and the soup rows
+        self.assertEqual(sum(row['orders'] for row in report['rows']), 3)
+        self.assertEqual(report['totals']['orders'], 2)
+        self.assertEqual(report['totals']['revenue'], Decimal('37.70'))
+        self.assertEqual(report['totals']['average_ticket'], Decimal('18.85'))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        def snapshot():
+            return list(SalesRollup.objects.order_by('period', 'dimension', 'key').values(
+                'period', 'bucket', 'dimension', 'key', 'orders', 'items_sold', 'revenue', 'vat'
+            ))
+
+        incremental = snapshot()
+        SalesRollup.objects.all().delete()
+        reporting.rebuild(timezone.localdate(), timezone.localdate())
+
+        self.assertEqual(snapshot(), incremental)
+
+    def test_report_reads_rollups_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.report(group_by='hour', dimension='cashier')
+        self.assertFalse(any('restaurant_transaction' in q['sql'] for q in queries))
+
+    def test_managers_only(self):
+        response = self.client_for(self.cashier).get('/api/reports/sales/')
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are captured from SQLite')
+class QueryPlanTests(RestaurantTestCase):
+    # A plan line that reads a whole table without an index, or sorts
+    FULL_SCAN = re.compile(r'SCAN restaurant_\w+$|TEMP B-TREE', re.MULTILINE)
+
+    def plans(self, user, url, params=None):
+        """EXPLAIN QUERY PLAN for every query a request runs"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(user).get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        return plans
+
+    def assertIndexed(self, plans):
+        for plan in plans:
+            self.assertIsNone(self.FULL_SCAN.search(plan), plan)
+
+    def test_order_lists(self):
+        self.assertIndexed(self.plans(self.cashier, '/api/orders/'))
+        self.assertIndexed(self.plans(self.cashier, '/api/orders/', {'status': 'pending'}))
+
+        plans = self.plans(self.waiter, '/api/orders/', {'status': 'pending'})
+        self.assertIndexed(plans)
+        self.assertTrue(any('order_waiter_updated_idx' in plan for plan in plans))
+        self.assertTrue(any('order_waiter_status_idx' in plan for plan in plans))
+
+    def test_transaction_date_range(self):
+        today = timezone.localdate().isoformat()
+        plans = self.plans(self.cashier, '/api/transactions/', {'from_date': today, 'to_date': today})
+        self.assertIndexed(plans)
+        self.assertIn('transaction_created_idx (created_at>? AND created_at<?)', '\n'.join(plans))
+
+
+class TransactionDateRangeTests(RestaurantTestCase):
+    def setUp(self):
+        self.day = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(self.day, datetime.min.time()))
+        for moment in (midnight - timedelta(microseconds=1), midnight, midnight + timedelta(days=1)):
+            order = Order.objects.create_with_items(
+                waiter=self.waiter, table_number=1, lines=[(self.menu[0], 1, '')]
+            )
+            payment = Transaction.objects.create(
+                order=order, cashier=self.cashier, payment_method='cash', amount=order.total
+            )
+            Transaction.objects.filter(pk=payment.pk).update(created_at=moment)
+
+    def test_whole_local_days_are_half_open(self):
+        response = self.client_for(self.cashier).get(
+            '/api/transactions/', {'from_date': self.day.isoformat(), 'to_date': self.day.isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_bad_dates(self):
+        response = self.client_for(self.cashier).get(
+            '/api/transactions/', {'from_date': 'yesterday', 'to_date': 'today'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTests(RestaurantTestCase):
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=120)
+        self.paid = [self.order(status='completed', age=self.old - timedelta(hours=hour)) for hour in range(3)]
+        self.cancelled = self.order(status='cancelled', age=self.old)
+        self.open = self.order(status='pending', age=self.old)
+        self.recent = self.order(status='completed', age=timezone.now())
+
+    def order(self, status, age):
+        order = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=1, lines=[(self.menu[0], 2, ''), (self.menu[1], 1, '')]
+        )
+        if status == 'completed':
+            payment, _ = Transaction.objects.checkout(order.pk, self.cashier, 'card', {'card_number': '4242'})
+            order.payment_id = payment.pk
+        Order.objects.filter(pk=order.pk).update(status=status, created_at=age, updated_at=age)
+        Transaction.objects.filter(order=order).update(created_at=age)
+        return order
+
+    def rollups(self):
+        return list(SalesRollup.objects.order_by('period', 'dimension', 'bucket', 'key').values())
+
+    def test_moves_finished_orders_with_items_and_payment(self):
+        rollups = self.rollups()
+        moved = archive.archive(archive.cutoff(90))
+
+        self.assertEqual(moved, 4)
+        archived_ids = {order.pk for order in self.paid} | {self.cancelled.pk}
+        self.assertEqual(set(ArchivedOrder.objects.values_list('pk', flat=True)), archived_ids)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 8)
+        self.assertEqual(ArchivedTransaction.objects.count(), 3)
+        self.assertEqual(
+            set(Order.objects.values_list('pk', flat=True)), {self.open.pk, self.recent.pk}
+        )
+        self.assertFalse(OrderItem.objects.filter(order_id__in=archived_ids).exists())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        archived = ArchivedOrder.objects.get(pk=self.paid[0].pk)
+        self.assertEqual(archived.total, self.paid[0].total)
+        self.assertEqual(archived.created_at, self.old)
+        # Archiving is not a refund, and delta sync clients hear about it
+        self.assertEqual(self.rollups(), rollups)
+        self.assertEqual(
+            sorted(OrderTombstone.objects.values_list('order_id', flat=True)), sorted(archived_ids)
+        )
+
+    def test_resumes_in_batches(self):
+        out = StringIO()
+        call_command(
+            'archive_orders', batch_size=2, max_batches=1, pause=0, older_than_days=90, stdout=out
+        )
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        self.assertIn('2 remaining', out.getvalue())
+
+        call_command('archive_orders', pause=0, stdout=out)
+        self.assertEqual(ArchivedOrder.objects.count(), 4)
+        self.assertEqual(archive.eligible(archive.cutoff()).count(), 0)
+
+    def test_history_reads_both_tiers(self):
+        archive.archive(archive.cutoff(90))
+        client = self.client_for(self.cashier)
+
+        response = client.get('/api/transactions/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        ids = [row['id'] for row in response.data['results']]
+        response = client.get(response.data['next'])
+        ids += [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['next'])
+
+        expected = [order.payment_id for order in [self.recent, *self.paid]]
+        self.assertEqual(ids, expected)
+        self.assertEqual(response.data['results'][-1]['table_number'], 1)
+
+        response = client.get(f'/api/transactions/{self.paid[0].payment_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order'], self.paid[0].pk)
+
+        day = timezone.localdate(self.old).isoformat()
+        response = client.get('/api/transactions/', {'from_date': day, 'to_date': day})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_rebuild_reads_archived_payments(self):
+        def rebuilt():
+            SalesRollup.objects.all().delete()
+            call_command('rebuild_sales_rollups', stdout=StringIO())
+            return [{**row, 'id': None} for row in self.rollups()]
+
+        before = rebuilt()
+        archive.archive(archive.cutoff(90))
+        self.assertEqual(rebuilt(), before)
+
+
+class EagerLoadingTests(RestaurantTestCase):
+    def setUp(self):
+        for number in range(12):
+            order = Order.objects.create_with_items(
+                waiter=self.waiter, table_number=number,
+                lines=[(self.menu[0], 1, ''), (self.menu[1], 2, '')],
+            )
+            Transaction.objects.create(
+                order=order, cashier=self.cashier, payment_method='cash', amount=order.total
+            )
+            User.objects.create_user(username=f'staff{number}', password='pass', role='waiter')
+
+    def test_paths_follow_serializer_sources(self):
+        self.assertEqual(eager_paths(OrderSerializer), (('waiter',), ('items__menu_item',)))
+        self.assertEqual(eager_paths(TransactionSerializer), (('cashier', 'order'), ()))
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        for user, url, params in [
+            (self.cashier, '/api/orders/', {}),
+            (self.cashier, '/api/orders/', {'lean': 'true'}),
+            (self.cashier, '/api/transactions/', {}),
+            (self.manager, '/api/users/', {}),
+        ]:
+            counts = []
+            for page_size in (2, 10):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client_for(user).get(url, {**params, 'page_size': page_size})
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], f'{url} {params}')
+
+
+class CheckoutTests(RestaurantTestCase):
+    def setUp(self):
+        self.order = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=3, lines=[(self.menu[0], 2, '')]
+        )
+
+    def pay(self, key=None, order=None, **data):
+        body = {
+            'order_id': (order or self.order).pk, 'payment_method': 'cash',
+            'amount': '0', 'amount_received': '100', **data,
+        }
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client_for(self.cashier).post('/api/transactions/', body, format='json', **headers)
+
+    def test_pays_pending_order(self):
+        response = self.pay()
+        self.assertEqual(response.status_code, 201)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'completed')
+        self.assertEqual(Decimal(response.data['amount']), self.order.total)
+        self.assertEqual(Decimal(response.data['change_given']), 100 - self.order.total)
+
+    def test_rejects_short_cash(self):
+        response = self.pay(amount_received='1')
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_second_payment_conflicts(self):
+        self.assertEqual(self.pay().status_code, 201)
+        response = self.pay()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        cancelled = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=4, lines=[(self.menu[0], 1, '')]
+        )
+        Order.objects.filter(pk=cancelled.pk).update(status='cancelled')
+        self.assertEqual(self.pay(order=cancelled).status_code, 409)
+        self.assertEqual(self.pay(order=Order(pk=999999)).status_code, 404)
+
+    def test_retry_replays_stored_payment(self):
+        first = self.pay(key='tablet-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.pay(key='tablet-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertFalse(any(q['sql'].startswith(('UPDATE', 'INSERT')) for q in queries))
+        self.assertEqual(SalesRollup.objects.get(period='day', dimension='total').orders, 1)
+
+        other = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=4, lines=[(self.menu[0], 1, '')]
+        )
+        self.assertEqual(self.pay(key='tablet-1', order=other).status_code, 409)
+
+    def test_malformed_key_is_rejected(self):
+        for key in ['x' * 101, '   ', 'tablet\x07']:
+            response = self.client_for(self.cashier).post('/api/transactions/', {
+                'order_id': self.order.pk, 'payment_method': 'cash', 'amount': '0', 'amount_received': '100',
+            }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+            self.assertEqual(response.status_code, 400, key)
+            self.assertIn('idempotency_key', response.data)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.pay(key='x' * 100).status_code, 201)
+
+    def test_lost_race_is_a_conflict(self):
+        # Another checkout inserted its payment but has not completed the order yet
+        Transaction.objects.bulk_create([Transaction(
+            order=self.order, cashier=self.cashier, payment_method='card', amount=self.order.total
+        )])
+        response = self.pay()
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STALENESS=7)
+class ReplicaRoutingTests(TransactionTestCase):
+    # The replica alias mirrors the test database over its own connection,
+    # which would not see rows inside TestCase's per-test transaction
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.waiter = User.objects.create_user('waiter', password='pass', role='waiter')
+        self.menu = [MenuItem.objects.create(name='Dish', price=Decimal('9.95'), category='main-courses')]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def queries_on(self, client, method, url, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(client, method)(url, *args, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return response, len(primary), len(replica)
+
+    def test_safe_reads_use_replica(self):
+        _, primary, replica = self.queries_on(self.client_for(self.waiter), 'get', '/api/menu/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_pins_request_and_client_to_primary(self):
+        client = self.client_for(self.waiter)
+        response, _, replica = self.queries_on(client, 'post', '/api/orders/', {
+            'table_number': 4, 'items': [{'menu_item_id': self.menu[0].pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(replica, 0)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 7)
+
+        # The next poll reads the new order back from the primary
+        _, primary, replica = self.queries_on(client, 'get', '/api/orders/', {'status': 'pending'})
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # Once the pin expires, reads go back to the replica
+        del client.cookies[routers.PIN_COOKIE]
+        _, primary, replica = self.queries_on(client, 'get', '/api/orders/', {'status': 'pending'})
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_reads_without_replicas_use_default(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            _, primary, replica = self.queries_on(self.client_for(self.waiter), 'get', '/api/menu/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+# One process here; cached sessions need a shared cache in production
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class CachedAuthenticationTests(RestaurantTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_sessions_need_a_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_session_cache(None)], ['restaurant.E001'])
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            self.assertEqual(checks.check_session_cache(None), [])
+
+    def logged_in(self, user):
+        client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/auth/login/', {'username': user.username, 'password': 'pass'})
+        self.assertEqual(response.status_code, 200)
+        return client
+
+    def test_polls_do_not_read_session_or_user(self):
+        client = self.logged_in(self.waiter)
+        client.get('/api/auth/me/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/orders/', {'status': 'pending'})
+        self.assertEqual(response.status_code, 200)
+        sources = [query['sql'].partition(' FROM ')[2].split()[0] for query in queries]
+        self.assertNotIn('"django_session"', sources)
+        self.assertNotIn('"restaurant_user"', sources)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/auth/me/').data['role'], 'waiter')
+
+    def test_logout_revokes_session(self):
+        client = self.logged_in(self.waiter)
+        client.post('/api/auth/logout/')
+        self.assertEqual(client.get('/api/orders/').status_code, 403)
+
+    def test_role_change_revokes_sessions(self):
+        client = self.logged_in(self.waiter)
+        self.assertEqual(client.get('/api/auth/me/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.manager).patch(
+                f'/api/users/{self.waiter.pk}/', {'role': 'cashier'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/api/auth/me/').status_code, 403)
+
+        # Signing in again picks up the new role
+        self.assertEqual(self.logged_in(self.waiter).get('/api/auth/me/').data['role'], 'cashier')
+
+    def test_deactivation_takes_effect(self):
+        client = self.logged_in(self.cashier)
+        client.get('/api/auth/me/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.cashier.pk).update(is_active=False)
+            self.cashier.refresh_from_db()
+            self.cashier.save()
+        self.assertEqual(client.get('/api/transactions/').status_code, 403)
+
+
+@override_settings(TASKS_SYNC=False)
+class TaskQueueTests(RestaurantTestCase):
+    calls = []
+
+    def setUp(self):
+        TaskQueueTests.calls = []
+        self.order = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=3, lines=[(self.menu[0], 2, '')]
+        )
+
+    def test_checkout_only_enqueues_rollup(self):
+        response = self.client_for(self.cashier).post('/api/transactions/', {
+            'order_id': self.order.pk, 'payment_method': 'cash', 'amount': '0', 'amount_received': '100',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(SalesRollup.objects.exists())
+        queued = Task.objects.order_by('pk')
+        self.assertEqual(
+            [(task.name, task.args) for task in queued],
+            [('restaurant.reporting.record_payment', [response.data['id']])],
+        )
+
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(SalesRollup.objects.get(period='day', dimension='total').revenue, self.order.total)
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'done'})
+
+    def test_deleting_unrolled_payment_cancels_rollup(self):
+        payment, _ = Transaction.objects.checkout(self.order.pk, self.cashier, 'card', {'card_number': '4242'})
+        payment.delete()
+        self.assertFalse(Task.objects.filter(name=reporting.record_payment.task_options.name).exists())
+        self.assertFalse(SalesRollup.objects.exists())
+
+    def test_deleting_payment_while_its_rollup_runs(self):
+        payment, _ = Transaction.objects.checkout(self.order.pk, self.cashier, 'card', {'card_number': '4242'})
+        claimed = tasks.claim({}, 1)
+        payment.delete()
+        self.assertTrue(tasks.execute(claimed[0]))
+        self.assertFalse(SalesRollup.objects.exists())
+
+        # Once rolled up, a deleted payment is taken out again
+        order = Order.objects.create_with_items(waiter=self.waiter, table_number=4, lines=[(self.menu[1], 1, '')])
+        payment, _ = Transaction.objects.checkout(order.pk, self.cashier, 'cash', {'amount_received': Decimal('100.00')})
+        tasks.run_pending()
+        payment.delete()
+        self.assertEqual(
+            set(SalesRollup.objects.values_list('orders', 'revenue')), {(0, Decimal('0'))}
+        )
+
+    def test_rebuild_counts_payments_with_pending_rollups_once(self):
+        orders = [self.order] + [
+            Order.objects.create_with_items(waiter=self.waiter, table_number=table, lines=[(self.menu[1], 1, '')])
+            for table in (4, 5)
+        ]
+        for order in orders:
+            Transaction.objects.checkout(order.pk, self.cashier, 'card', {'card_number': '4242'})
+        # One rolled up, one claimed by a worker, one still queued
+        tasks.run_pending(limit=1)
+        claimed = tasks.claim({}, 1)
+
+        reporting.rebuild(timezone.localdate(), timezone.localdate())
+        self.assertTrue(tasks.execute(claimed[0]))
+        tasks.run_pending()
+
+        total = SalesRollup.objects.get(period='day', dimension='total')
+        self.assertEqual(total.orders, 3)
+        self.assertEqual(total.revenue, sum(order.total for order in Order.objects.filter(pk__in=[o.pk for o in orders])))
+
+    def test_retries_with_backoff_then_fails(self):
+        note_call.enqueue('boom')
+        with self.assertLogs('restaurant.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), ('queued', 1))
+        self.assertIn('ValueError: boom', task.last_error)
+        self.assertGreater(task.run_after, timezone.now())
+
+        # Not due yet
+        self.assertEqual(tasks.run_pending(), 0)
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('restaurant.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('failed', 2))
+
+    def test_claims_respect_concurrency(self):
+        for value in 'abc':
+            note_call.enqueue(value)
+        self.assertEqual(len(tasks.claim({}, 10)), 1)
+        self.assertEqual(tasks.claim({note_call.task_options.name: 0}, 10), [])
+
+        with self.settings(TASK_CONCURRENCY={'restaurant.tests.note_call': 5}):
+            self.assertEqual(len(tasks.claim({}, 10)), 2)
+        self.assertEqual(Task.objects.filter(status='running').count(), 3)
+
+    def test_only_registered_functions_run(self):
+        Task.objects.create(name='shutil.rmtree', args=['/'])
+        self.assertEqual(tasks.run_pending(), 0)
+        task = Task.objects.get()
+        self.assertEqual(task.status, 'failed')
+        self.assertIn('not a registered task', task.last_error)
+
+    def test_stale_running_tasks_are_requeued(self):
+        note_call.enqueue('a')
+        tasks.claim({}, 1)
+        Task.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale(), 1)
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(self.calls, ['a'])
+
+        # A task that took its worker down on the last attempt is failed
+        Task.objects.update(started_at=timezone.now() - timedelta(hours=1), status='running')
+        self.assertEqual(tasks.requeue_stale(), 0)
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+
+class ReceiptTests(RestaurantTestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=6,
+            lines=[(self.menu[0], 2, 'no onions, extra sauce on the side please'), (self.menu[1], 1, '')],
+        )
+        self.payment, _ = Transaction.objects.checkout(
+            self.order.pk, self.cashier, 'cash', {'amount_received': Decimal('100.00')}
+        )
+
+    def receipt(self, pk=None, **params):
+        return self.client_for(self.cashier).get(
+            f'/api/transactions/{pk or self.payment.pk}/receipt/', params
+        )
+
+    def test_thermal_receipt_is_rendered_once_and_immutable(self):
+        response = self.receipt()
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.receipt().content, response.content)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        lines = response.content.decode().splitlines()
+        self.assertTrue(all(len(line) <= 42 for line in lines))
+        self.assertIn(f'Order #{self.order.pk}', lines[2])
+        self.assertRegex(response.content.decode(), rf'TOTAL +{self.order.total}\n')
+        self.assertRegex(response.content.decode(), r'Change +\d+\.\d\d\n')
+        self.assertIn('extra sauce', response.content.decode())
+
+        again = self.client_for(self.cashier).get(
+            f'/api/transactions/{self.payment.pk}/receipt/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_html_receipt_of_archived_payment(self):
+        old = timezone.now() - timedelta(days=200)
+        Order.objects.filter(pk=self.order.pk).update(created_at=old)
+        archive.archive(archive.cutoff(90))
+        cache.clear()
+
+        response = self.receipt(kind='html')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'Receipt #{self.payment.pk}')
+        self.assertContains(response, 'Dish 0')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.receipt(kind='html').content, response.content)
+
+    def test_unknown_payment_and_kind(self):
+        self.assertEqual(self.receipt(pk=999999).status_code, 404)
+        self.assertEqual(self.receipt(kind='docx').status_code, 400)
+        if not receipts.available('pdf'):
+            self.assertEqual(self.receipt(kind='pdf').status_code, 406)
+
+    def test_end_of_day_batch(self):
+        other = Order.objects.create_with_items(
+            waiter=self.waiter, table_number=2, lines=[(self.menu[2], 1, '')]
+        )
+        Transaction.objects.checkout(other.pk, self.cashier, 'card', {'card_number': '4242 4242'})
+        today = timezone.localdate().isoformat()
+
+        response = self.client_for(self.manager).get(
+            '/api/transactions/receipts/', {'from_date': today, 'to_date': today}
+        )
+        self.assertEqual(response.status_code, 200)
+        printed = response.content.decode().split('\f')
+        self.assertEqual(len(printed), 2)
+        self.assertIn('Card **** 4242', printed[1])
+        self.assertEqual(self.client_for(self.manager).get('/api/transactions/receipts/').status_code, 400)
+
+
+class ExportTests(RestaurantTestCase):
+    def setUp(self):
+        self.paid = []
+        for table, lines in enumerate([[self.menu[0], self.menu[1]], [self.menu[2]], [self.menu[3], self.menu[4]]]):
+            order = Order.objects.create_with_items(
+                waiter=self.waiter, table_number=table + 1, lines=[(item, 1, '') for item in lines]
+            )
+            payment, _ = Transaction.objects.checkout(order.pk, self.cashier, 'card', {'card_number': '4242'})
+            self.paid.append(payment)
+        # Two payments in the same instant, and one old enough to archive
+        now = timezone.now()
+        Transaction.objects.filter(pk__in=[self.paid[1].pk, self.paid[2].pk]).update(created_at=now)
+        self.old = now - timedelta(days=200)
+        Order.objects.filter(pk=self.paid[0].order_id).update(created_at=self.old)
+        Transaction.objects.filter(pk=self.paid[0].pk).update(created_at=self.old)
+        archive.archive(archive.cutoff(90))
+
+    def export(self, user=None, **params):
+        return self.client_for(user or self.manager).get('/api/transactions/export/', params)
+
+    def test_streams_every_line_in_time_order(self):
+        response = self.export(
+            from_date=timezone.localdate(self.old).isoformat(), to_date=timezone.localdate().isoformat()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+        table = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            [(int(row['transaction_id']), row['menu_item'], row['archived']) for row in table],
+            [
+                (self.paid[0].pk, 'Dish 0', 'True'), (self.paid[0].pk, 'Dish 1', 'True'),
+                (self.paid[1].pk, 'Dish 2', 'False'),
+                (self.paid[2].pk, 'Dish 3', 'False'), (self.paid[2].pk, 'Dish 4', 'False'),
+            ],
+        )
+        self.assertEqual(table[2]['cashier'], 'cashier')
+        self.assertEqual(Decimal(table[2]['order_total']), Order.objects.get(pk=self.paid[1].order_id).total)
+
+    def test_requires_manager_and_range(self):
+        today = timezone.localdate().isoformat()
+        self.assertEqual(self.export(user=self.cashier, from_date=today, to_date=today).status_code, 403)
+        self.assertEqual(self.export(from_date=today).status_code, 400)
+
+    def test_small_chunks_give_the_same_rows(self):
+        start, end = timezone.localdate(self.old), timezone.localdate()
+        self.assertEqual(list(exports.rows(start, end, batch_size=1)), list(exports.rows(start, end)))
+
+    def test_command_exports_month(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_transactions', '--month', timezone.localdate().strftime('%Y-%m'), stdout=out, stderr=err)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], ','.join(exports.COLUMNS))
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Exported 3 row(s)', err.getvalue())
+
+    @skipUnless(exports.pyarrow, 'pyarrow is not installed')
+    def test_command_writes_parquet(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'history.parquet')
+        call_command(
+            'export_transactions', '--year', str(timezone.localdate().year), '--format', 'parquet', '-o', path,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        table = exports.pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column_names, exports.COLUMNS)
+        self.assertEqual(table.num_rows, 3)
+
+
+class MenuImportTests(RestaurantTestCase):
+    def post(self, data, **params):
+        url = '/api/menu/import/'
+        if params:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client_for(self.manager).post(url, data, format='json')
+
+    def test_upserts_in_one_batch(self):
+        version = catalogue.current_version()
+        etag = self.client.get('/api/menu/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.post({'items': [
+                {'id': self.menu[0].pk, 'price': '12.50'},
+                {'name': 'Dish 1', 'available': False},
+                {'id': self.menu[2].pk, 'price': str(self.menu[2].price)},
+                {'name': 'Halo-halo', 'price': '95', 'category': 'dessert', 'description': 'Cold'},
+            ]})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {
+            'created': 1, 'updated': 2, 'unchanged': 1, 'deactivated': 0, 'dry_run': False,
+        })
+        # Two lookups, one insert, one update, whatever the number of rows
+        self.assertLess(len(queries), 12)
+
+        self.assertEqual(MenuItem.objects.get(pk=self.menu[0].pk).price, Decimal('12.50'))
+        self.assertFalse(MenuItem.objects.get(pk=self.menu[1].pk).available)
+        self.assertEqual(MenuItem.objects.get(name='Halo-halo').category, 'dessert')
+        self.assertNotEqual(catalogue.current_version(), version)
+        self.assertNotEqual(self.client.get('/api/menu/')['ETag'], etag)
+
+    def test_csv_upload(self):
+        upload = SimpleUploadedFile('menu.csv', (
+            'id,name,price,category,available\n'
+            f'{self.menu[3].pk},,20.00,,\n'
+            ',Sisig,180.00,main-courses,true\n'
+        ).encode(), content_type='text/csv')
+        response = self.client_for(self.manager).post('/api/menu/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        item = MenuItem.objects.get(pk=self.menu[3].pk)
+        self.assertEqual((item.name, item.price), ('Dish 3', Decimal('20.00')))
+        self.assertTrue(MenuItem.objects.filter(name='Sisig', available=True).exists())
+
+    def test_invalid_row_rejects_everything(self):
+        version = catalogue.current_version()
+        response = self.post([
+            {'id': self.menu[0].pk, 'price': '1.00'},
+            {'name': 'New dish'},
+            {'id': 999999, 'price': '2.00'},
+            {'id': self.menu[4].pk, 'price': '-3'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 4])
+        self.assertIn('category', response.data['errors'][0]['errors'])
+        self.assertEqual(MenuItem.objects.get(pk=self.menu[0].pk).price, self.menu[0].price)
+        self.assertFalse(MenuItem.objects.filter(name='New dish').exists())
+        self.assertEqual(catalogue.current_version(), version)
+
+    def test_rows_reaching_the_same_item_are_rejected(self):
+        response = self.post([
+            {'id': self.menu[5].pk, 'price': '1.00'},
+            {'name': 'Dish 5', 'price': '2.00'},
+            {'price': '3.00'},
+            {'category': 'soup'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertIn('non_field_errors', errors[1])
+        self.assertIn('non_field_errors', errors[2])
+        # Nameless rows lack a name, and are not duplicates of each other
+        self.assertEqual(set(errors[3]), {'name', 'category'})
+        self.assertEqual(set(errors[4]), {'name', 'price'})
+
+    def test_validate_matches_rows_in_two_queries(self):
+        with self.assertNumQueries(2):
+            matched = menu_import.validate([
+                {'id': self.menu[0].pk, 'price': '5'},
+                {'name': 'Dish 1'},
+                {'name': 'Pancit', 'price': '70', 'category': 'main-courses'},
+            ])
+        self.assertEqual([item for item, _ in matched], [self.menu[0], self.menu[1], None])
+        self.assertEqual(matched[0][1], {'price': Decimal('5')})
+
+        with self.assertRaises(menu_import.ImportRejected) as rejected:
+            menu_import.import_rows([{'id': 999999}])
+        self.assertEqual(rejected.exception.errors[0]['row'], 1)
+
+    def test_replace_and_dry_run(self):
+        rows = [{'id': item.pk} for item in self.menu[:5]]
+        preview = self.post(rows, replace='true', dry_run='true')
+        self.assertEqual(preview.data['deactivated'], 15)
+        self.assertEqual(MenuItem.objects.filter(available=True).count(), 20)
+
+        response = self.post(rows, replace='true')
+        self.assertEqual(response.data['deactivated'], 15)
+        self.assertEqual(set(MenuItem.objects.filter(available=True)), set(self.menu[:5]))
+
+    def test_requires_manager(self):
+        response = self.client_for(self.cashier).post('/api/menu/import/', [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'menu.json')
+        with open(path, 'w') as menu:
+            json.dump([{'name': 'Dish 5', 'price': '30'}, {'name': 'Lumpia', 'price': '60', 'category': 'entrées'}], menu)
+
+        out = StringIO()
+        call_command('import_menu', path, stdout=out)
+        self.assertIn('created 1, updated 1', out.getvalue())
+        self.assertEqual(MenuItem.objects.get(pk=self.menu[5].pk).price, Decimal('30'))
+
+        with open(path, 'w') as menu:
+            json.dump([{'name': 'Unknown'}], menu)
+        with self.assertRaises(CommandError):
+            call_command('import_menu', path, stdout=StringIO(), stderr=StringIO())
+
+
+class KitchenBoardTests(RestaurantTestCase):
+    def setUp(self):
+        board.get_board().reset()
+        self.addCleanup(board.get_board().reset)
+        self.dessert = MenuItem.objects.create(name='Flan', price=Decimal('4.50'), category='dessert')
+
+    def open_order(self, table_number, lines, waiter=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create_with_items(waiter or self.waiter, table_number, lines)
+
+    def test_groups_open_orders(self):
+        first = self.open_order(3, [(self.menu[0], 2, ''), (self.dessert, 1, 'no sugar')])
+        second = self.open_order(5, [(self.menu[1], 1, '')], waiter=self.manager)
+        paid = self.open_order(3, [(self.menu[2], 1, '')])
+        Order.objects.filter(pk=paid.pk).update(status='completed')
+
+        response = self.client_for(self.cashier).get('/api/board/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data['orders']], [first.pk, second.pk])
+        self.assertEqual(response.data['tables'], {3: [first.pk], 5: [second.pk]})
+        self.assertEqual(response.data['waiters'], {self.waiter.pk: [first.pk], self.manager.pk: [second.pk]})
+        self.assertEqual(response.data['categories'], {'main-courses': 3, 'dessert': 1})
+
+        station = self.client_for(self.cashier).get('/api/board/', {'category': 'dessert'}).data
+        self.assertEqual([order['id'] for order in station['orders']], [first.pk])
+        self.assertEqual(station['orders'][0]['items'][0]['special_instructions'], 'no sugar')
+        self.assertEqual(len(station['orders'][0]['items']), 1)
+
+        own = self.client_for(self.waiter).get('/api/board/', {'waiter': self.manager.pk}).data
+        self.assertEqual([order['id'] for order in own['orders']], [first.pk])
+
+    def test_staff_only(self):
+        customer = User.objects.create_user('guest', password='pass', role='customer')
+        self.assertEqual(self.client_for(customer).get('/api/board/').status_code, 403)
+
+    def test_write_paths_keep_board_current(self):
+        live = board.get_board()
+        order = self.open_order(2, [(self.menu[0], 1, '')])
+        live.read()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=order, menu_item=self.dessert, quantity=2, price_at_time=Decimal('4.50'))
+            added = self.open_order(6, [(self.menu[1], 1, '')])
+        with self.assertNumQueries(0):
+            entries = live.read(table_number=2)
+        self.assertEqual([item['quantity'] for item in entries[0]['items']], [1, 2])
+        self.assertEqual([entry['id'] for entry in live.read(table_number=6)], [added.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.checkout(order.pk, self.cashier, 'cash', {
+                'amount_received': Decimal('100.00'),
+            })
+        self.assertEqual([entry['id'] for entry in live.read()], [added.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added.delete()
+        self.assertEqual(live.read(), [])
+
+    def test_reconcile_repairs_missed_writes(self):
+        live = board.get_board()
+        order = self.open_order(4, [(self.menu[0], 1, '')])
+        live.read()
+
+        # Bulk updates skip the signals the board listens to
+        Order.objects.filter(pk=order.pk).update(status='cancelled')
+        self.assertEqual(len(live.read()), 1)
+        with override_settings(KITCHEN_BOARD_RECONCILE_SECONDS=0):
+            self.assertEqual(live.read(), [])
+        self.assertEqual(live.reconcile(), 0)
+
+
+class ConnectionSettingsTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_pragmas_applied_to_connections(self):
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for name in ('busy_timeout', 'synchronous', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(pragmas, {
+            'busy_timeout': 5000, 'synchronous': 1, 'cache_size': -65536, 'temp_store': 2,
+        })
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class EndpointBudgetTests(TestCase):
+    """Fails when a change adds queries to an endpoint or slows it past its budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = budgets.seed_data()
+
+    def test_every_route_has_a_scenario(self):
+        routes = {
+            name for name in get_resolver('restaurant.urls').reverse_dict
+            if isinstance(name, str)
+        }
+        self.assertEqual(routes - {endpoint.route for endpoint in budgets.ENDPOINTS}, set())
+
+    def test_endpoints_within_budget(self):
+        failures = budgets.check(budgets.run(self.data), budgets.load_baseline())
+        self.assertFalse(
+            failures,
+            "Endpoint budgets exceeded (run `manage.py bench_endpoints` for the full table, "
+            "and `--write-baseline` if the change is intended):\n  " + "\n  ".join(failures),
+        )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadHarnessTests(LiveServerTestCase):
+    def test_seed_and_replay_dinner_rush(self):
+        call_command('seed_data', orders=60, waiters=2, cashiers=1, stdout=StringIO())
+        self.assertEqual(User.objects.filter(role='waiter').count(), 2)
+        self.assertEqual(Order.objects.filter(status='pending').count(), 40)
+        self.assertTrue(all(
+            10 <= timezone.localtime(moment).hour < 22
+            for moment in Order.objects.values_list('created_at', flat=True)
+        ))
+
+        # One virtual user at a time: the test database serializes writers
+        traffic = {
+            'waiter': {'menu-list', 'order-create', 'order-list-waiter'},
+            'cashier': {'order-changes', 'transaction-create', 'transaction-list'},
+            'manager': {'sales-report', 'transaction-list-range', 'order-list', 'user-list'},
+        }
+        for role, names in traffic.items():
+            counts = dict.fromkeys(['waiters', 'cashiers', 'managers'], 0)
+            counts[f'{role}s'] = 1
+            stats, elapsed = loadtest.run_load(
+                self.live_server_url, duration=1, think_time=0.02, **counts
+            )
+            report = {row[0]: row for row in stats.report(elapsed)}
+            self.assertEqual(report['auth-login'][1:3], (1, 0))
+            self.assertTrue(names & set(report), role)
+            self.assertFalse(any(row[2] for row in report.values()), report)
+
+    def test_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(loadtest.percentile(values, 50), 0.05)
+        self.assertEqual(loadtest.percentile(values, 99), 0.099)
@@ -13,4 +13,6 @@ urlpatterns = [
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
     path('auth/me/', views.current_user, name='current-user'),
+    path('board/', views.kitchen_board, name='kitchen-board'),
+    path('reports/sales/', views.sales_report, name='sales-report'),
 ]
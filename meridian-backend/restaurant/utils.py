@@ -0,0 +1,15 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def local_day_bounds(start, end):
+    """
+    Half-open [start_at, end_at) datetimes covering local dates start..end.
+
+    Filtering a timestamp column on these bounds keeps it usable by an index,
+    unlike `__date` lookups which wrap the column in a function.
+    """
+    start_at = timezone.make_aware(datetime.combine(start, time.min))
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return start_at, end_at
@@ -1,16 +1,34 @@
+from datetime import date
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotAcceptable, ValidationError
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Q
-from .models import User, MenuItem, Order, OrderItem, Transaction
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import (
+    User, MenuItem, Order, OrderTombstone, Transaction, ArchivedTransaction,
+    OrderNotPayable, PaymentRejected,
+)
 from .serializers import (
-    UserSerializer, MenuItemSerializer, OrderSerializer, 
+    UserSerializer, MenuItemSerializer, OrderSerializer, OrderLeanSerializer,
     CreateOrderSerializer, TransactionSerializer, CreateTransactionSerializer,
-    CreateUserSerializer
+    CreateUserSerializer, SalesReportQuerySerializer, SalesReportRowSerializer,
+    BoardQuerySerializer, DateRangeQuerySerializer, IdempotencyKeySerializer,
 )
-from .permissions import IsManager
+from .eager import EagerLoadingMixin, eager_load
+from .pagination import KeysetPagination
+from .permissions import IsManager, IsStaff
+from .search import get_backend as search_backend
+from .utils import local_day_bounds
+from . import board, catalogue, exports, images, menu_import, receipts, reporting, sync
 
 # Authentication Views
 @api_view(['POST'])
@@ -47,8 +65,100 @@ def current_user(request):
     return Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
+# Reporting Views
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+def sales_report(request):
+    """
+    Sales per day or hour, optionally split by payment method, cashier or
+    menu category, read from the sales rollups.
+    """
+    query = SalesReportQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    
+    rows = reporting.sales_report(
+        params['from_date'], params['to_date'],
+        period=params['group_by'], dimension=params['dimension'],
+    )
+    
+    # Human readable labels for the dimension keys
+    if params['dimension'] == 'cashier':
+        cashiers = User.objects.in_bulk([int(row['key']) for row in rows if row['key']])
+        labels = {
+            str(pk): user.get_full_name() or user.username for pk, user in cashiers.items()
+        }
+    else:
+        labels = dict(
+            Transaction.PAYMENT_METHOD_CHOICES + MenuItem.CATEGORY_CHOICES + [('', 'All')]
+        )
+    for row in rows:
+        row['label'] = labels.get(row['key'], row['key'])
+    
+    # An order with several categories is in several category rows; the
+    # totals count every payment once, from the overall rollup
+    if params['dimension'] == 'total':
+        total_rows = rows
+    else:
+        total_rows = reporting.sales_report(
+            params['from_date'], params['to_date'], period=params['group_by'], dimension='total',
+        )
+    totals = {
+        measure: sum(row[measure] for row in total_rows)
+        for measure in ('orders', 'items_sold', 'subtotal', 'vat', 'service_fee', 'revenue')
+    }
+    totals['average_ticket'] = (
+        round(totals['revenue'] / totals['orders'], 2) if totals['orders'] else 0
+    )
+    
+    return Response({
+        'from_date': params['from_date'],
+        'to_date': params['to_date'],
+        'group_by': params['group_by'],
+        'dimension': params['dimension'],
+        'totals': totals,
+        'rows': SalesReportRowSerializer(rows, many=True).data,
+    })
+
+
+# Kitchen Board
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaff])
+def kitchen_board(request):
+    """
+    Open orders with their items from the in-memory board, grouped by table,
+    waiter and menu category. Narrow it with `table_number`, `waiter` and
+    `category`; waiters only see their own orders.
+    """
+    query = BoardQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    if request.user.role == 'waiter':
+        params['waiter'] = request.user.pk
+    
+    live = board.get_board()
+    orders = live.read(**params)
+    
+    tables, waiters, categories = {}, {}, {}
+    for order in orders:
+        tables.setdefault(order['table_number'], []).append(order['id'])
+        waiters.setdefault(order['waiter'], []).append(order['id'])
+        for item in order['items']:
+            categories[item['category']] = categories.get(item['category'], 0) + item['quantity']
+    
+    response = Response({
+        'orders': orders,
+        'tables': tables,
+        'waiters': waiters,
+        'categories': categories,
+        'reconciled_at': live.reconciled_at,
+    })
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 # Menu ViewSet
-class MenuItemViewSet(viewsets.ModelViewSet):
+class MenuItemViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
 
@@ -78,149 +188,336 @@ class MenuItemViewSet(viewsets.ModelViewSet):
         if available is not None:
             queryset = queryset.filter(available=available.lower() == 'true')
         
-        # Search
+        # Search, ranked by relevance
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
-            )
+            queryset = search_backend().search(queryset, search)
         
         return queryset
     
+    def perform_create(self, serializer):
+        menu_item = serializer.save()
+        if menu_item.image:
+            images.schedule(menu_item.pk)
+    
+    def perform_update(self, serializer):
+        if 'image' not in serializer.validated_data:
+            serializer.save()
+            return
+        # The old variants belong to the old image; new ones follow in the background
+        replaced = images.variant_paths(serializer.instance.image_variants)
+        menu_item = serializer.save(image_variants={})
+        if menu_item.image:
+            images.schedule(menu_item.pk, replaced)
+        else:
+            images.discard_on_commit(replaced)
+    
+    def list(self, request, *args, **kwargs):
+        # Serve the pre-serialized snapshot for this query and catalogue version
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            return JSONRenderer().render(self.get_serializer(queryset, many=True).data)
+        
+        body, etag = catalogue.get_snapshot(request, build)
+        
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, no-cache'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Create and update many menu items at once from an uploaded CSV or
+        JSON `file`, or from a JSON body holding a list of items. With
+        `replace`, available items left out of the import become
+        unavailable; `dry_run` only validates and counts.
+        """
+        def flag(name):
+            value = request.query_params.get(name)
+            if value is None and isinstance(request.data, dict):
+                value = request.data.get(name)
+            return str(value).lower() in ('1', 'true', 'yes')
+        
+        try:
+            upload = request.FILES.get('file')
+            if upload is not None:
+                file_format = menu_import.detect_format(upload.name, upload.content_type)
+                rows = menu_import.parse(upload.read(), file_format)
+            else:
+                rows = menu_import.from_data(request.data)
+            result = menu_import.import_rows(rows, replace=flag('replace'), dry_run=flag('dry_run'))
+        except menu_import.ImportRejected as error:
+            return Response({'errors': error.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
     @action(detail=True, methods=['patch'])
     def toggle_availability(self, request, pk=None):
         menu_item = self.get_object()
         menu_item.available = not menu_item.available
-        menu_item.save()
+        # Leaves image_variants alone, which an image worker may be writing
+        menu_item.save(update_fields=['available', 'updated_at'])
         return Response(MenuItemSerializer(menu_item).data)
 
 
 # Order ViewSet
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
+    
+    def get_visible_queryset(self):
+        """Every order the current user may see, whatever the list filters"""
+        queryset = Order.objects.all()
+        
+        # Filter by waiter
+        if self.request.user.role == 'waiter':
+            queryset = queryset.filter(waiter=self.request.user)
+        
+        return queryset
     
     def get_queryset(self):
-        queryset = Order.objects.prefetch_related('items__menu_item').all()
+        queryset = self.get_visible_queryset()
         
         # Filter by status
         status_filter = self.request.query_params.get('status')
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         
-        # Filter by waiter
-        if self.request.user.role == 'waiter':
-            queryset = queryset.filter(waiter=self.request.user)
-        
         return queryset
     
-    def create(self, request):
-        from decimal import Decimal
-        serializer = CreateOrderSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+    def list(self, request, *args, **kwargs):
+        if 'since' in request.query_params:
+            return self.list_changes(request)
         
-        # Create order with initial zeros
-        order = Order.objects.create(
-            table_number=serializer.validated_data['table_number'],
-            waiter=request.user,
-            notes=serializer.validated_data.get('notes', ''),
-            subtotal=Decimal('0'),
-            vat=Decimal('0'),
-            service_fee=Decimal('0'),
-            total=Decimal('0')
+        # Answer unchanged polls with 304 before serializing anything
+        etag, last_modified = sync.list_version(self.get_visible_queryset(), request)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified.timestamp())
         )
+        if not_modified is not None:
+            return not_modified
+        
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def list_changes(self, request):
+        """
+        Delta sync: return only the orders changed since the `since` cursor.
         
-        # Create order items
-        for item_data in serializer.validated_data['items']:
-            menu_item = MenuItem.objects.get(id=item_data['menu_item_id'])
-            OrderItem.objects.create(
-                order=order,
-                menu_item=menu_item,
-                quantity=item_data['quantity'],
-                price_at_time=menu_item.price,
-                special_instructions=item_data.get('special_instructions', '')
+        An empty or expired cursor starts a reset: the full list, paged with
+        `next` and with `reset` set. Every page of a reset hands back the
+        cursor taken on its first page, which the `next` link carries in
+        `since`. Otherwise `orders` holds the changed orders that match the
+        filters and `removed` the ids of orders that were deleted or no
+        longer match.
+        """
+        token = request.query_params['since']
+        since = sync.read_cursor(token)
+        queryset = self.filter_queryset(self.get_queryset())
+        continuing = since is not None and self.paginator.cursor_query_param in request.query_params
+        
+        if continuing or since is None or sync.cursor_expired(since):
+            cursor = token if continuing else sync.make_cursor(timezone.now())
+            orders, removed, reset = self.paginate_queryset(queryset), [], True
+            next_link = self.paginator.get_next_link()
+            if next_link is not None:
+                next_link = replace_query_param(next_link, 'since', cursor)
+        else:
+            cursor = sync.make_cursor(timezone.now())
+            tombstones = OrderTombstone.objects.all()
+            if request.user.role == 'waiter':
+                tombstones = tombstones.filter(waiter_id=request.user.pk)
+            orders, removed = sync.changes_since(
+                self.get_visible_queryset(), queryset, tombstones, since
             )
+            reset, next_link = False, None
+        
+        return Response({
+            'cursor': cursor,
+            'reset': reset,
+            'next': next_link,
+            'orders': self.get_serializer(orders, many=True).data,
+            'removed': removed,
+        })
+    
+    def get_serializer_class(self):
+        # Dashboards can ask for the lean list representation
+        if self.action == 'list' and self.request.query_params.get('lean', '').lower() == 'true':
+            return OrderLeanSerializer
+        return OrderSerializer
+    
+    def create(self, request):
+        serializer = CreateOrderSerializer(data=request.data)
+        
+        # Menu lookup, order insert and bulk item insert share one transaction
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            order = serializer.save(waiter=request.user)
         
-        # Recalculate totals after all items are added
-        order.calculate_totals()
-        order.refresh_from_db()
+        order = eager_load(Order.objects.all(), OrderSerializer).get(pk=order.pk)
         
         return Response(
             OrderSerializer(order).data,
             status=status.HTTP_201_CREATED
         )
-    
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        # Ensure totals are calculated before returning
-        instance.calculate_totals()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
 
 
 # Transaction ViewSet
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        queryset = Transaction.objects.all()
-        
+        return self.filter_by_date(Transaction.objects.all())
+    
+    def get_archived_queryset(self):
+        return self.filter_by_date(ArchivedTransaction.objects.all())
+    
+    def filter_by_date(self, queryset):
         # Filter by date range
         from_date = self.request.query_params.get('from_date')
         to_date = self.request.query_params.get('to_date')
         
         if from_date and to_date:
-            queryset = queryset.filter(created_at__date__range=[from_date, to_date])
+            try:
+                start_at, end_at = local_day_bounds(
+                    date.fromisoformat(from_date), date.fromisoformat(to_date)
+                )
+            except ValueError:
+                raise ValidationError({'detail': 'Dates must use the YYYY-MM-DD format.'})
+            queryset = queryset.filter(created_at__gte=start_at, created_at__lt=end_at)
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        # History runs on from the hot table into the archive
+        page = self.paginate_queryset([
+            self.filter_queryset(self.get_queryset()),
+            self.filter_queryset(self.get_archived_queryset()),
+        ])
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            payment = self.get_object()
+        except Http404:
+            payment = get_object_or_404(
+                self.filter_queryset(self.get_archived_queryset()), pk=kwargs['pk']
+            )
+        return Response(self.get_serializer(payment).data)
+    
+    def receipt_kind(self):
+        kind = self.request.query_params.get('kind', 'text')
+        if kind not in receipts.KINDS:
+            raise ValidationError({'kind': f"Choose one of {', '.join(receipts.KINDS)}."})
+        if not receipts.available(kind):
+            raise NotAcceptable("PDF receipts need the weasyprint package")
+        return kind
+    
+    @action(detail=True, methods=['get'])
+    def receipt(self, request, pk=None):
+        """
+        The payment's receipt, rendered once and then served from the cache:
+        `?kind=text` for thermal printers (the default), `html` or `pdf`.
+        """
+        kind = self.receipt_kind()
+        rendered = receipts.get(int(pk), kind) if pk.isdigit() else None
+        if rendered is None:
+            raise Http404("No such transaction")
+        body, etag = rendered
+        
+        # A receipt never changes, so browsers keep it for good
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type=receipts.CONTENT_TYPES[kind])
+            if kind == 'pdf':
+                response['Content-Disposition'] = f'inline; filename="receipt-{pk}.pdf"'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def receipts(self, request):
+        """
+        Thermal receipts of every payment in a date range, oldest first, for
+        end-of-day printing. Takes the `from_date` and `to_date` filters.
+        """
+        if not ('from_date' in request.query_params and 'to_date' in request.query_params):
+            raise ValidationError({'detail': 'from_date and to_date are required.'})
+        ids = sorted(
+            pk
+            for queryset in (self.get_queryset(), self.get_archived_queryset())
+            for pk in queryset.values_list('pk', flat=True)
+        )
+        rendered = receipts.get_many(ids, 'text')
+        # Form feed between receipts, which thermal printers treat as a cut
+        body = b'\f'.join(rendered[pk][0] for pk in ids if pk in rendered)
+        response = HttpResponse(body, content_type=receipts.CONTENT_TYPES['text'])
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsManager])
+    def export(self, request):
+        """
+        Every order line paid between `from_date` and `to_date`, with its
+        payment and order, streamed as CSV from the hot and archived tables.
+        """
+        query = DateRangeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end = query.validated_data['from_date'], query.validated_data['to_date']
+        
+        response = StreamingHttpResponse(
+            exports.stream_csv(exports.rows(start, end)), content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="transactions-{start}-{end}.csv"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
+    
     def create(self, request):
         serializer = CreateTransactionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        details = serializer.validated_data
         
-        order = Order.objects.get(id=serializer.validated_data['order_id'])
-        payment_method = serializer.validated_data['payment_method']
-        
-        transaction_data = {
-            'order': order,
-            'cashier': request.user,
-            'payment_method': payment_method,
-            'amount': order.total
-        }
-        
-        # Add method-specific data
-        if payment_method == 'cash':
-            amount_received = serializer.validated_data.get('amount_received')
-            transaction_data['amount_received'] = amount_received
-            transaction_data['change_given'] = amount_received - order.total
-        
-        elif payment_method == 'card':
-            card_number = serializer.validated_data.get('card_number', '')
-            transaction_data['card_last_four'] = card_number.replace(' ', '')[-4:]
-            transaction_data['cardholder_name'] = serializer.validated_data.get('cardholder_name', '')
-        
-        elif payment_method in ['gcash', 'paypal']:
-            transaction_data['account_identifier'] = serializer.validated_data.get('account_identifier', '')
-            transaction_data['account_name'] = serializer.validated_data.get('account_name', '')
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None:
+            header = IdempotencyKeySerializer(data={'idempotency_key': idempotency_key})
+            header.is_valid(raise_exception=True)
+            idempotency_key = header.validated_data['idempotency_key']
         
-        # Create transaction
-        transaction = Transaction.objects.create(**transaction_data)
-        
-        # Update order status
-        order.status = 'completed'
-        order.save()
+        try:
+            payment, created = Transaction.objects.checkout(
+                order_id=details['order_id'],
+                cashier=request.user,
+                payment_method=details['payment_method'],
+                details=details,
+                idempotency_key=idempotency_key,
+            )
+        except Order.DoesNotExist:
+            return Response({'message': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        except PaymentRejected as error:
+            return Response({'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except OrderNotPayable as error:
+            return Response({'message': str(error)}, status=status.HTTP_409_CONFLICT)
         
-        return Response(
-            TransactionSerializer(transaction).data,
-            status=status.HTTP_201_CREATED
-        )
+        response = Response(TransactionSerializer(payment).data, status=status.HTTP_201_CREATED)
+        if not created:
+            response['Idempotent-Replayed'] = 'true'
+        return response
 
 # User ViewSet
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     # Secure this endpoint so only Managers can access it
     permission_classes = [IsAuthenticated, IsManager] 
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date_joined', '-id')
     
     def get_serializer_class(self):
         # Use the special serializer for creating users (POST)
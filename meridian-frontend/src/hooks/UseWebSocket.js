@@ -1,21 +1,42 @@
 import { useEffect, useRef } from "react";
 
-export function useWebSocket(onMessage) {
+const WS_BASE_URL = "ws://10.208.14.243:8000/ws";
+
+// Subscribe to the backend order event stream, e.g. useWebSocket(handler, "status=pending").
+// Reconnects after a dropped connection; the session cookie authenticates the socket.
+export function useWebSocket(onMessage, query = "") {
   const ws = useRef(null);
+  const handler = useRef(onMessage);
+  handler.current = onMessage;
 
   useEffect(() => {
-    ws.current = new WebSocket("ws://192.168.1.42:8080");
+    let retry = null;
+    let closed = false;
+
+    const connect = () => {
+      ws.current = new WebSocket(`${WS_BASE_URL}/orders/${query ? `?${query}` : ""}`);
+
+      ws.current.onmessage = (event) => {
+        handler.current(JSON.parse(event.data));
+      };
 
-    ws.current.onmessage = (event) => {
-      onMessage(JSON.parse(event.data));
+      ws.current.onclose = () => {
+        if (!closed) retry = setTimeout(connect, 3000);
+      };
     };
 
-    return () => ws.current.close();
-  }, [onMessage]);
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      ws.current.close();
+    };
+  }, [query]);
 
   const send = (data) => {
     ws.current?.send(JSON.stringify(data));
   };
 
   return send;
-}
\ No newline at end of file
+}
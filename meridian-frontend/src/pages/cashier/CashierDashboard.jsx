@@ -1,6 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import api from '../../services/axiosClient';
+import { useWebSocket } from '../../hooks/UseWebSocket';
 
 const CashierDashboard = ({ onOrderClick }) => {
   const navigate = useNavigate();
@@ -9,11 +10,33 @@ const CashierDashboard = ({ onOrderClick }) => {
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
 
+  // Delta sync cursor: after the first load only changed orders are sent
+  const cursorRef = useRef('');
+
   // --- 1. Fetch Orders ---
   const fetchOrders = async () => {
     try {
-      const response = await api.get(`/orders/?status=${activeTab}`);
-      setOrders(response.data);
+      let response = await api.get('/orders/', {
+        params: { status: activeTab, lean: true, since: cursorRef.current }
+      });
+      const { cursor, reset, removed } = response.data;
+      const changed = [...response.data.orders];
+      // A reset arrives in pages; each next link carries the same cursor
+      while (response.data.next) {
+        response = await api.get(response.data.next);
+        changed.push(...response.data.orders);
+      }
+      cursorRef.current = cursor;
+
+      setOrders(prev => {
+        const changedIds = new Set(changed.map(order => order.id));
+        const kept = reset ? [] : prev.filter(
+          order => !changedIds.has(order.id) && !removed.includes(order.id)
+        );
+        return [...changed, ...kept].sort(
+          (a, b) => new Date(b.created_at) - new Date(a.created_at)
+        );
+      });
       setLoading(false);
     } catch (error) {
       console.error("Failed to fetch orders:", error);
@@ -22,11 +45,15 @@ const CashierDashboard = ({ onOrderClick }) => {
   };
 
   useEffect(() => {
+    cursorRef.current = '';
     fetchOrders();
-    const interval = setInterval(fetchOrders, 5000); // Poll every 5s
+    // Pushed events trigger a delta fetch; polling is only a fallback
+    const interval = setInterval(fetchOrders, 30000);
     return () => clearInterval(interval);
   }, [activeTab]);
 
+  useWebSocket(() => fetchOrders(), `status=${activeTab}`);
+
   // --- 2. Navigation Handlers ---
   const handleSettings = () => {
     navigate('/settings');
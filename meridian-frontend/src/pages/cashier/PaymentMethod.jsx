@@ -1,9 +1,14 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import api from '../../services/axiosClient';
 
+// One key per checkout attempt, so a retried submit cannot charge the order twice
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
 const PaymentMethod = ({ currentOrder, onBack, onSelectPayment }) => {
   const [selectedMethod, setSelectedMethod] = useState(null);
   const [showForm, setShowForm] = useState(false);
+  const idempotencyKey = useRef(newIdempotencyKey());
   
   // --- ROBUST TOTAL CALCULATION (Added this Fix) ---
   const calculateTotal = () => {
@@ -79,7 +84,9 @@ const PaymentMethod = ({ currentOrder, onBack, onSelectPayment }) => {
     }
 
     try {
-      const response = await api.post('/transactions/', payload);
+      const response = await api.post('/transactions/', payload, {
+        headers: { 'Idempotency-Key': idempotencyKey.current },
+      });
       if (onSelectPayment) {
         onSelectPayment(response.data); 
       }
@@ -1,4 +1,5 @@
 import React from 'react';
+import api from '../../services/axiosClient';
 
 // receiptData should be the response from CreateTransactionSerializer
 const Receipt = ({ receiptData, onBack }) => {
@@ -6,6 +7,7 @@ const Receipt = ({ receiptData, onBack }) => {
 
   // Destructure matching TransactionSerializer fields
   const { 
+    id,
     amount, 
     date, 
     table_number, 
@@ -16,6 +18,11 @@ const Receipt = ({ receiptData, onBack }) => {
     change_given
   } = receiptData;
 
+  // The server renders each receipt once; reprints come from the cache
+  const printReceipt = () => {
+    window.open(api.getUri({ url: `/transactions/${id}/receipt/`, params: { kind: 'html' } }), '_blank');
+  };
+
   return (
     <div className="min-h-screen bg-[#F8F8F8] flex items-center justify-center p-6">
       <style>{`
@@ -88,6 +95,13 @@ const Receipt = ({ receiptData, onBack }) => {
              </div>
           )}
 
+          <button
+            onClick={printReceipt}
+            className="w-full py-3 rounded-2xl border border-[#e2e8f0] text-[#1a1c21] font-semibold hover:bg-gray-50"
+          >
+            Print Receipt
+          </button>
+
           <div className="mt-8 text-center">
              <p className="text-sm text-gray-400">Thank you for dining with Meridian</p>
           </div>
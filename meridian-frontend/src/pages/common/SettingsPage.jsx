@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
-import api from '../../services/axiosClient';
+import api, { getAllPages } from '../../services/axiosClient';
 
 const SettingsPage = ({ onClose }) => {
   const [showLogoutModal, setShowLogoutModal] = useState(false);
@@ -156,8 +156,7 @@ const EmployeeManagementModal = ({ onClose, currentUser }) => {
   const fetchEmployees = async () => {
     setLoading(true);
     try {
-      const response = await api.get('/users/'); 
-      setEmployees(response.data);
+      setEmployees(await getAllPages('/users/', { params: { page_size: 500 } }));
     } catch (error) {
       console.error("Failed to fetch employees", error);
     } finally {
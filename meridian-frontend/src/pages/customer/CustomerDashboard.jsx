@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import api from '../../services/axiosClient';
-import getImageUrl from '../../utils/getImage';
+import getImageUrl, { getImageSrcSet, MENU_GRID_SIZES } from '../../utils/getImage';
 
 const CustomerDashboard = () => {
   const navigate = useNavigate();
@@ -161,6 +161,9 @@ const CustomerDashboard = () => {
                 <div className="w-full h-36 rounded-lg overflow-hidden mb-3">
                     <img 
                       src={getImageUrl(item.image)} 
+                      srcSet={getImageSrcSet(item.image_variants)}
+                      sizes={MENU_GRID_SIZES}
+                      loading="lazy"
                       alt={item.name} 
                       className="w-full h-full object-cover" 
                       // Optional: Add an error handler if the image is truly missing
@@ -9,6 +9,7 @@ const AdminDashboard = () => {
   const bestSellingRef = useRef(null);
   const revenueTrendChartRef = useRef(null);
   const bestSellingChartRef = useRef(null);
+  const importInputRef = useRef(null);
 
   // Modals state
   const [showAddModal, setShowAddModal] = useState(false);
@@ -103,6 +104,32 @@ const AdminDashboard = () => {
     }
   };
 
+  // --- BULK IMPORT ---
+
+  const handleImport = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file) return;
+
+    const data = new FormData();
+    data.append('file', file);
+    try {
+        const response = await api.post('/menu/import/', data, {
+            headers: { 'Content-Type': 'multipart/form-data' }
+        });
+        const { created, updated, unchanged } = response.data;
+        alert(`Menu imported: ${created} added, ${updated} updated, ${unchanged} unchanged.`);
+        if (showAvailabilityModal) fetchMenu();
+    } catch (error) {
+        console.error("Failed to import menu", error);
+        const errors = error.response?.data?.errors || [];
+        const details = errors.slice(0, 5).map(({ row, errors }) =>
+            `${row ? `Row ${row}` : 'File'}: ${Object.values(errors).flat().join(' ')}`
+        );
+        alert(["Import rejected; nothing was changed.", ...details].join('\n'));
+    }
+  };
+
   // --- CHARTS (Static for now) ---
   useEffect(() => {
     const revenueData = {
@@ -214,6 +241,28 @@ const AdminDashboard = () => {
                 </div>
              </button>
              
+             <button 
+                onClick={() => importInputRef.current.click()}
+                className="flex-shrink-0 bg-white p-4 rounded-xl shadow-sm border border-gray-100 flex items-center gap-3 min-w-[160px]"
+             >
+                <div className="bg-green-100 p-2 rounded-lg text-[#3b5a44]">
+                    <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" strokeWidth="1.5" stroke="currentColor" className="w-6 h-6">
+                        <path strokeLinecap="round" strokeLinejoin="round" d="M3 16.5v2.25A2.25 2.25 0 005.25 21h13.5A2.25 2.25 0 0021 18.75V16.5m-13.5-9L12 3m0 0l4.5 4.5M12 3v13.5" />
+                    </svg>
+                </div>
+                <div className="text-left">
+                    <p className="font-bold text-gray-800 text-sm">Import</p>
+                    <p className="text-xs text-gray-500">CSV or JSON</p>
+                </div>
+             </button>
+             <input
+                ref={importInputRef}
+                type="file"
+                accept=".csv,.json,text/csv,application/json"
+                onChange={handleImport}
+                className="hidden"
+             />
+
              {/* You can add more action cards here */}
           </div>
 
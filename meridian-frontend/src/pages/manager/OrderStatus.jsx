@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../../services/axiosClient';
+import { getAllPages } from '../../services/axiosClient';
 
 const OrderStatus = () => {
   const navigate = useNavigate();
@@ -40,9 +40,8 @@ const OrderStatus = () => {
   const fetchOrders = async () => {
     setLoading(true);
     try {
-      const query = activeTab === 'all' ? '/orders/' : `/orders/?status=${activeTab}`;
-      const response = await api.get(query);
-      setOrders(response.data);
+      const query = activeTab === 'all' ? '/orders/?lean=true' : `/orders/?status=${activeTab}&lean=true`;
+      setOrders(await getAllPages(query, { params: { page_size: 500 } }));
     } catch (error) {
       console.error("Failed to fetch orders:", error);
     } finally {
@@ -13,8 +13,12 @@ const TransactionHistory = () => {
   const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(true);
 
+  // Keyset pagination: URLs of the pages visited so far, plus the next one
+  const [pages, setPages] = useState([]);
+  const [nextUrl, setNextUrl] = useState(null);
+
   // --- FETCH TRANSACTIONS ---
-  const fetchTransactions = async () => {
+  const fetchTransactions = async (url = null, history = []) => {
     setLoading(true);
     try {
       let query = '/transactions/';
@@ -23,8 +27,10 @@ const TransactionHistory = () => {
       if (toDate) params.push(`to_date=${toDate}`);
       if (params.length > 0) query += `?${params.join('&')}`;
 
-      const response = await api.get(query);
-      setTransactions(response.data);
+      const response = await api.get(url || query);
+      setTransactions(response.data.results);
+      setNextUrl(response.data.next);
+      setPages([...history, url || query]);
     } catch (error) {
       console.error("Failed to load transactions", error);
       alert('Failed to load transactions. Please try again.');
@@ -33,6 +39,14 @@ const TransactionHistory = () => {
     }
   };
 
+  const goToNextPage = () => {
+    if (nextUrl) fetchTransactions(nextUrl, pages);
+  };
+
+  const goToPreviousPage = () => {
+    if (pages.length > 1) fetchTransactions(pages[pages.length - 2], pages.slice(0, -2));
+  };
+
   useEffect(() => {
     fetchTransactions();
   }, []);
@@ -157,13 +171,21 @@ const TransactionHistory = () => {
           </div>
         </div>
 
-        {/* Pagination (Visual Only) */}
+        {/* Pagination */}
         <div className="flex justify-center items-center gap-4 text-sm mt-6 text-gray-600 font-semibold">
-          <span className="opacity-50 cursor-not-allowed">&laquo;</span>
-          <span className="opacity-50 cursor-not-allowed">&lsaquo;</span>
-          <span className="text-gray-900 border-b-2 border-[#3b5a44] pb-1">Page 1</span>
-          <span className="cursor-pointer hover:text-gray-800">&rsaquo;</span>
-          <span className="cursor-pointer hover:text-gray-800">&raquo;</span>
+          <span
+            onClick={() => pages.length > 1 && fetchTransactions()}
+            className={pages.length > 1 ? 'cursor-pointer hover:text-gray-800' : 'opacity-50 cursor-not-allowed'}
+          >&laquo;</span>
+          <span
+            onClick={goToPreviousPage}
+            className={pages.length > 1 ? 'cursor-pointer hover:text-gray-800' : 'opacity-50 cursor-not-allowed'}
+          >&lsaquo;</span>
+          <span className="text-gray-900 border-b-2 border-[#3b5a44] pb-1">Page {Math.max(pages.length, 1)}</span>
+          <span
+            onClick={goToNextPage}
+            className={nextUrl ? 'cursor-pointer hover:text-gray-800' : 'opacity-50 cursor-not-allowed'}
+          >&rsaquo;</span>
         </div>
       </div>
 
@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import api from '../../services/axiosClient'; // Ensure this points to your axios instance
+import { getImageSrcSet, MENU_GRID_SIZES } from '../../utils/getImage';
 
 const WaiterDashboard = ({ onNavigate }) => {
   const [searchQuery, setSearchQuery] = useState('');
@@ -349,7 +350,14 @@ const WaiterDashboard = ({ onNavigate }) => {
               onClick={() => handleCardClick(item)}
             >
               <div className="w-full h-[150px] rounded-lg mb-3 overflow-hidden">
-                <img src={item.image} alt={item.name} className="w-full h-full object-cover" />
+                <img
+                  src={item.image}
+                  srcSet={getImageSrcSet(item.image_variants)}
+                  sizes={MENU_GRID_SIZES}
+                  loading="lazy"
+                  alt={item.name}
+                  className="w-full h-full object-cover"
+                />
               </div>
               <div>
                 <p className="font-semibold text-base truncate text-gray-800">{item.name}</p>
@@ -53,4 +53,17 @@ function getCookie(name) {
   return cookieValue;
 }
 
+// Fetch every page of a paginated list, following the `next` links
+export async function getAllPages(url, config) {
+  const results = [];
+  let response = await api.get(url, config);
+  results.push(...response.data.results);
+  while (response.data.next) {
+    // `next` is absolute and already carries the query parameters
+    response = await api.get(response.data.next);
+    results.push(...response.data.results);
+  }
+  return results;
+}
+
 export default api;
\ No newline at end of file
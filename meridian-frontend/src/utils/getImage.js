@@ -24,4 +24,17 @@ export const getImageUrl = (imagePath) => {
   return `${BASE_URL}/${cleanPath}`;
 };
 
+// srcSet for the resized copies of a menu image, so the browser fetches the
+// smallest one that fills the slot. Empty until the server has built them.
+export const getImageSrcSet = (variants) => {
+  const byWidth = variants?.webp || variants?.jpeg;
+  if (!byWidth || Object.keys(byWidth).length === 0) return undefined;
+  return Object.entries(byWidth)
+    .map(([width, url]) => `${getImageUrl(url)} ${width}w`)
+    .join(', ');
+};
+
+// Menu grids are two columns on phones and four on wide screens
+export const MENU_GRID_SIZES = '(min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw';
+
 export default getImageUrl;
\ No newline at end of file